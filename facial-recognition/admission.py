@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# Admission Control for the Recognition API
+# =========================================
+
+# Bounds how many identify requests run on the CPU-bound model at once and how
+# many may wait for a slot. Waiting requests are granted slots round-robin
+# across clients so that one chatty client cannot starve the others, each
+# client is capped at its fair share of the queue, and requests whose caller
+# has already given up (deadline passed) are dropped instead of run. When over
+# capacity a request is rejected immediately with a Retry-After estimate.
+
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be queued; maps to HTTP 429."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before it gets a slot; maps to HTTP 504."""
+
+
+class _Ticket:
+    __slots__ = ("client_id", "deadline", "granted", "expired")
+
+    def __init__(self, client_id: str, deadline: Optional[float]):
+        self.client_id = client_id
+        self.deadline = deadline
+        self.granted = False
+        self.expired = False
+
+
+class AdmissionController:
+    def __init__(self,
+                 max_in_flight: int = 2,
+                 max_queue: int = 16,
+                 max_wait_seconds: float = 30.0):
+        """
+        Initialize the admission controller.
+
+        Args:
+            max_in_flight: Requests allowed to run on the model at the same time
+            max_queue: Requests allowed to wait for a slot
+            max_wait_seconds: Longest a request without a deadline may wait
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        # Waiting tickets per client, in round-robin order
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        # Queued plus running requests per client
+        self._per_client: Dict[str, int] = {}
+        self._avg_service_seconds = 1.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely to be free."""
+        backlog = self._queued + self._in_flight
+        return max(1, math.ceil(self._avg_service_seconds * backlog / self.max_in_flight))
+
+    def _grant(self) -> None:
+        """
+        Hand free slots to waiting clients round-robin. Called with the lock held.
+
+        Tickets whose deadline has passed are expired instead of granted, so a
+        slot never goes to a caller that has already given up.
+        """
+        now = time.time()
+        while self._in_flight < self.max_in_flight and self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client_id)
+            else:
+                del self._queues[client_id]
+            self._queued -= 1
+            if ticket.deadline is not None and ticket.deadline <= now:
+                ticket.expired = True
+                self._release_client(client_id)
+                self.expired += 1
+                continue
+            ticket.granted = True
+            self._in_flight += 1
+        self._cond.notify_all()
+
+    def _drop(self, ticket: _Ticket) -> None:
+        """Remove a ticket that gave up waiting. Called with the lock held."""
+        queue = self._queues.get(ticket.client_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.client_id]
+            self._queued -= 1
+        self._release_client(ticket.client_id)
+
+    def _release_client(self, client_id: str) -> None:
+        self._per_client[client_id] -= 1
+        if not self._per_client[client_id]:
+            del self._per_client[client_id]
+
+    def enqueue(self, client_id: str, deadline: Optional[float] = None) -> _Ticket:
+        """
+        Queue a request for a slot without waiting for it.
+
+        Never blocks, so it can be called from an event loop; rejections are
+        decided here.
+
+        Args:
+            client_id: Identifier used for per-client fair sharing
+            deadline: Absolute time.time() after which the caller no longer wants the result
+
+        Returns:
+            Ticket to pass to wait() and then release()
+
+        Raises:
+            AdmissionRejected: If the queue or the client's fair share is full
+            DeadlineExceeded: If the deadline has already passed
+        """
+        with self._cond:
+            if deadline is not None and deadline <= time.time():
+                self.expired += 1
+                raise DeadlineExceeded("Request deadline already passed")
+
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("server over capacity", self._retry_after())
+
+            # Size shares as if one more client were active, so a newcomer
+            # always finds room even when existing clients are at their share
+            clients = len(self._per_client) + (client_id not in self._per_client)
+            fair_share = max(1, (self.max_in_flight + self.max_queue) // (clients + 1))
+            if self._per_client.get(client_id, 0) >= fair_share:
+                self.rejected += 1
+                raise AdmissionRejected("client over fair share", self._retry_after())
+
+            ticket = _Ticket(client_id, deadline)
+            self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+            self._queues.setdefault(client_id, deque()).append(ticket)
+            self._queued += 1
+            self._grant()
+            return ticket
+
+    def wait(self, ticket: _Ticket) -> _Ticket:
+        """
+        Block until a queued ticket is granted a slot.
+
+        Raises:
+            DeadlineExceeded: If the deadline passes before a slot frees up
+        """
+        with self._cond:
+            wait_until = ticket.deadline if ticket.deadline is not None else time.time() + self.max_wait_seconds
+            while not ticket.granted:
+                if ticket.expired:
+                    raise DeadlineExceeded("Request deadline passed while queued")
+                remaining = wait_until - time.time()
+                if remaining <= 0:
+                    self._drop(ticket)
+                    ticket.expired = True
+                    self.expired += 1
+                    raise DeadlineExceeded("Request deadline passed while queued")
+                self._cond.wait(remaining)
+
+            self.admitted += 1
+            return ticket
+
+    def cancel(self, ticket: _Ticket) -> None:
+        """
+        Give up on a ticket whose caller went away.
+
+        Frees the ticket's place in the queue, or its slot if it was already
+        granted, and wakes a thread still blocked in wait() on it.
+        """
+        with self._cond:
+            if ticket.granted:
+                ticket.granted = False
+                self._in_flight -= 1
+                self._release_client(ticket.client_id)
+                self._grant()
+            elif not ticket.expired:
+                self._drop(ticket)
+            ticket.expired = True
+            self._cond.notify_all()
+
+    def acquire(self, client_id: str, deadline: Optional[float] = None) -> _Ticket:
+        """
+        Wait for a slot to run a request.
+
+        Args:
+            client_id: Identifier used for per-client fair sharing
+            deadline: Absolute time.time() after which the caller no longer wants the result
+
+        Returns:
+            Ticket to pass to release()
+
+        Raises:
+            AdmissionRejected: If the queue or the client's fair share is full
+            DeadlineExceeded: If the deadline passes before a slot frees up
+        """
+        return self.wait(self.enqueue(client_id, deadline))
+
+    def release(self, ticket: _Ticket, service_seconds: float) -> None:
+        """Free a slot and hand it to the next waiting client."""
+        with self._cond:
+            self._in_flight -= 1
+            self._release_client(ticket.client_id)
+            # Exponentially weighted average service time for Retry-After estimates
+            self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * service_seconds
+            self._grant()
+
+    @contextmanager
+    def slot(self, client_id: str, deadline: Optional[float] = None):
+        """Context manager running its body while holding a slot."""
+        ticket = self.acquire(client_id, deadline)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(ticket, time.perf_counter() - start)
+
+    def stats(self) -> Dict:
+        """Current load and admission counters."""
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "clients": len(self._per_client),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "avg_service_seconds": self._avg_service_seconds
+            }
+
+
+def parse_deadline(headers) -> Optional[float]:
+    """
+    Read a request deadline from HTTP headers.
+
+    Accepts X-Request-Deadline (absolute Unix time in seconds) or
+    X-Request-Timeout (seconds from now).
+    """
+    try:
+        if headers.get("X-Request-Deadline"):
+            return float(headers["X-Request-Deadline"])
+        if headers.get("X-Request-Timeout"):
+            return time.time() + float(headers["X-Request-Timeout"])
+    except ValueError:
+        pass
+    return None
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# ASGI Server for the Recognition API
+# ===================================
+
+# Serves the same REST API as the Flask app from an asyncio event loop, e.g.
+#
+#   uvicorn asgi_server:application --host 0.0.0.0 --port 50001
+#   python asgi_server.py
+#
+# Connections, request bodies and JSON parsing are handled on the event loop,
+# so idle keep-alive connections and slow uploads cost no threads. Only the
+# CPU-bound work (image decoding and face recognition) is handed to a bounded
+# thread pool, behind the same admission controller the Flask app uses. On
+# shutdown the server stops accepting connections, lets in-flight requests
+# finish and then drains the worker pools.
+#
+# The /api/stream WebSocket serves the camera page: the browser pushes JPEG
+# frames as binary messages and receives JSON recognition events (entered,
+# left, unknown) only when the scene changes. Each connection keeps at most
+# one frame waiting for recognition, so slow clients drop frames rather than
+# queueing them (see identification_stream.py).
+
+import os
+import json
+import asyncio
+import threading
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+import face_recognition
+from face_recognition import (
+    FamilyRecognitionSystem, SHARED_GALLERY_DIR, identify_admission, request_profiler,
+    identify_request, identify_frame, save_profile_image_request, collect_stats, compact_request,
+    start_profile_monitor
+)
+from admission import AdmissionRejected, DeadlineExceeded, parse_deadline
+from face_quality import FaceQualityError
+from identification_stream import IdentificationStream, LatestFrameSlot, CONFIRM_FRAMES
+
+ASGI_HOST = os.getenv("FACE_API_HOST", "0.0.0.0")
+ASGI_PORT = int(os.getenv("FACE_API_PORT", "50001"))
+MAX_BODY_BYTES = 16 * 1024 * 1024  # Largest accepted request body
+MAX_FRAME_BYTES = 4 * 1024 * 1024  # Largest accepted stream frame
+STREAM_CONFIRM_FRAMES = int(os.getenv("STREAM_CONFIRM_FRAMES", str(CONFIRM_FRAMES)))  # Frames confirming a scene change
+KEEP_ALIVE_SECONDS = 15  # How long an idle keep-alive connection stays open
+GRACEFUL_SHUTDOWN_SECONDS = 30  # How long in-flight requests get to finish on shutdown
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+class RequestError(Exception):
+    """Raised while reading a request that should be answered with an error status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RecognitionASGIApp:
+    def __init__(self, max_workers: Optional[int] = None, max_body_bytes: int = MAX_BODY_BYTES):
+        """
+        Initialize the ASGI application.
+
+        Args:
+            max_workers: Threads running recognition (defaults to the admission controller's slots)
+            max_body_bytes: Largest accepted request body
+        """
+        self.max_body_bytes = max_body_bytes
+        self.recognition_pool = ThreadPoolExecutor(
+            max_workers or identify_admission.max_in_flight,
+            thread_name_prefix="recognition"
+        )
+        # Threads that only block on a queued admission ticket; there can never
+        # be more queued tickets than the controller's capacity
+        self.admission_pool = ThreadPoolExecutor(
+            identify_admission.max_in_flight + identify_admission.max_queue,
+            thread_name_prefix="admission"
+        )
+        # Blocking work outside the identify path (profile uploads, compaction, static files)
+        self.io_pool = ThreadPoolExecutor(4, thread_name_prefix="api-io")
+        self.monitor_stop: Optional[threading.Event] = None
+
+        self.routes = {
+            ("POST", "/api/identify"): self.identify,
+            ("POST", "/api/save-profile-image"): self.save_profile_image,
+            ("GET", "/api/stats"): self.stats,
+            ("POST", "/api/compact"): self.compact,
+            ("GET", "/api/debug/profiles"): self.list_profiles,
+        }
+        self.stream_stats = {"connections": 0, "open": 0, "frames": 0, "dropped": 0, "shed": 0, "events": 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+        headers = {
+            key.decode("latin-1").title(): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+
+        if method == "OPTIONS":
+            # CORS preflight, matching flask_cors defaults
+            await self._send(send, 204, b"", extra_headers=[
+                (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+                (b"access-control-allow-headers", headers.get("Access-Control-Request-Headers", "*").encode("latin-1")),
+            ])
+            return
+
+        if path == "/camera":
+            path = "/static/camera.html"
+
+        handler = self.routes.get((method, path))
+        if handler is None and method == "GET" and path.startswith("/api/debug/profiles/"):
+            handler = self.get_profile
+        try:
+            if handler is not None:
+                body, status, extra_headers = await handler(scope, headers, receive)
+                if isinstance(body, str):
+                    await self._send(send, status, body.encode(), b"text/plain; charset=utf-8", extra_headers)
+                else:
+                    await self._send_json(send, body, status, extra_headers)
+            elif method == "GET" and path.startswith("/static/"):
+                await self._send_static(send, path[len("/static/"):])
+            elif any(route_path == path for _, route_path in self.routes):
+                await self._send_json(send, {"error": "Method not allowed"}, 405)
+            else:
+                await self._send_json(send, {"error": "Not found"}, 404)
+        except RequestError as e:
+            await self._send_json(send, {"error": str(e)}, e.status)
+        except Exception as e:
+            face_recognition.logger.error(f"Error processing request: {e}")
+            await self._send_json(send, {"error": str(e)}, 500)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Enroll photos saved through /api/save-profile-image (one process at a time)
+                self.monitor_stop = threading.Event()
+                start_profile_monitor(face_recognition.face_system, self.monitor_stop)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # The server has already drained connections; wait for the pools
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def shutdown(self) -> None:
+        """Wait for queued and running work to finish, then stop the pools, the profile monitor and the archiver."""
+        if self.monitor_stop is not None:
+            self.monitor_stop.set()
+        for pool in (self.admission_pool, self.recognition_pool, self.io_pool):
+            pool.shutdown(wait=True)
+        face_recognition.payload_archiver.close()
+
+    async def _read_json(self, receive) -> Optional[Dict]:
+        """Read the request body on the event loop and parse it as JSON."""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise RequestError(400, "Client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise RequestError(413, "Request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+
+        body = b"".join(chunks)
+        if not body:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise RequestError(400, "Request body is not valid JSON")
+
+    async def _recognize(self, client_id: str, deadline: Optional[float], func, *args):
+        """
+        Run func in the recognition pool once the admission controller grants a slot.
+
+        Raises:
+            AdmissionRejected: If the controller is over capacity
+            DeadlineExceeded: If the deadline passed while queued
+        """
+        ticket = identify_admission.enqueue(client_id, deadline)
+        loop = asyncio.get_running_loop()
+        if not ticket.granted:
+            try:
+                await loop.run_in_executor(self.admission_pool, identify_admission.wait, ticket)
+            except asyncio.CancelledError:
+                # The waiting thread outlives us; hand back the place or slot it would get
+                identify_admission.cancel(ticket)
+                raise
+        else:
+            identify_admission.wait(ticket)
+
+        start = loop.time()
+        try:
+            return await loop.run_in_executor(self.recognition_pool, func, *args)
+        finally:
+            identify_admission.release(ticket, loop.time() - start)
+
+    @staticmethod
+    def _client_id(scope, headers) -> str:
+        client = scope.get("client")
+        return headers.get("X-Client-Id") or (client[0] if client else "unknown")
+
+    async def identify(self, scope, headers, receive) -> Tuple[Dict, int, List]:
+        payload = await self._read_json(receive)
+        try:
+            (body, status), profile_id = await self._recognize(
+                self._client_id(scope, headers), parse_deadline(headers),
+                request_profiler.run, "identify", headers, identify_request, payload
+            )
+        except AdmissionRejected as e:
+            return {"error": str(e)}, 429, [(b"retry-after", str(e.retry_after).encode())]
+        except DeadlineExceeded as e:
+            return {"error": str(e)}, 504, []
+        return body, status, [(b"x-profile-id", profile_id.encode())] if profile_id else []
+
+    async def save_profile_image(self, scope, headers, receive) -> Tuple[Dict, int, List]:
+        payload = await self._read_json(receive)
+        loop = asyncio.get_running_loop()
+        body, status = await loop.run_in_executor(self.io_pool, save_profile_image_request, payload)
+        return body, status, []
+
+    async def stats(self, scope, headers, receive) -> Tuple[Dict, int, List]:
+        stats = collect_stats()
+        stats["streams"] = dict(self.stream_stats)
+        return stats, 200, []
+
+    async def _websocket(self, scope, receive, send):
+        """Accept a live identification stream and read its frames."""
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        if scope["path"] != "/api/stream":
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        await send({"type": "websocket.accept"})
+
+        headers = {
+            key.decode("latin-1").title(): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        client_id = self._client_id(scope, headers)
+        slot = LatestFrameSlot()
+        stream = IdentificationStream(STREAM_CONFIRM_FRAMES)
+        self.stream_stats["connections"] += 1
+        self.stream_stats["open"] += 1
+        worker = asyncio.create_task(self._stream_worker(client_id, slot, stream, send))
+        try:
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is None:
+                    # Text messages are reserved for control; only a ping is answered
+                    if message.get("text") == "ping":
+                        await self._send_event(send, {"event": "pong"})
+                    continue
+                if len(frame) > MAX_FRAME_BYTES:
+                    await send({"type": "websocket.close", "code": 1009})
+                    break
+                slot.put(frame)
+        finally:
+            slot.close()
+            await worker
+            self.stream_stats["open"] -= 1
+            self.stream_stats["frames"] += slot.received
+            self.stream_stats["dropped"] += slot.dropped
+
+    async def _stream_worker(self, client_id: str, slot: LatestFrameSlot,
+                             stream: IdentificationStream, send) -> None:
+        """Recognise the latest frame of a stream and push the events it causes."""
+        connected = True
+        while True:
+            frame = await slot.get()
+            if frame is None:
+                return
+            try:
+                name, confidence = await self._recognize(client_id, None, identify_frame, frame)
+            except (AdmissionRejected, DeadlineExceeded):
+                # The model is saturated; skip this frame, the next one will be newer anyway
+                self.stream_stats["shed"] += 1
+                continue
+            except FaceQualityError:
+                # Too poor to judge; keep the current scene
+                continue
+            except Exception as e:
+                face_recognition.logger.warning(f"Error identifying stream frame: {e}")
+                continue
+
+            events = stream.update(name, confidence)
+            self.stream_stats["events"] += len(events)
+            for event in events:
+                if connected:
+                    connected = await self._send_event(send, event)
+
+    @staticmethod
+    async def _send_event(send, event: Dict) -> bool:
+        """Push one event; returns False if the client has gone away."""
+        try:
+            await send({"type": "websocket.send", "text": json.dumps(event)})
+            return True
+        except Exception:
+            return False
+
+    async def compact(self, scope, headers, receive) -> Tuple[Dict, int, List]:
+        loop = asyncio.get_running_loop()
+        body, status = await loop.run_in_executor(self.io_pool, compact_request)
+        return body, status, []
+
+    async def list_profiles(self, scope, headers, receive) -> Tuple[Dict, int, List]:
+        if not request_profiler.enabled:
+            return {"error": "Profiling is disabled"}, 404, []
+        loop = asyncio.get_running_loop()
+        return {"profiles": await loop.run_in_executor(self.io_pool, request_profiler.list_profiles)}, 200, []
+
+    async def get_profile(self, scope, headers, receive) -> Tuple[Union[Dict, str], int, List]:
+        profile_id = scope["path"][len("/api/debug/profiles/"):]
+        profile = None
+        if request_profiler.enabled:
+            loop = asyncio.get_running_loop()
+            profile = await loop.run_in_executor(self.io_pool, request_profiler.get_profile, profile_id)
+        if profile is None:
+            return {"error": "Profile not found"}, 404, []
+        if parse_qs(scope.get("query_string", b"").decode()).get("format") == ["collapsed"]:
+            return profile["collapsed"], 200, []
+        return profile, 200, []
+
+    async def _send(self, send, status: int, body: bytes,
+                    content_type: Optional[bytes] = None, extra_headers: Optional[List] = None) -> None:
+        response_headers = [
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+        ]
+        if content_type:
+            response_headers.append((b"content-type", content_type))
+        response_headers.extend(extra_headers or [])
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_json(self, send, body: Dict, status: int = 200, extra_headers: Optional[List] = None) -> None:
+        await self._send(send, status, json.dumps(body).encode(), b"application/json", extra_headers)
+
+    async def _send_static(self, send, relative_path: str) -> None:
+        """Serve a file from the static directory without blocking the loop."""
+        path = os.path.realpath(os.path.join(STATIC_DIR, relative_path))
+        if not path.startswith(os.path.realpath(STATIC_DIR) + os.sep) or not os.path.isfile(path):
+            await self._send_json(send, {"error": "Not found"}, 404)
+            return
+
+        def read_file() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(self.io_pool, read_file)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        await self._send(send, 200, body, content_type.encode())
+
+
+face_recognition.face_system = FamilyRecognitionSystem(shared_gallery_dir=SHARED_GALLERY_DIR)
+application = RecognitionASGIApp()
+
+
+def main():
+    """Run the API under uvicorn with keep-alive and graceful shutdown."""
+    import uvicorn
+
+    print(f"REST API (ASGI) will run on http://{ASGI_HOST}:{ASGI_PORT}")
+    uvicorn.run(
+        application,
+        host=ASGI_HOST,
+        port=ASGI_PORT,
+        timeout_keep_alive=KEEP_ALIVE_SECONDS,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        lifespan="on"
+    )
+
+
+if __name__ == "__main__":
+    main()
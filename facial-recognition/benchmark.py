@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# Benchmark Suite for FamilyRecognitionSystem
+# ===========================================
+
+# Measures enroll, identify and load performance of FamilyRecognitionSystem
+# and writes the results as JSON so runs from different commits can be
+# compared. By default it runs offline: DeepFace is replaced by a stub model
+# that decodes the image like the real pipeline but embeds it with a fixed
+# random projection, and every image and gallery is synthetic and seeded, so
+# two runs on the same machine measure the same work.
+#
+#   python benchmark.py                                  # stub model, full sweep
+#   python benchmark.py --quick                          # small sweep for a smoke test
+#   python benchmark.py --real-images ~/samples          # real DeepFace on <Name>_<n>.jpg files
+#   python benchmark.py --compare benchmark-abc123.json  # show the change against an earlier run
+#
+# Sweeps: gallery size and concurrency for identify, batch size (images per
+# enrollment) for enroll, image resolution for both, and gallery size for
+# load (startup from the profile store). Each result has throughput,
+# p50/p95/p99 latency, the peak RSS seen while it ran and how far that peak
+# rose above the RSS at the scenario's start. The peak alone includes
+# everything earlier scenarios left in the process; the growth is what this
+# scenario added.
+
+import os
+import io
+import sys
+import json
+import time
+import glob
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import numpy as np
+from PIL import Image
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+# Output sizes of the DeepFace models, used for stub embeddings and synthetic galleries
+MODEL_DIMENSIONS = {
+    "VGG-Face": 4096,
+    "Facenet": 128,
+    "Facenet512": 512,
+    "ArcFace": 512,
+    "SFace": 128,
+    "OpenFace": 128,
+}
+
+
+class StubDeepFace:
+    """
+    Offline stand-in for DeepFace with the same call signatures.
+
+    Images are decoded and cropped for real, so the cost still grows with
+    resolution, but the network is replaced by a fixed random projection of
+    a 32x32 thumbnail. Images of the same synthetic person therefore get
+    similar embeddings and identification returns meaningful matches.
+    """
+
+    latency = 0.0  # Extra seconds per embedding to imitate a model
+    _projections: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def _projection(cls, model_name: str) -> np.ndarray:
+        if model_name not in cls._projections:
+            rng = np.random.default_rng(0)
+            dim = MODEL_DIMENSIONS.get(model_name, 512)
+            cls._projections[model_name] = rng.normal(size=(32 * 32, dim)).astype(np.float32)
+        return cls._projections[model_name]
+
+    @staticmethod
+    def _load(img_path) -> np.ndarray:
+        if isinstance(img_path, str):
+            with Image.open(img_path) as image:
+                return np.asarray(image.convert("RGB"))[:, :, ::-1]
+        return np.asarray(img_path)
+
+    @classmethod
+    def extract_faces(cls, img_path, enforce_detection=True, **kwargs) -> List[Dict]:
+        image = cls._load(img_path)
+        height, width = image.shape[:2]
+        # "Detect" the central 60% of the frame as the face
+        w, h = int(width * 0.6), int(height * 0.6)
+        x, y = (width - w) // 2, (height - h) // 2
+        crop = Image.fromarray(np.ascontiguousarray(image[y:y + h, x:x + w])).resize((224, 224))
+        return [{
+            "face": np.asarray(crop, dtype=np.float32),
+            "facial_area": {
+                "x": x, "y": y, "w": w, "h": h,
+                "left_eye": (x + int(w * 0.68), y + int(h * 0.4)),
+                "right_eye": (x + int(w * 0.32), y + int(h * 0.4)),
+            },
+            "confidence": 0.99,
+        }]
+
+    @classmethod
+    def represent(cls, img_path, model_name="VGG-Face", enforce_detection=True,
+                  detector_backend="opencv", **kwargs) -> List[Dict]:
+        image = cls._load(img_path)
+        if detector_backend != "skip":
+            image = cls.extract_faces(image)[0]["face"]
+        thumbnail = Image.fromarray(np.asarray(image, dtype=np.uint8)).convert("L").resize((32, 32))
+        vector = (np.asarray(thumbnail, dtype=np.float32).ravel() - 128.0) / 128.0
+        if cls.latency:
+            time.sleep(cls.latency)
+        return [{"embedding": (vector @ cls._projection(model_name)).tolist()}]
+
+
+class RSSMonitor:
+    """Tracks the peak resident set size of this process while a block runs, and its starting RSS."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource
+            # Lifetime peak (KiB on Linux, bytes on macOS); best available without /proc,
+            # so growth then only shows when a scenario sets a new high-water mark
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RSSMonitor":
+        self.baseline = self.peak = self.current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+    @property
+    def growth(self) -> int:
+        """Bytes the peak rose above the RSS when the block started."""
+        return max(0, self.peak - self.baseline)
+
+
+def summarize(operation: str, params: Dict, latencies: List[float], wall_seconds: float,
+              units: int, rss: RSSMonitor) -> Dict:
+    """Build one result record from per-call latencies (seconds)."""
+    ordered = np.sort(np.asarray(latencies)) * 1000.0
+    return {
+        "operation": operation,
+        "params": params,
+        "calls": len(latencies),
+        "throughput_per_second": units / wall_seconds if wall_seconds else 0.0,
+        "latency_ms": {
+            "mean": float(ordered.mean()),
+            "p50": float(np.percentile(ordered, 50)),
+            "p95": float(np.percentile(ordered, 95)),
+            "p99": float(np.percentile(ordered, 99)),
+        },
+        "peak_rss_mb": rss.peak / (1024 * 1024),
+        "rss_growth_mb": rss.growth / (1024 * 1024),
+    }
+
+
+class ImageSource:
+    """Provides face images of a given resolution for a numbered person."""
+
+    def __init__(self, directory: str, sample_dir: Optional[str] = None):
+        self.directory = directory
+        self.samples: Dict[str, List[str]] = {}
+        if sample_dir:
+            for path in sorted(glob.glob(os.path.join(os.path.expanduser(sample_dir), "*"))):
+                if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg", ".png"):
+                    person = os.path.basename(path).split("_")[0]
+                    self.samples.setdefault(person, []).append(path)
+            if not self.samples:
+                raise ValueError(f"No <Name>_<n>.jpg images found in {sample_dir}")
+
+    def images(self, person: int, count: int, resolution: int, offset: int = 0) -> List[str]:
+        """Paths of count images of one person, created on first use."""
+        paths = []
+        for n in range(offset, offset + count):
+            path = os.path.join(self.directory, f"p{person}_{n}_{resolution}.jpg")
+            if not os.path.exists(path):
+                self._make_image(person, n, resolution).save(path, "JPEG", quality=90)
+            paths.append(path)
+        return paths
+
+    def _make_image(self, person: int, n: int, resolution: int) -> Image.Image:
+        if self.samples:
+            names = sorted(self.samples)
+            files = self.samples[names[person % len(names)]]
+            with Image.open(files[n % len(files)]) as image:
+                return image.convert("RGB").resize((resolution, resolution))
+
+        # A coarse per-person pattern, plus per-image noise so every image has
+        # its own content hash and enough texture to pass the blur check
+        base = np.random.default_rng(person).integers(40, 215, (8, 8, 3)).astype(np.uint8)
+        pattern = np.asarray(Image.fromarray(base).resize((resolution, resolution), Image.BILINEAR), dtype=np.float32)
+        noise = np.random.default_rng((person, n)).normal(0, 20, pattern.shape)
+        return Image.fromarray(np.clip(pattern + noise, 0, 255).astype(np.uint8))
+
+
+def seed_gallery(profiles_dir: str, persons: int, embeddings_per_person: int, model_name: str) -> None:
+    """Write synthetic profiles with random embeddings straight into a profile store."""
+    from profile_log import ProfileStore
+
+    store = ProfileStore(profiles_dir, compact_every=10 ** 9)
+    rng = np.random.default_rng(persons)
+    dim = MODEL_DIMENSIONS.get(model_name, 512)
+    for p in range(persons):
+        name = f"Filler{p:05d}"
+        hashes = [hashlib.sha256(f"{name}-{i}".encode()).hexdigest() for i in range(embeddings_per_person)]
+        store.append({"op": "put", "name": name, "profile": {
+            "name": name,
+            "embeddings": rng.normal(size=(embeddings_per_person, dim)).astype(np.float32).tolist(),
+            "image_paths": [f"/nonexistent/{name}_{i}.jpg" for i in range(embeddings_per_person)],
+            "image_hashes": hashes,
+            "model_name": model_name
+        }})
+    store.compact()
+
+
+class Benchmark:
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.images = ImageSource(os.path.join(workdir, "images"), args.real_images)
+        os.makedirs(self.images.directory, exist_ok=True)
+        self._galleries: Dict[int, str] = {}
+
+    def _gallery_dir(self, persons: int) -> str:
+        """Profile store seeded with a synthetic gallery, built once per size."""
+        if persons not in self._galleries:
+            directory = os.path.join(self.workdir, f"gallery-{persons}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                seed_gallery(directory, persons, self.args.embeddings_per_person, self.args.model)
+            self._galleries[persons] = directory
+        return self._galleries[persons]
+
+    def _system(self, persons: int, fresh: bool = False):
+        """FamilyRecognitionSystem over a copy of (or directly on) a seeded gallery."""
+        from face_recognition import FamilyRecognitionSystem
+
+        profiles_dir = self._gallery_dir(persons)
+        if fresh:
+            copy_dir = tempfile.mkdtemp(dir=self.workdir)
+            shutil.rmtree(copy_dir)
+            shutil.copytree(profiles_dir, copy_dir)
+            profiles_dir = copy_dir
+        images_dir = tempfile.mkdtemp(dir=self.workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return FamilyRecognitionSystem(
+                profiles_dir=profiles_dir,
+                profile_images_dir=images_dir,
+                model_name=self.args.model
+            )
+
+    def load(self, persons: int) -> Dict:
+        from face_recognition import FamilyRecognitionSystem
+
+        profiles_dir = self._gallery_dir(persons)
+        latencies = []
+        with RSSMonitor() as rss:
+            start = time.perf_counter()
+            for _ in range(self.args.repeats):
+                call_start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    FamilyRecognitionSystem(profiles_dir=profiles_dir,
+                                            profile_images_dir=self.workdir,
+                                            model_name=self.args.model)
+                latencies.append(time.perf_counter() - call_start)
+            wall = time.perf_counter() - start
+        params = {"gallery_size": persons, "embeddings_per_person": self.args.embeddings_per_person}
+        return summarize("load", params, latencies, wall, persons * self.args.repeats, rss)
+
+    def identify(self, persons: int, concurrency: int, resolution: int) -> Dict:
+        system = self._system(persons)
+        # Enroll a handful of real (stub-embedded) people so probes can match
+        with contextlib.redirect_stdout(io.StringIO()):
+            for person in range(5):
+                system.create_profile(f"Person{person}", self.images.images(person, 3, resolution))
+        probes = [self.images.images(i % 5, 1, resolution, offset=100 + i)[0]
+                  for i in range(self.args.requests)]
+
+        latencies = []
+
+        def identify_one(path: str) -> None:
+            call_start = time.perf_counter()
+            system.identify_face(path)
+            latencies.append(time.perf_counter() - call_start)
+
+        with RSSMonitor() as rss, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(identify_one, probes))
+            wall = time.perf_counter() - start
+        params = {"gallery_size": persons + 5, "concurrency": concurrency, "resolution": resolution}
+        return summarize("identify", params, latencies, wall, len(probes), rss)
+
+    def enroll(self, batch_size: int, resolution: int) -> Dict:
+        system = self._system(self.args.gallery_sizes[0], fresh=True)
+        batches = [self.images.images(1000 + person, batch_size, resolution)
+                   for person in range(self.args.enrollments)]
+
+        latencies = []
+        with RSSMonitor() as rss, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for person, paths in enumerate(batches):
+                call_start = time.perf_counter()
+                system.create_profile(f"New{person}", paths)
+                latencies.append(time.perf_counter() - call_start)
+            wall = time.perf_counter() - start
+        params = {"batch_size": batch_size, "resolution": resolution}
+        return summarize("enroll", params, latencies, wall, batch_size * len(batches), rss)
+
+    def run(self) -> List[Dict]:
+        args = self.args
+        default_resolution = args.resolutions[len(args.resolutions) // 2]
+        scenarios = []
+        for persons in args.gallery_sizes:
+            scenarios.append(("load", (persons,)))
+        for persons in args.gallery_sizes:
+            for concurrency in args.concurrency:
+                scenarios.append(("identify", (persons, concurrency, default_resolution)))
+        for resolution in args.resolutions:
+            if resolution != default_resolution:
+                scenarios.append(("identify", (args.gallery_sizes[0], args.concurrency[0], resolution)))
+        for batch_size in args.batch_sizes:
+            scenarios.append(("enroll", (batch_size, default_resolution)))
+        for resolution in args.resolutions:
+            if resolution != default_resolution:
+                scenarios.append(("enroll", (args.batch_sizes[0], resolution)))
+
+        results = []
+        for operation, params in scenarios:
+            result = getattr(self, operation)(*params)
+            latency = result["latency_ms"]
+            print(f"{operation:<9} {json.dumps(result['params']):<64} "
+                  f"{result['throughput_per_second']:>10.1f}/s  p50 {latency['p50']:>8.2f} ms  "
+                  f"p95 {latency['p95']:>8.2f} ms  p99 {latency['p99']:>8.2f} ms  "
+                  f"rss {result['peak_rss_mb']:>7.1f} MB (+{result['rss_growth_mb']:.1f})")
+            results.append(result)
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path: str, results: List[Dict]) -> None:
+    """Print how throughput and p95 latency changed against an earlier results file."""
+    with open(previous_path) as f:
+        previous = {
+            (r["operation"], json.dumps(r["params"], sort_keys=True)): r
+            for r in json.load(f)["results"]
+        }
+    print(f"\nChange against {previous_path}:")
+    for result in results:
+        before = previous.get((result["operation"], json.dumps(result["params"], sort_keys=True)))
+        if before is None:
+            continue
+        throughput = 100.0 * (result["throughput_per_second"] / before["throughput_per_second"] - 1.0)
+        p95 = 100.0 * (result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1.0)
+        print(f"{result['operation']:<9} {json.dumps(result['params']):<64} "
+              f"throughput {throughput:+7.1f}%  p95 {p95:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FamilyRecognitionSystem")
+    parser.add_argument("--model", default="VGG-Face", help="Face recognition model name")
+    parser.add_argument("--real-images", help="Directory of <Name>_<n>.jpg images; uses the real DeepFace model")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Extra seconds per stub embedding")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[320, 640, 1280])
+    parser.add_argument("--embeddings-per-person", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="Identify calls per scenario")
+    parser.add_argument("--enrollments", type=int, default=10, help="Profiles created per enroll scenario")
+    parser.add_argument("--repeats", type=int, default=5, help="Startups per load scenario")
+    parser.add_argument("--quick", action="store_true", help="Small sweep for a quick check")
+    parser.add_argument("--output", help="Results file (default benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.gallery_sizes, args.concurrency = [10, 100], [1, 4]
+        args.batch_sizes, args.resolutions = [1, 5], [256, 512]
+        args.requests, args.enrollments, args.repeats = 40, 4, 2
+
+    import face_recognition
+    if not args.real_images:
+        StubDeepFace.latency = args.stub_latency
+        face_recognition.DeepFace = StubDeepFace
+
+    commit = git_commit()
+    workdir = tempfile.mkdtemp(prefix="face-benchmark-")
+    try:
+        results = Benchmark(args, workdir).run()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": "real" if args.real_images else "stub",
+        "model": args.model,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    output = args.output or f"benchmark-{commit or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
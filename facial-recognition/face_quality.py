@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# Face Quality Gate
+# =================
+
+# Cheap checks run on a detected face crop before it is sent through the
+# embedding network: face size, sharpness (variance of the Laplacian),
+# brightness/contrast and a head-pose estimate from the eye landmarks. Poor
+# crops are rejected with a reason instead of wasting a full model inference
+# and polluting the gallery.
+
+import math
+import threading
+import numpy as np
+from typing import Dict, Optional
+
+
+class FaceQualityError(ValueError):
+    """Raised when a detected face is rejected by the quality gate."""
+
+    def __init__(self, reason: str, report: Dict):
+        super().__init__(f"Face rejected by quality gate: {reason}")
+        self.reason = reason
+        self.report = report
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian; low values mean a blurry image."""
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+           - 4.0 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+
+def estimate_pose(facial_area: Dict) -> Optional[Dict[str, float]]:
+    """
+    Estimate head roll and yaw (degrees) from the eye landmarks.
+
+    Roll is the tilt of the line between the eyes. Yaw is approximated from
+    how far the midpoint between the eyes sits from the centre of the face box.
+
+    Returns:
+        Dict with 'roll' and 'yaw', or None if the detector gave no eye landmarks
+    """
+    left_eye = facial_area.get("left_eye")
+    right_eye = facial_area.get("right_eye")
+    width = facial_area.get("w") or 0
+    if not left_eye or not right_eye or width <= 0:
+        return None
+
+    dx = float(left_eye[0] - right_eye[0])
+    dy = float(left_eye[1] - right_eye[1])
+    roll = math.degrees(math.atan2(dy, abs(dx))) if dx or dy else 0.0
+
+    mid_x = (left_eye[0] + right_eye[0]) / 2.0
+    center_x = facial_area.get("x", 0) + width / 2.0
+    offset = max(-1.0, min(1.0, 2.0 * (mid_x - center_x) / width))
+    yaw = math.degrees(math.asin(offset))
+
+    return {"roll": roll, "yaw": yaw}
+
+
+class FaceQualityGate:
+    def __init__(self,
+                 min_face_size: int = 40,
+                 min_blur_score: float = 30.0,
+                 min_brightness: float = 40.0,
+                 max_brightness: float = 220.0,
+                 min_contrast: float = 15.0,
+                 max_yaw: float = 45.0,
+                 max_roll: float = 35.0):
+        """
+        Initialize the face quality gate.
+
+        Args:
+            min_face_size: Minimum width and height of the face box in pixels
+            min_blur_score: Minimum Laplacian variance of the grayscale crop
+            min_brightness: Minimum mean grayscale intensity (0-255)
+            max_brightness: Maximum mean grayscale intensity (0-255)
+            min_contrast: Minimum standard deviation of grayscale intensity
+            max_yaw: Maximum estimated head yaw in degrees
+            max_roll: Maximum estimated head roll in degrees
+        """
+        self.min_face_size = min_face_size
+        self.min_blur_score = min_blur_score
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = 0
+        self.rejected_by_reason: Dict[str, int] = {}
+        self.gate_seconds = 0.0
+        self.embedded = 0
+        self.embedding_seconds = 0.0
+
+    def assess(self, face: np.ndarray, facial_area: Dict) -> Dict:
+        """
+        Score a detected face crop.
+
+        Args:
+            face: Face crop as an HxWx3 array with values in 0-255
+            facial_area: Detector output with x, y, w, h and optional eye landmarks
+
+        Returns:
+            Dict with 'passed', 'reason' (None if passed), 'score' in [0, 1]
+            used to rank several faces, and the raw 'metrics'
+        """
+        gray = np.asarray(face, dtype=np.float32)
+        if gray.ndim == 3:
+            gray = gray.mean(axis=2)
+
+        size = min(facial_area.get("w") or gray.shape[1], facial_area.get("h") or gray.shape[0])
+        metrics = {
+            "face_size": int(size),
+            "blur_score": laplacian_variance(gray),
+            "brightness": float(gray.mean()),
+            "contrast": float(gray.std()),
+        }
+        pose = estimate_pose(facial_area)
+        if pose is not None:
+            metrics.update(pose)
+
+        reason = None
+        if metrics["face_size"] < self.min_face_size:
+            reason = "face_too_small"
+        elif metrics["blur_score"] < self.min_blur_score:
+            reason = "too_blurry"
+        elif metrics["brightness"] < self.min_brightness:
+            reason = "too_dark"
+        elif metrics["brightness"] > self.max_brightness:
+            reason = "too_bright"
+        elif metrics["contrast"] < self.min_contrast:
+            reason = "low_contrast"
+        elif pose is not None and abs(pose["yaw"]) > self.max_yaw:
+            reason = "face_turned_away"
+        elif pose is not None and abs(pose["roll"]) > self.max_roll:
+            reason = "head_tilted"
+
+        # Relative quality used to prefer the best of several detected faces
+        score = min(1.0, metrics["face_size"] / (4.0 * self.min_face_size))
+        score *= min(1.0, metrics["blur_score"] / (4.0 * self.min_blur_score))
+        if pose is not None:
+            score *= max(0.0, 1.0 - abs(pose["yaw"]) / 90.0)
+
+        return {"passed": reason is None, "reason": reason, "score": score, "metrics": metrics}
+
+    def record_check(self, report: Dict, seconds: float) -> None:
+        """Count a quality check and how long it took."""
+        with self._lock:
+            self.checked += 1
+            self.gate_seconds += seconds
+            if not report["passed"]:
+                self.rejected += 1
+                reason = report["reason"]
+                self.rejected_by_reason[reason] = self.rejected_by_reason.get(reason, 0) + 1
+
+    def record_embedding(self, seconds: float) -> None:
+        """Count one embedding inference and how long it took."""
+        with self._lock:
+            self.embedded += 1
+            self.embedding_seconds += seconds
+
+    def stats(self) -> Dict:
+        """Counters showing how much inference time the gate saves."""
+        with self._lock:
+            avg_embedding = self.embedding_seconds / self.embedded if self.embedded else 0.0
+            return {
+                "checked": self.checked,
+                "rejected": self.rejected,
+                "rejected_by_reason": dict(self.rejected_by_reason),
+                "embedded": self.embedded,
+                "avg_embedding_seconds": avg_embedding,
+                "gate_seconds": self.gate_seconds,
+                "estimated_seconds_saved": self.rejected * avg_embedding - self.gate_seconds,
+            }
@@ -13,8 +13,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 from PIL import Image
 from typing import List, Dict, Optional, Union, Tuple
-import pickle
 import json
+import re
+import hashlib
 from pathlib import Path
 from deepface import DeepFace
 from langchain.agents import Tool, AgentExecutor, create_react_agent
@@ -25,6 +26,10 @@ from langchain.prompts import MessagesPlaceholder
 import datetime
 from uuid import uuid4
 import time
+import threading
+import functools
+import fcntl
+from collections import Counter
 from uagents import Context, Model
 from uagents_adapter.langchain import UAgentRegisterTool, cleanup_uagent
 from uagents_core.contrib.protocols.chat import (
@@ -37,6 +42,17 @@ from flask_cors import CORS
 import base64
 import logging
 import io
+from gallery import EmbeddingGallery, select_representatives
+from shared_gallery import SharedGallery
+from profile_log import ProfileStore
+from face_quality import FaceQualityGate, FaceQualityError
+from reembed import ReembedMigration
+from admission import AdmissionController, AdmissionRejected, DeadlineExceeded, parse_deadline
+from payload_archive import PayloadArchiver
+from request_profiler import RequestProfiler
+from intent_router import IntentRouter, IMAGE_PATH
+from response_cache import ResponseCache, LLMResponseCache, make_key, normalize_query
+from identification_stream import UNKNOWN
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -52,6 +68,18 @@ WATCH_DIR = "/tmp/lumosprofiles"
 UPLOAD_DIR = "/tmp/lumosinput"
 PROFILE_IMAGES_DIR = os.path.join(PROJECT_DIR, "profile_images")
 BASE64_IMAGES_DIR = os.path.join(PROJECT_DIR, "base64_images")  # New directory for base64 images
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "7"))  # Days identify payloads are kept
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(1024 ** 3)))  # Size cap of the identify payload archive
+IDENTIFY_MAX_IN_FLIGHT = int(os.getenv("IDENTIFY_MAX_IN_FLIGHT", "2"))  # Identify requests running on the model at once
+IDENTIFY_MAX_QUEUE = int(os.getenv("IDENTIFY_MAX_QUEUE", "16"))  # Identify requests allowed to wait for a slot
+PROFILING_ENABLED = os.getenv("FACE_PROFILING", "0") == "1"  # Allow per-request profiling (X-Profile header)
+PROFILE_SAMPLE_EVERY = int(os.getenv("FACE_PROFILE_SAMPLE_EVERY", "0"))  # Also profile 1 in N calls (0 = off)
+REQUEST_PROFILES_DIR = os.path.join(PROJECT_DIR, "request_profiles")
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "3600"))  # Seconds cached agent answers stay valid
+AGENT_CACHE_PATH = os.getenv("AGENT_CACHE_PATH")  # Optional SQLite file persisting cached answers
+COMPACTION_INTERVAL = 3600  # Seconds between background gallery compactions
+PROFILE_MONITOR_INTERVAL = 5  # Seconds between checks of WATCH_DIR for photos to enroll
+SHARED_GALLERY_DIR = os.getenv("FACE_SHARED_GALLERY_DIR", "/dev/shm/lumos_gallery")  # Shared gallery for pre-fork workers
 
 # Create necessary directories
 os.makedirs(PROJECT_DIR, exist_ok=True)
@@ -65,43 +93,191 @@ os.makedirs(BASE64_IMAGES_DIR, exist_ok=True)  # Create base64 images directory
 # Define the FamilyRecognitionSystem class
 # ---------------------------------------
 
+def synchronized(method):
+    """
+    Run a FamilyRecognitionSystem method while holding its mutation lock.
+
+    The profile store lock is held as well, so that no other process can log
+    a change between the method reloading a profile and logging its own.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._mutation_lock, self.profile_store.locked():
+            self._mutation_depth += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._mutation_depth -= 1
+    return wrapper
+
 class FamilyRecognitionSystem:
     def __init__(self,
                  profiles_dir: str = os.path.join(PROJECT_DIR, "family_profiles"),
                  profile_images_dir: str = PROFILE_IMAGES_DIR,
                  model_name: str = "VGG-Face",
                  distance_metric: str = "cosine",
-                 threshold: float = 0.4):
+                 threshold: float = 0.4,
+                 shared_gallery_dir: Optional[str] = None,
+                 use_quality_gate: bool = True,
+                 dedupe_similarity: float = 0.98,
+                 max_embeddings_per_person: Optional[int] = 20):
         """
         Initialize the family recognition system.
 
         Args:
             profiles_dir: Directory to store family profiles
             profile_images_dir: Directory to store permanent copies of profile images
-            model_name: Face recognition model to use (VGG-Face, Facenet, etc.)
+            model_name: Face recognition model to use (VGG-Face, Facenet, etc.). If stored
+                profiles were embedded with another model, identification keeps using
+                that model until start_model_migration() has re-embedded them
             distance_metric: Distance metric to use (cosine, euclidean, etc.)
             threshold: Similarity threshold for recognizing faces
+            shared_gallery_dir: If set, serve the gallery from memory-mapped files in this
+                directory so that all worker processes share one copy
+            use_quality_gate: Reject blurry, tiny, badly lit or turned-away faces before embedding
+            dedupe_similarity: Cosine similarity above which a person's embeddings count as duplicates
+            max_embeddings_per_person: Cap on diverse embeddings kept per person (None for no cap)
         """
         self.profiles_dir = profiles_dir
         self.profile_images_dir = profile_images_dir
-        self.model_name = model_name
         self.distance_metric = distance_metric
         self.threshold = threshold
-        self.family_profiles = self._load_profiles()
+        self.quality_gate = FaceQualityGate() if use_quality_gate else None
+        self.dedupe_similarity = dedupe_similarity
+        self.max_embeddings_per_person = max_embeddings_per_person
+        self._mutation_lock = threading.RLock()
+        self._mutation_depth = 0
+        self.profile_store = ProfileStore(profiles_dir)
+        self.migration: Optional[ReembedMigration] = None
+
+        self.shared_gallery = None
+        self._local_gallery = None
+        self._gallery_mutations = 0
+        self._gallery_digest = None
+        # Shared generation the in-memory profiles correspond to
+        self._profiles_generation = None
+
+        # Load the profiles and publish them with no change logged in between
+        with self.profile_store.locked():
+            self.family_profiles = self._load_profiles()
+
+            serving_model = self._serving_model(model_name)
+            self.pending_model_name = model_name if serving_model != model_name else None
+
+            if shared_gallery_dir:
+                self.shared_gallery = SharedGallery(shared_gallery_dir, distance_metric, serving_model)
+                # A generation left from an earlier run misses changes logged since (e.g. by the CLI)
+                if self.shared_gallery.publish_if_changed(
+                        EmbeddingGallery.from_profiles(self.family_profiles, distance_metric, serving_model)) is not None:
+                    print("Published the shared gallery from the stored profiles.")
+                self.shared_gallery.refresh()
+                self._profiles_generation = self.shared_gallery.generation
+            else:
+                self._local_gallery = EmbeddingGallery.from_profiles(
+                    self.family_profiles, distance_metric, serving_model
+                )
 
-    def _load_profiles(self) -> Dict[str, Dict]:
-        """Load existing family profiles from disk."""
-        profiles = {}
-        profile_files = Path(self.profiles_dir).glob("*.pkl")
+    @property
+    def gallery(self) -> EmbeddingGallery:
+        """The current search gallery, picking up new shared generations if any."""
+        if self.shared_gallery is not None:
+            gallery = self.shared_gallery.refresh()
+            if self.shared_gallery.generation != self._profiles_generation:
+                self._reload_shared_profiles()
+            return gallery
+        return self._local_gallery
+
+    def _reload_shared_profiles(self) -> None:
+        """
+        Reload the profiles after another worker published a new generation.
 
-        for profile_file in profile_files:
-            name = profile_file.stem
-            with open(profile_file, "rb") as f:
-                profiles[name] = pickle.load(f)
+        Every change to a profile publishes a generation, so one this process
+        has not loaded profiles for means the profile store has moved on.
+        """
+        with self._mutation_lock:
+            if self._mutation_depth:
+                # Called from a mutation on this thread, which keeps its own profiles current
+                return
+            with self.profile_store.locked():
+                generation = self.shared_gallery._read_generation()
+                self._reload_profiles()
+            self._profiles_generation = generation
+
+    def refresh_profiles(self) -> Dict[str, Dict]:
+        """The family profiles, reloaded first if another worker changed them."""
+        if self.shared_gallery is not None:
+            self.gallery
+        return self.family_profiles
+
+    @property
+    def gallery_version(self) -> str:
+        """
+        Digest of the live gallery's contents, used to key cached answers.
+
+        Changes whenever an embedding, a name or the model changes, and is
+        the same across restarts for the same gallery.
+        """
+        gallery = self.gallery
+        stamp = (id(gallery), self._gallery_mutations,
+                 self.shared_gallery.generation if self.shared_gallery is not None else None)
+        if self._gallery_digest is None or self._gallery_digest[0] != stamp:
+            # Independent of row and label order, so a rebuilt gallery keeps its version
+            self._gallery_digest = (stamp, gallery.digest())
+        return self._gallery_digest[1]
+
+    @property
+    def model_name(self) -> str:
+        """Model the live gallery was embedded with, used for every new embedding."""
+        return self.gallery.model_name
+
+    def _serving_model(self, requested_model: str) -> str:
+        """Pick the model to serve with, based on what the stored profiles were embedded with."""
+        models = Counter(p.get("model_name", requested_model) for p in self.family_profiles.values())
+        if not models:
+            return requested_model
+
+        serving_model = models.most_common(1)[0][0]
+        if serving_model != requested_model:
+            print(f"Profiles were embedded with {serving_model}; serving with it until "
+                  f"re-embedding to {requested_model} completes.")
+        stale = sum(count for model, count in models.items() if model != serving_model)
+        if stale:
+            print(f"{stale} profiles embedded with other models are excluded until re-embedded.")
+        return serving_model
+
+    def _load_profiles(self) -> Dict[str, Dict]:
+        """Load existing family profiles from disk, replaying the mutation log."""
+        profiles = self.profile_store.load()
+        self._redo_image_operations(profiles, self.profile_store.replayed_records)
 
         print(f"Loaded {len(profiles)} family profiles.")
         return profiles
 
+    def _redo_image_operations(self, profiles: Dict[str, Dict], records: List[Dict]) -> None:
+        """
+        Finish image directory changes that a crash may have interrupted.
+
+        Deletes and renames are logged before profile images are touched, so
+        replaying them here makes the images match the recovered profiles.
+        """
+        for record in records:
+            name = record["name"]
+            if name in profiles:
+                continue
+            person_dir = os.path.join(self.profile_images_dir, name)
+            if record["op"] == "delete" and os.path.exists(person_dir):
+                shutil.rmtree(person_dir, ignore_errors=True)
+            elif record["op"] == "rename" and os.path.exists(person_dir):
+                new_dir = os.path.join(self.profile_images_dir, record["new_name"])
+                if not os.path.exists(new_dir):
+                    os.rename(person_dir, new_dir)
+
+    @staticmethod
+    def _image_hash(image_path: str) -> str:
+        """Content hash of an image file."""
+        with open(image_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
     def _save_profile_image(self, source_path: str, name: str, index: int) -> str:
         """
         Save a permanent copy of a profile image.
@@ -129,6 +305,215 @@ class FamilyRecognitionSystem:
         
         return dest_path
 
+    def _represent(self, img_path: str, model_name: Optional[str] = None) -> List[float]:
+        """
+        Compute the embedding of the best face detected in an image.
+
+        Uses the live gallery's model unless model_name is given.
+
+        With the quality gate enabled, faces are detected once, scored cheaply,
+        and only an acceptable crop is passed to the embedding network.
+
+        Raises:
+            FaceQualityError: If every detected face fails the quality gate
+        """
+        model_name = model_name or self.model_name
+        if self.quality_gate is None:
+            embedding = DeepFace.represent(
+                img_path=img_path,
+                model_name=model_name,
+                enforce_detection=True
+            )
+            return embedding[0]["embedding"]
+
+        faces = DeepFace.extract_faces(
+            img_path=img_path,
+            enforce_detection=True,
+            color_face="bgr",
+            normalize_face=False
+        )
+
+        start = time.perf_counter()
+        reports = [self.quality_gate.assess(face["face"], face["facial_area"]) for face in faces]
+        best = max(range(len(faces)), key=lambda i: (reports[i]["passed"], reports[i]["score"]))
+        self.quality_gate.record_check(reports[best], time.perf_counter() - start)
+        if not reports[best]["passed"]:
+            raise FaceQualityError(reports[best]["reason"], reports[best])
+
+        # Embed the already detected and aligned crop without detecting again
+        start = time.perf_counter()
+        embedding = DeepFace.represent(
+            img_path=np.asarray(faces[best]["face"], dtype=np.uint8),
+            model_name=model_name,
+            detector_backend="skip",
+            enforce_detection=False
+        )
+        self.quality_gate.record_embedding(time.perf_counter() - start)
+        return embedding[0]["embedding"]
+
+    def _next_image_index(self, name: str) -> int:
+        """Next unused index for a person's saved profile images."""
+        person_dir = os.path.join(self.profile_images_dir, name)
+        if not os.path.isdir(person_dir):
+            return 0
+
+        indices = []
+        for filename in os.listdir(person_dir):
+            stem = os.path.splitext(filename)[0]
+            suffix = stem[len(name) + 1:] if stem.startswith(f"{name}_") else ""
+            if suffix.isdigit():
+                indices.append(int(suffix))
+        return max(indices) + 1 if indices else 0
+
+    def _ensure_image_keys(self, name: str) -> Dict:
+        """
+        Make sure every image of a profile has a content hash and an entry id.
+
+        Profiles created before these were stored get them computed once and
+        persisted, so later adds can skip known images by content and removes
+        can name exactly the entries they drop.
+
+        Returns:
+            The profile
+        """
+        profile = self.family_profiles[name]
+        count = len(profile["embeddings"])
+        hashes = profile.get("image_hashes")
+        entry_ids = profile.get("entry_ids")
+        if (hashes is not None and len(hashes) == count and None not in hashes
+                and entry_ids is not None and len(entry_ids) == count and None not in entry_ids):
+            return profile
+
+        if hashes is None or len(hashes) != count or None in hashes:
+            hashes = []
+            for path in profile["image_paths"]:
+                try:
+                    hashes.append(self._image_hash(path))
+                except OSError:
+                    hashes.append(f"missing:{path}")
+        if entry_ids is None or len(entry_ids) != count:
+            entry_ids = [None] * count
+        profile["image_hashes"] = hashes
+        profile["entry_ids"] = [entry_id or uuid4().hex for entry_id in entry_ids]
+        self.profile_store.append({"op": "put", "name": name, "profile": profile})
+        return profile
+
+    def _update_gallery(self, name: str, embeddings: Optional[List[List[float]]]) -> None:
+        """Replace a person's embeddings in the search gallery (None removes them)."""
+        model_name = self.family_profiles.get(name, {}).get("model_name")
+        if self.shared_gallery is not None:
+            self.shared_gallery.replace_person(name, embeddings, model_name)
+            return
+
+        self._local_gallery.remove_person(name)
+        if embeddings and model_name in (None, self._local_gallery.model_name):
+            self._local_gallery.add_person(name, embeddings)
+        self._gallery_mutations += 1
+
+    def _append_gallery(self, name: str, embeddings: List[List[float]]) -> None:
+        """Append new embeddings for a person to the search gallery."""
+        if self.shared_gallery is not None:
+            profile = self.family_profiles[name]
+            self.shared_gallery.replace_person(name, profile["embeddings"], profile["model_name"])
+            return
+
+        self._local_gallery.add_person(name, embeddings)
+        self._gallery_mutations += 1
+
+    @staticmethod
+    def _profile_key(profile: Optional[Dict]) -> Optional[Tuple]:
+        """Cheap identity of a profile's contents, to tell whether a reload changed it."""
+        if profile is None:
+            return None
+        return (profile.get("model_name"), len(profile["embeddings"]),
+                tuple(profile.get("image_hashes") or ()), tuple(profile.get("entry_ids") or ()))
+
+    def _reload_profile(self, name: str) -> Optional[Dict]:
+        """
+        Replace this process's copy of a profile with the stored one.
+
+        Other processes (pre-fork workers, the CLI) log changes to the same
+        profile store, so every mutation starts from the stored state rather
+        than from what this process last saw. Must be called with the profile
+        store lock held.
+
+        Returns:
+            The stored profile, or None if it does not exist
+        """
+        previous = self.family_profiles.get(name)
+        profile = self.profile_store.load_profile(name)
+        if profile is None:
+            self.family_profiles.pop(name, None)
+        else:
+            self.family_profiles[name] = profile
+        if self._profile_key(previous) != self._profile_key(profile):
+            # Profiles still on another model stay out of the gallery
+            current = profile is not None and profile.get("model_name", self.model_name) == self.model_name
+            self._update_gallery(name, profile["embeddings"] if current else None)
+        return profile
+
+    def _reload_profiles(self) -> None:
+        """Replace this process's copy of every profile with the stored ones (store lock held)."""
+        self.family_profiles = self.profile_store.load()
+
+    @synchronized
+    def switch_model(self, model_name: str, profiles: Dict[str, Dict]) -> None:
+        """
+        Atomically switch the live gallery to embeddings from another model.
+
+        Args:
+            model_name: Model the new embeddings were computed with
+            profiles: Re-embedded profiles keyed by name; profiles not included
+                stay on their old model and drop out of the gallery
+        """
+        self._reload_profiles()
+        for name, profile in profiles.items():
+            self.profile_store.append({"op": "put", "name": name, "profile": profile})
+        self.family_profiles.update(profiles)
+
+        # Build the new gallery completely before swapping it in
+        gallery = EmbeddingGallery.from_profiles(self.family_profiles, self.distance_metric, model_name)
+        if self.shared_gallery is not None:
+            self.shared_gallery.publish(gallery)
+        else:
+            self._local_gallery = gallery
+
+        if self.pending_model_name == model_name:
+            self.pending_model_name = None
+        print(f"Switched gallery to {model_name} with {len(gallery)} embeddings.")
+
+    def start_model_migration(self,
+                              target_model: Optional[str] = None,
+                              throttle_seconds: float = 0.5,
+                              drop_unusable: bool = False) -> ReembedMigration:
+        """
+        Re-embed all stored profile images with another model in the background.
+
+        Identification keeps serving from the current model until the
+        migration completes and switches the gallery over.
+
+        Args:
+            target_model: Model to migrate to (defaults to the model requested at construction)
+            throttle_seconds: Pause between images to leave CPU for live requests
+            drop_unusable: Switch even if some profiles have no image usable with
+                the target model, leaving those people out of the gallery
+
+        Returns:
+            The running migration, whose status() reports progress
+        """
+        target_model = target_model or self.pending_model_name
+        if not target_model or target_model == self.model_name:
+            raise ValueError("No model migration pending.")
+        if self.migration is not None and self.migration.status()["running"]:
+            raise ValueError(f"Migration to {self.migration.target_model} already running.")
+
+        self.migration = ReembedMigration(self, target_model, throttle_seconds=throttle_seconds,
+                                          drop_unusable=drop_unusable)
+        self.migration.start()
+        print(f"Started background re-embedding from {self.model_name} to {target_model}.")
+        return self.migration
+
+    @synchronized
     def create_profile(self, name: str, image_paths: List[str]) -> Dict:
         """
         Create a new family member profile.
@@ -140,23 +525,29 @@ class FamilyRecognitionSystem:
         Returns:
             The created profile
         """
+        self._reload_profile(name)
         if name in self.family_profiles:
-            print(f"Profile for {name} already exists. Updating profile.")
+            print(f"Profile for {name} already exists. Adding images to profile.")
+            return self.add_images(name, image_paths)
 
+        model_name = self.model_name
         embeddings = []
         valid_paths = []
+        image_hashes = []
 
         for idx, img_path in enumerate(image_paths):
             try:
-                embedding = DeepFace.represent(
-                    img_path=img_path,
-                    model_name=self.model_name,
-                    enforce_detection=True
-                )
+                image_hash = self._image_hash(img_path)
+                if image_hash in image_hashes:
+                    print(f"Skipping duplicate image {img_path}")
+                    continue
+
+                embedding = self._represent(img_path, model_name)
                 # Save a permanent copy of the image
                 saved_path = self._save_profile_image(img_path, name, idx)
-                embeddings.append(embedding[0]["embedding"])
+                embeddings.append(embedding)
                 valid_paths.append(saved_path)
+                image_hashes.append(image_hash)
             except Exception as e:
                 print(f"Could not process image {img_path}: {e}")
 
@@ -167,65 +558,273 @@ class FamilyRecognitionSystem:
             "name": name,
             "embeddings": embeddings,
             "image_paths": valid_paths,
-            "model_name": self.model_name
+            "image_hashes": image_hashes,
+            "entry_ids": [uuid4().hex for _ in embeddings],
+            "model_name": model_name
         }
 
         # Save profile
+        self.profile_store.append({"op": "put", "name": name, "profile": profile})
         self.family_profiles[name] = profile
-        with open(f"{self.profiles_dir}/{name}.pkl", "wb") as f:
-            pickle.dump(profile, f)
+        self._update_gallery(name, embeddings)
+        self.compact_profile(name)
 
-        print(f"Created profile for {name} with {len(embeddings)} face embeddings.")
+        # Compaction may have replaced the profile; report what was kept
+        profile = self.family_profiles[name]
+        print(f"Created profile for {name} with {len(profile['embeddings'])} face embeddings.")
         return profile
 
-    def identify_face(self, image_path: str) -> Tuple[Optional[str], float]:
+    @synchronized
+    def add_images(self, name: str, image_paths: List[str]) -> Dict:
         """
-        Identify a face in an image.
+        Add images to a family member profile, creating it if needed.
+
+        Only images whose content is not already part of the profile are
+        embedded, so each call costs one embedding per new photo.
 
         Args:
-            image_path: Path to the image
+            name: Name of the family member
+            image_paths: List of paths to new images of the family member
 
         Returns:
-            Tuple of (identified_name, confidence)
+            The updated profile
+        """
+        self._reload_profile(name)
+        model_name = self.model_name
+        if name in self.family_profiles and self.family_profiles[name].get("model_name", model_name) != model_name:
+            raise ValueError(f"Profile for {name} was embedded with {self.family_profiles[name]['model_name']}; "
+                             f"re-embed it before adding {model_name} images.")
+
+        known_hashes = set(self._ensure_image_keys(name)["image_hashes"]) if name in self.family_profiles else set()
+        next_index = self._next_image_index(name)
+
+        embeddings = []
+        valid_paths = []
+        image_hashes = []
+
+        for img_path in image_paths:
+            try:
+                image_hash = self._image_hash(img_path)
+                if image_hash in known_hashes:
+                    print(f"Skipping duplicate image {img_path}")
+                    continue
+
+                embedding = self._represent(img_path, model_name)
+                # Save a permanent copy of the image
+                saved_path = self._save_profile_image(img_path, name, next_index)
+                next_index += 1
+                embeddings.append(embedding)
+                valid_paths.append(saved_path)
+                image_hashes.append(image_hash)
+                known_hashes.add(image_hash)
+            except Exception as e:
+                print(f"Could not process image {img_path}: {e}")
+
+        if name not in self.family_profiles and not embeddings:
+            raise ValueError("No valid faces detected in provided images.")
+
+        if embeddings:
+            entry_ids = [uuid4().hex for _ in embeddings]
+            self.profile_store.append({
+                "op": "add",
+                "name": name,
+                "embeddings": embeddings,
+                "image_paths": valid_paths,
+                "image_hashes": image_hashes,
+                "entry_ids": entry_ids,
+                "model_name": model_name
+            })
+            profile = self.family_profiles.setdefault(name, {
+                "name": name,
+                "embeddings": [],
+                "image_paths": [],
+                "image_hashes": [],
+                "entry_ids": [],
+                "model_name": model_name
+            })
+            profile["embeddings"].extend(embeddings)
+            profile["image_paths"].extend(valid_paths)
+            profile["image_hashes"].extend(image_hashes)
+            profile["entry_ids"].extend(entry_ids)
+            self._append_gallery(name, embeddings)
+            self.compact_profile(name)
+
+        profile = self.family_profiles[name]
+        print(f"Added {len(embeddings)} new face embeddings to {name} ({len(profile['embeddings'])} total).")
+        return profile
+
+    @synchronized
+    def remove_images(self, name: str, image_indices: List[int], delete_files: bool = True) -> Dict:
         """
+        Remove images from a family member profile.
+
+        Args:
+            name: Name of the family member
+            image_indices: Indices of the images to remove, as reported by identify_face_topk
+            delete_files: Also delete the removed photos from disk; compaction keeps them
+
+        Returns:
+            The updated profile
+        """
+        self._reload_profile(name)
+        if name not in self.family_profiles:
+            raise ValueError(f"Profile for {name} does not exist.")
+
+        profile = self._ensure_image_keys(name)
+        hashes, entry_ids = profile["image_hashes"], profile["entry_ids"]
+        remove = sorted({i for i in image_indices if 0 <= i < len(hashes)})
+        if not remove:
+            return profile
+        if len(remove) == len(hashes):
+            raise ValueError(f"Cannot remove every image of {name}; delete the profile instead.")
+
+        removed_paths = [profile["image_paths"][i] for i in remove]
+        self.profile_store.append({
+            "op": "remove",
+            "name": name,
+            "entry_ids": [entry_ids[i] for i in remove]
+        })
+
+        keep = [i for i in range(len(hashes)) if i not in remove]
+        profile["embeddings"] = [profile["embeddings"][i] for i in keep]
+        profile["image_paths"] = [profile["image_paths"][i] for i in keep]
+        profile["image_hashes"] = [hashes[i] for i in keep]
+        profile["entry_ids"] = [entry_ids[i] for i in keep]
+        self._update_gallery(name, profile["embeddings"])
+
+        if delete_files:
+            for path in removed_paths:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except Exception as e:
+                    print(f"Error deleting image {path}: {e}")
+
+        print(f"Removed {len(remove)} images from {name} ({len(profile['embeddings'])} remaining).")
+        return profile
+
+    @synchronized
+    def compact_profile(self, name: str) -> Dict:
+        """
+        Drop near-duplicate embeddings of a person and cap them at a diverse subset.
+
+        Args:
+            name: Name of the family member
+
+        Returns:
+            Report with the embedding counts before/after and the resulting
+            drop in match score for the removed vectors
+        """
+        profile = self._reload_profile(name)
+        if profile is None:
+            raise ValueError(f"Profile for {name} does not exist.")
+
+        keep, report = select_representatives(
+            profile["embeddings"],
+            max_similarity=self.dedupe_similarity,
+            max_count=self.max_embeddings_per_person
+        )
+        kept = set(keep)
+        removed = [i for i in range(len(profile["embeddings"])) if i not in kept]
+        if removed:
+            # Only the embeddings go; the family's photos stay on disk
+            self.remove_images(name, removed, delete_files=False)
+        return report
+
+    def compact_profiles(self) -> Dict:
+        """
+        Compact every profile in the gallery.
+
+        Returns:
+            Report with the gallery size before/after and per-person results
+        """
+        people = {}
+        for name in list(self.refresh_profiles()):
+            try:
+                people[name] = self.compact_profile(name)
+            except ValueError:
+                # Deleted by another process since this one loaded its profiles
+                continue
+
+        before = sum(r["before"] for r in people.values())
+        after = sum(r["after"] for r in people.values())
+        report = {
+            "gallery_before": before,
+            "gallery_after": after,
+            "reduction": 1.0 - after / before if before else 0.0,
+            "max_score_drop": max((r["max_score_drop"] for r in people.values()), default=0.0),
+            "people": people
+        }
+        print(f"Compacted gallery from {before} to {after} embeddings.")
+        return report
+
+    def _rank_candidates(self,
+                         image_path: str,
+                         k: int,
+                         names: Optional[List[str]] = None) -> Optional[List[Tuple[str, float, int]]]:
+        """
+        Embed the face in an image and rank it against the gallery.
+
+        Returns:
+            Ranked (name, similarity, image_index) tuples, or None if no face was detected
+
+        Raises:
+            FaceQualityError: If the detected face is too poor to embed
+        """
+        # Embed with the model of the gallery we search, even if a model switch happens meanwhile
+        gallery = self.gallery
         try:
             # Get embedding for the input face
-            embedding = DeepFace.represent(
-                img_path=image_path,
-                model_name=self.model_name,
-                enforce_detection=True
-            )
-            input_embedding = embedding[0]["embedding"]
+            input_embedding = self._represent(image_path, gallery.model_name)
+        except FaceQualityError:
+            raise
         except Exception as e:
             print(f"Error detecting face: {e}")
-            return None, 0.0
+            return None
 
-        if not self.family_profiles:
+        if not len(gallery):
             print("No family profiles available.")
+            return []
+
+        # Compare with all family members in a single vectorized pass
+        return gallery.search(input_embedding, k=k, names=names)
+
+    def identify_face(self, image_path: str) -> Tuple[Optional[str], float]:
+        """
+        Identify a face in an image.
+
+        Args:
+            image_path: Path to the image
+
+        Returns:
+            Tuple of (identified_name, confidence)
+        """
+        match = self.match_face(image_path)
+        if match is None:
             return None, 0.0
+        return match
 
-        best_match = None
-        best_similarity = 0.0
-
-        # Compare with all family members
-        for name, profile in self.family_profiles.items():
-            for stored_embedding in profile["embeddings"]:
-                print(f"Comparing {image_path} with {profile['image_paths'][0]}")
-                # Calculate similarity (1 - distance)
-                result = DeepFace.verify(
-                    img1_path=image_path,
-                    img2_path=profile["image_paths"][0],  # Use first image as reference
-                    model_name=self.model_name,
-                    distance_metric=self.distance_metric,
-                    enforce_detection=False  # Already verified there's a face
-                )
+    def match_face(self, image_path: str) -> Optional[Tuple[Optional[str], float]]:
+        """
+        Identify a face in an image, telling an unmatched face apart from no face.
+
+        Args:
+            image_path: Path to the image
 
-                # Convert distance to similarity
-                similarity = 1.0 - result["distance"]
+        Returns:
+            Tuple of (identified_name or None if nobody matched, confidence),
+            or None if no face was detected
 
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = name
+        Raises:
+            FaceQualityError: If the detected face is too poor to embed
+        """
+        candidates = self._rank_candidates(image_path, k=1)
+        if candidates is None:
+            return None
+        if not candidates:
+            return None, 0.0
+
+        best_match, best_similarity, _ = candidates[0]
 
         # Check if best match exceeds threshold
         if best_similarity > (1.0 - self.threshold):
@@ -233,16 +832,41 @@ class FamilyRecognitionSystem:
         else:
             return None, best_similarity
 
+    def identify_face_topk(self,
+                           image_path: str,
+                           k: int = 5,
+                           threshold: Optional[float] = None,
+                           names: Optional[List[str]] = None) -> List[Tuple[str, float, int]]:
+        """
+        Identify a face and return the ranked runner-up candidates as well.
+
+        Args:
+            image_path: Path to the image
+            k: Maximum number of family members to return
+            threshold: Distance threshold overriding the system default for this request
+            names: Optional subset of family member names to search
+
+        Returns:
+            List of (name, similarity, image_index) tuples above the threshold, best first
+        """
+        if threshold is None:
+            threshold = self.threshold
+
+        candidates = self._rank_candidates(image_path, k=k, names=names) or []
+        return [c for c in candidates if c[1] > (1.0 - threshold)]
+
     def list_profiles(self):
         """List all stored family profiles."""
-        if not self.family_profiles:
+        profiles = self.refresh_profiles()
+        if not profiles:
             print("No family profiles have been created yet.")
             return
 
-        print(f"Found {len(self.family_profiles)} family profiles:")
-        for name, profile in self.family_profiles.items():
+        print(f"Found {len(profiles)} family profiles:")
+        for name, profile in profiles.items():
             print(f"- {name}: {len(profile['embeddings'])} face images")
 
+    @synchronized
     def delete_profile(self, name: str) -> bool:
         """
         Delete a family member profile.
@@ -253,31 +877,86 @@ class FamilyRecognitionSystem:
         Returns:
             bool: True if profile was deleted successfully, False if profile doesn't exist
         """
+        self._reload_profile(name)
         if name not in self.family_profiles:
             print(f"Profile for {name} does not exist.")
             return False
 
+        try:
+            # Log the deletion first; it is committed once the record is durable
+            self.profile_store.append({"op": "delete", "name": name})
+        except Exception as e:
+            print(f"Error deleting profile: {e}")
+            return False
+
         # Remove profile from memory
-        profile = self.family_profiles.pop(name)
+        self.family_profiles.pop(name)
+        self._update_gallery(name, None)
 
+        # Delete the profile images directory (redone on startup if interrupted)
+        person_images_dir = os.path.join(self.profile_images_dir, name)
         try:
-            # Delete the profile file
-            profile_path = os.path.join(self.profiles_dir, f"{name}.pkl")
-            os.remove(profile_path)
-
-            # Delete the profile images directory
-            person_images_dir = os.path.join(self.profile_images_dir, name)
             if os.path.exists(person_images_dir):
                 shutil.rmtree(person_images_dir)
+        except Exception as e:
+            print(f"Error deleting images for {name}: {e}")
 
-            print(f"Deleted profile and images for {name}")
-            return True
+        print(f"Deleted profile and images for {name}")
+        return True
+
+    @synchronized
+    def rename_profile(self, name: str, new_name: str) -> bool:
+        """
+        Rename a family member profile.
+
+        Args:
+            name: Current name of the family member
+            new_name: New name for the family member
+
+        Returns:
+            bool: True if profile was renamed successfully, False otherwise
+        """
+        self._reload_profile(name)
+        self._reload_profile(new_name)
+        if name not in self.family_profiles:
+            print(f"Profile for {name} does not exist.")
+            return False
+        if new_name in self.family_profiles:
+            print(f"Profile for {new_name} already exists.")
+            return False
+
+        old_dir = os.path.join(self.profile_images_dir, name)
+        new_dir = os.path.join(self.profile_images_dir, new_name)
+        profile = self.family_profiles[name]
+        new_paths = [
+            os.path.join(new_dir, os.path.basename(path)) if os.path.dirname(path) == old_dir else path
+            for path in profile["image_paths"]
+        ]
+
+        try:
+            self.profile_store.append({
+                "op": "rename",
+                "name": name,
+                "new_name": new_name,
+                "image_paths": new_paths
+            })
         except Exception as e:
-            # If deletion fails, restore profile in memory
-            self.family_profiles[name] = profile
-            print(f"Error deleting profile: {e}")
+            print(f"Error renaming profile: {e}")
             return False
 
+        # Move the profile in memory and its images on disk (redone on startup if interrupted)
+        profile = self.family_profiles.pop(name)
+        profile["name"] = new_name
+        profile["image_paths"] = new_paths
+        self.family_profiles[new_name] = profile
+        self._update_gallery(name, None)
+        self._update_gallery(new_name, profile["embeddings"])
+        if os.path.exists(old_dir) and not os.path.exists(new_dir):
+            os.rename(old_dir, new_dir)
+
+        print(f"Renamed profile {name} to {new_name}")
+        return True
+
 
 # Define your models
 class Request(Model):
@@ -292,19 +971,37 @@ class Response(Model):
 # --------------------
 
 class FaceRecognitionAgent:
-    def __init__(self, face_system: FamilyRecognitionSystem, api_key: str):
+    def __init__(self,
+                 face_system: FamilyRecognitionSystem,
+                 api_key: str,
+                 llm=None,
+                 use_router: bool = True,
+                 use_cache: bool = True):
         """
         Initialize the Face Recognition Agent with LangChain.
 
         Args:
             face_system: FamilyRecognitionSystem instance
             api_key: Google API key for LangChain
+            llm: Language model to use instead of Gemini (e.g. a local stub for testing)
+            use_router: Answer structured requests by calling the tools directly, without the LLM
+            use_cache: Reuse answers and LLM completions while the gallery is unchanged
         """
         self.face_system = face_system
         self.api_key = api_key
         self.tools = self._create_tools()
-        self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro", temperature=0, google_api_key=api_key)
+        self.llm = llm or ChatGoogleGenerativeAI(model="gemini-1.5-pro", temperature=0, google_api_key=api_key)
+
+        self.answer_cache = None
+        self.llm_cache = None
+        if use_cache:
+            self.answer_cache = ResponseCache(ttl_seconds=AGENT_CACHE_TTL, persist_path=AGENT_CACHE_PATH,
+                                              table="agent_answers")
+            self.llm_cache = ResponseCache(ttl_seconds=AGENT_CACHE_TTL, persist_path=AGENT_CACHE_PATH,
+                                           table="llm_responses")
+            self.llm.cache = LLMResponseCache(self.llm_cache, lambda: self.face_system.gallery_version)
         self.agent_executor = self._create_agent()
+        self.router = IntentRouter({t.name: t.invoke for t in self.tools}) if use_router else None
 
     def _create_tools(self):
         """Create tools for the LangChain agent."""
@@ -342,13 +1039,38 @@ class FaceRecognitionAgent:
             except Exception as e:
                 return f"Error identifying person: {str(e)}"
 
+        @tool
+        def rank_family_candidates(query: str) -> str:
+            """
+            Rank the most likely family members for a face in an image, including runner-ups.
+            Input should be JSON string with 'image_path' and optional 'k', 'threshold' and 'names'.
+            Example: '{"image_path": "/path/to/image.jpg", "k": 3, "names": ["John", "Mary"]}'
+            """
+            try:
+                data = json.loads(query)
+                candidates = self.face_system.identify_face_topk(
+                    data["image_path"],
+                    k=int(data.get("k", 3)),
+                    threshold=data.get("threshold"),
+                    names=data.get("names")
+                )
+                if not candidates:
+                    return "No matching family member found."
+
+                result = f"Found {len(candidates)} candidate(s):\n"
+                for rank, (name, similarity, image_index) in enumerate(candidates, start=1):
+                    result += f"{rank}. {name} (confidence: {similarity:.2f}, matched image #{image_index})\n"
+                return result
+            except Exception as e:
+                return f"Error ranking candidates: {str(e)}"
+
         @tool
         def list_family_members(dummy: str = "") -> str:
             """
             List all family members with profiles.
             No input required.
             """
-            profiles = self.face_system.family_profiles
+            profiles = self.face_system.refresh_profiles()
             if not profiles:
                 return "No family profiles have been created yet."
 
@@ -357,7 +1079,7 @@ class FaceRecognitionAgent:
                 result += f"- {name}: {len(profile['embeddings'])} face images\n"
             return result
 
-        return [create_family_profile, identify_person, list_family_members]
+        return [create_family_profile, identify_person, rank_family_candidates, list_family_members]
 
     def _create_agent(self):
         """Create the LangChain agent."""
@@ -398,8 +1120,48 @@ class FaceRecognitionAgent:
         return agent_executor
 
     def run(self, query: str):
-        """Run the agent with a query."""
-        return self.agent_executor.invoke({"input": query})
+        """
+        Run the agent with a query.
+
+        Structured requests (JSON tool payloads, "list family members",
+        "identify <image path>", "create profile for <name> with <paths>")
+        are answered by the intent router without calling the LLM; everything
+        else goes through the ReAct agent.
+        """
+        if self.router is not None:
+            routed = self.router.route(query)
+            if routed is not None:
+                return routed
+
+        if self.answer_cache is None:
+            return self.agent_executor.invoke({"input": query})
+
+        key = self._answer_key(query)
+        cached = self.answer_cache.get(key)
+        if cached is not None:
+            return {"input": query, "output": cached, "cached": True}
+
+        result = self.agent_executor.invoke({"input": query})
+        if isinstance(result.get("output"), str):
+            self.answer_cache.put(key, result["output"])
+        return result
+
+    def _answer_key(self, query: str) -> str:
+        """Cache key from the normalized query, the gallery version and any images it names."""
+        images = []
+        for path in re.findall(IMAGE_PATH, query, re.IGNORECASE):
+            try:
+                st = os.stat(path)
+                images.append((path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                images.append((path, None, None))
+        return make_key("agent", normalize_query(query), self.face_system.gallery_version, images)
+
+    def cache_stats(self) -> Dict:
+        """Hit rates of the answer and LLM caches."""
+        if self.answer_cache is None:
+            return {}
+        return {"answers": self.answer_cache.stats(), "llm": self.llm_cache.stats()}
 
 
 # Helper Functions
@@ -447,7 +1209,7 @@ def process_new_profiles(face_system: 'FamilyRecognitionSystem') -> None:
             print(f"Found {len(images)} images")
             
             # Create profile
-            profile = face_system.create_profile(person_name, images)
+            profile, _ = request_profiler.run('create_profile', None, face_system.create_profile, person_name, images)
             print(f"Successfully created profile for {person_name}")
             
             # Delete processed images
@@ -470,6 +1232,44 @@ def process_new_profiles(face_system: 'FamilyRecognitionSystem') -> None:
                 except Exception as move_error:
                     print(f"Error moving failed image {image_path}: {move_error}")
 
+def start_profile_monitor(face_system: 'FamilyRecognitionSystem',
+                          stop_event: Optional[threading.Event] = None,
+                          interval: float = PROFILE_MONITOR_INTERVAL) -> threading.Thread:
+    """
+    Enroll photos saved to the watch directory from a background thread.
+
+    Every serving process may start the monitor, but only the one holding an
+    exclusive lock on the watch directory's .monitor.lock processes images,
+    so each photo is enrolled once. If that process exits, another one takes
+    over on its next check.
+    """
+    stop_event = stop_event or threading.Event()
+
+    def monitor():
+        with open(os.path.join(WATCH_DIR, ".monitor.lock"), "a") as lock_file:
+            owner = False
+            while not stop_event.is_set():
+                if not owner:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        owner = True
+                    except BlockingIOError:
+                        pass
+                if owner:
+                    try:
+                        process_new_profiles(face_system)
+                    except Exception as e:
+                        print(f"Error in profile monitoring: {e}")
+                stop_event.wait(interval)
+
+    thread = threading.Thread(target=monitor, name="profile-monitor", daemon=True)
+    thread.start()
+    return thread
+
+# Set by init_system() or by the server entry points
+face_system: Optional['FamilyRecognitionSystem'] = None
+agent: Optional['FaceRecognitionAgent'] = None
+
 def init_system(api_key):
     """Initialize the face recognition system and agent."""
     global face_system, agent
@@ -511,40 +1311,102 @@ def save_base64_image(base64_string: str) -> str:
         logger.error(f"Error saving base64 image: {e}")
         raise
 
-@app.route('/api/identify', methods=['POST'])
-def identify_face_endpoint():
-    """Handle face identification from base64 image."""
+# Opt-in profiling of identify and enrollment calls
+request_profiler = RequestProfiler(
+    REQUEST_PROFILES_DIR,
+    enabled=PROFILING_ENABLED,
+    sample_every=PROFILE_SAMPLE_EVERY
+)
+
+# Background audit archive of identify payloads
+payload_archiver = PayloadArchiver(
+    BASE64_IMAGES_DIR,
+    retention_seconds=ARCHIVE_RETENTION_DAYS * 24 * 3600,
+    max_total_bytes=ARCHIVE_MAX_BYTES
+)
+
+# Bounded in-flight queue in front of the CPU-bound model
+identify_admission = AdmissionController(max_in_flight=IDENTIFY_MAX_IN_FLIGHT, max_queue=IDENTIFY_MAX_QUEUE)
+
+def admission_controlled(view):
+    """
+    Run a view only once the admission controller grants it a slot.
+
+    Clients are identified by the X-Client-Id header (falling back to the
+    remote address) and may pass X-Request-Deadline or X-Request-Timeout.
+    Over capacity the request fails fast with 429 and Retry-After; if the
+    deadline passes while queued it is dropped with 504.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        client_id = request.headers.get('X-Client-Id') or request.remote_addr
+        try:
+            with identify_admission.slot(client_id, parse_deadline(request.headers)):
+                return view(*args, **kwargs)
+        except AdmissionRejected as e:
+            response = jsonify({'error': str(e)})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        except DeadlineExceeded as e:
+            return jsonify({'error': str(e)}), 504
+    return wrapper
+
+def identify_request(payload: Optional[Dict]) -> Tuple[Dict, int]:
+    """
+    Handle an identify request body.
+
+    Shared by the Flask view and the ASGI server (asgi_server.py) so both
+    serve the same API.
+
+    Args:
+        payload: Parsed JSON body with 'image' and optional 'top_k', 'threshold' and 'names'
+
+    Returns:
+        Tuple of (response body, HTTP status)
+    """
     try:
         # Check if base64 image is in request
-        if not request.json or 'image' not in request.json:
-            return jsonify({'error': 'No base64 image provided'}), 400
+        if not payload or 'image' not in payload:
+            return {'error': 'No base64 image provided'}, 400
         
-        base64_image = request.json['image']
+        base64_image = payload['image']
         # print(f"Received base64 image: {base64_image}")
         
-        # Save base64 image to JSON file with timestamp
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        json_filename = f"base64_image_{timestamp}.json"
-        json_filepath = os.path.join(BASE64_IMAGES_DIR, json_filename)
-        
-        with open(json_filepath, 'w') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'base64_image': base64_image
-            }, f, indent=2)
-        logger.info(f"Saved base64 image to JSON file: {json_filepath}")
+        # Hand the payload to the background archiver; dropped if it is behind
+        if not payload_archiver.submit({'base64_image': base64_image}):
+            logger.warning("Identify payload archive is behind; payload dropped")
         
         # Save the image
         try:
             filepath = save_base64_image(base64_image)
         except Exception as e:
-            return jsonify({'error': f'Error processing image: {str(e)}'}), 400
+            return {'error': f'Error processing image: {str(e)}'}, 400
         
         # Perform face recognition
+        top_k = payload.get('top_k')
+        candidates = None
         try:
-            name, confidence = face_system.identify_face(filepath)
+            if top_k is not None:
+                candidates = face_system.identify_face_topk(
+                    filepath,
+                    k=int(top_k),
+                    threshold=payload.get('threshold'),
+                    names=payload.get('names')
+                )
+                name, confidence = (candidates[0][0], candidates[0][1]) if candidates else (None, 0.0)
+            else:
+                name, confidence = face_system.identify_face(filepath)
+        except FaceQualityError as e:
+            print(f"Face rejected by quality gate: {e.reason}")
+            return {
+                'success': False,
+                'message': 'Face image quality too low',
+                'reason': e.reason,
+                'confidence': 0.0
+            }, 200
         except Exception as e:
-            return jsonify({'error': f'Error in face recognition: {str(e)}'}), 500
+            return {'error': f'Error in face recognition: {str(e)}'}, 500
         finally:
             # Clean up uploaded file
             try:
@@ -556,64 +1418,170 @@ def identify_face_endpoint():
         # Return results
         if name:
             print(f"Identified as: {name} (confidence: {confidence:.2f})")
-            return jsonify({
+            result = {
                 'success': True,
                 'name': name,
                 'confidence': float(confidence)
-            })
+            }
         else:
             print(f"No matching face found (confidence: {confidence:.2f})")
-            return jsonify({
+            result = {
                 'success': False,
                 'message': 'No matching face found',
                 'confidence': float(confidence)
-            })
+            }
+
+        if candidates is not None:
+            result['candidates'] = [
+                {'name': n, 'confidence': float(c), 'image_index': i}
+                for n, c, i in candidates
+            ]
+        return result, 200
             
     except Exception as e:
         logger.error(f"Error processing request: {e}")
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
 
-@app.route('/api/save-profile-image', methods=['POST'])
-def save_profile_image():
-    """Save base64 image with family member name."""
+def identify_frame(image_bytes: bytes) -> Tuple[Optional[str], float]:
+    """
+    Identify the face in one encoded camera frame of a live stream.
+
+    Unlike identify_request this tells an unmatched face apart from a frame
+    without a face, which the stream needs to report unknown visitors.
+
+    Args:
+        image_bytes: JPEG or PNG encoded frame
+
+    Returns:
+        Tuple of (name, UNKNOWN or None if no face was detected, similarity)
+
+    Raises:
+        FaceQualityError: If the detected face is too poor to embed
+    """
+    filepath = os.path.join(UPLOAD_DIR, f"{uuid4()}.jpeg")
+    Image.open(io.BytesIO(image_bytes)).convert('RGB').save(filepath, 'JPEG')
+    try:
+        match = face_system.match_face(filepath)
+    finally:
+        try:
+            os.remove(filepath)
+        except OSError as e:
+            logger.warning(f"Error cleaning up file {filepath}: {e}")
+
+    if match is None:
+        return None, 0.0
+    name, similarity = match
+    return name or UNKNOWN, similarity
+
+def save_profile_image_request(payload: Optional[Dict]) -> Tuple[Dict, int]:
+    """
+    Handle a save-profile-image request body.
+
+    Args:
+        payload: Parsed JSON body with 'image' and 'name'
+
+    Returns:
+        Tuple of (response body, HTTP status)
+    """
     try:
         # Check if required fields are present
-        if not request.json or 'image' not in request.json or 'name' not in request.json:
-            return jsonify({'error': 'Missing required fields: image and name'}), 400
+        if not payload or 'image' not in payload or 'name' not in payload:
+            return {'error': 'Missing required fields: image and name'}, 400
         
-        base64_image = request.json['image']
-        family_member_name = request.json['name']
+        base64_image = payload['image']
+        family_member_name = payload['name']
         
-        # Save the first image
+        # Save the image
         try:
             filepath1 = save_base64_image(base64_image)
-            # Create destination paths
-            dest_path1 = os.path.join(WATCH_DIR, f"{family_member_name}_1.jpeg")
-            dest_path2 = os.path.join(WATCH_DIR, f"{family_member_name}_2.jpeg")
-            
-            # Copy the file to both destinations
-            shutil.copy2(filepath1, dest_path1)
-            shutil.copy2(filepath1, dest_path2)
+            # Move it into the watch folder under a unique name so uploads never overwrite each other
+            dest_path1 = os.path.join(WATCH_DIR, f"{family_member_name}_{uuid4().hex}.jpeg")
+            shutil.move(filepath1, dest_path1)
             
-            # Clean up the temporary file
-            os.remove(filepath1)
+            logger.info(f"Saved profile image for {family_member_name} at: {dest_path1}")
             
-            logger.info(f"Saved profile images for {family_member_name} at:")
-            logger.info(f"- {dest_path1}")
-            logger.info(f"- {dest_path2}")
-            
-            return jsonify({
+            return {
                 'success': True,
                 'message': f'Successfully saved profile images for {family_member_name}',
-                'paths': [dest_path1, dest_path2]
-            })
+                'paths': [dest_path1]
+            }, 200
             
         except Exception as e:
-            return jsonify({'error': f'Error processing image: {str(e)}'}), 400
+            return {'error': f'Error processing image: {str(e)}'}, 400
             
     except Exception as e:
         logger.error(f"Error processing request: {e}")
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+def collect_stats() -> Dict:
+    """Gather recognition pipeline counters."""
+    stats = {
+        'profiles': len(face_system.refresh_profiles()),
+        'gallery_size': len(face_system.gallery),
+        'model_name': face_system.model_name,
+        'pending_model_name': face_system.pending_model_name
+    }
+    if face_system.migration is not None:
+        stats['migration'] = face_system.migration.status()
+    stats['admission'] = identify_admission.stats()
+    stats['archive'] = payload_archiver.stats()
+    if agent is not None:
+        stats['agent_cache'] = agent.cache_stats()
+    if face_system.quality_gate is not None:
+        stats['quality_gate'] = face_system.quality_gate.stats()
+    return stats
+
+def compact_request() -> Tuple[Dict, int]:
+    """Compact every profile's embeddings and report the gallery-size reduction."""
+    try:
+        return face_system.compact_profiles(), 200
+    except Exception as e:
+        logger.error(f"Error compacting gallery: {e}")
+        return {'error': str(e)}, 500
+
+@app.route('/api/identify', methods=['POST'])
+@admission_controlled
+def identify_face_endpoint():
+    """Handle face identification from base64 image."""
+    (result, status), profile_id = request_profiler.run('identify', request.headers, identify_request, request.json)
+    response = jsonify(result)
+    if profile_id:
+        response.headers['X-Profile-Id'] = profile_id
+    return response, status
+
+@app.route('/api/save-profile-image', methods=['POST'])
+def save_profile_image():
+    """Save base64 image with family member name."""
+    result, status = save_profile_image_request(request.json)
+    return jsonify(result), status
+
+@app.route('/api/stats', methods=['GET'])
+def stats_endpoint():
+    """Report recognition pipeline counters."""
+    return jsonify(collect_stats())
+
+@app.route('/api/compact', methods=['POST'])
+def compact_endpoint():
+    """Compact every profile's embeddings and report the gallery-size reduction."""
+    result, status = compact_request()
+    return jsonify(result), status
+
+@app.route('/api/debug/profiles', methods=['GET'])
+def list_request_profiles():
+    """List stored request profiles, newest first."""
+    if not request_profiler.enabled:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    return jsonify({'profiles': request_profiler.list_profiles()})
+
+@app.route('/api/debug/profiles/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """Return one request profile; ?format=collapsed returns just the collapsed stacks."""
+    profile = request_profiler.get_profile(profile_id) if request_profiler.enabled else None
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'collapsed':
+        return profile['collapsed'], 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify(profile)
 
 @app.route('/camera')
 def camera_page():
@@ -718,13 +1686,12 @@ def main():
                 # Event to signal threads to stop
                 stop_event = threading.Event()
                 
-                def monitor_profiles():
-                    try:
-                        while not stop_event.is_set():
-                            process_new_profiles(face_system)
-                            time.sleep(5)
-                    except Exception as e:
-                        print(f"Error in profile monitoring: {e}")
+                def compact_gallery():
+                    while not stop_event.wait(COMPACTION_INTERVAL):
+                        try:
+                            face_system.compact_profiles()
+                        except Exception as e:
+                            print(f"Error in gallery compaction: {e}")
                 
                 def run_flask():
                     try:
@@ -733,9 +1700,16 @@ def main():
                         print(f"Error in Flask server: {e}")
                 
                 # Start monitoring thread
-                monitor_thread = Thread(target=monitor_profiles)
-                monitor_thread.daemon = True
-                monitor_thread.start()
+                start_profile_monitor(face_system, stop_event)
+                
+                # Re-embed profiles in the background if the configured model changed
+                if face_system.pending_model_name:
+                    face_system.start_model_migration()
+                
+                # Start background compaction thread
+                compaction_thread = Thread(target=compact_gallery)
+                compaction_thread.daemon = True
+                compaction_thread.start()
                 
                 # Start Flask thread
                 flask_thread = Thread(target=run_flask)
@@ -749,6 +1723,7 @@ def main():
                 except KeyboardInterrupt:
                     print("\n🛑 Shutting down all services...")
                     stop_event.set()  # Signal threads to stop
+                    payload_archiver.close()
                     cleanup_uagent("face_recognition_agent")
                     print("✅ All services stopped.")
                     
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# Embedding Gallery for the Family Face Recognition System
+# ========================================================
+
+# Keeps every stored face embedding in one contiguous matrix so that a probe
+# face can be ranked against the whole family in a single vectorized pass.
+#
+# Searches run on request threads while enrollment, the profile monitor and
+# compaction update the gallery. Updates are copy-on-write: they build new
+# arrays and swap them in as one tuple, and a search reads that tuple once,
+# so it never sees a matrix and labels from different versions. Names are
+# only ever appended, so labels from an older version still resolve.
+
+import hashlib
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Iterable
+
+# Metrics that compare directions only, so stored vectors are L2-normalized once
+NORMALIZED_METRICS = ("cosine", "euclidean_l2")
+SUPPORTED_METRICS = NORMALIZED_METRICS + ("euclidean",)
+
+
+class EmbeddingGallery:
+    def __init__(self, distance_metric: str = "cosine", model_name: str = "VGG-Face"):
+        """
+        Initialize an empty embedding gallery.
+
+        Args:
+            distance_metric: Distance metric to use (cosine, euclidean, euclidean_l2)
+            model_name: Face recognition model every stored embedding was computed with
+        """
+        if distance_metric not in SUPPORTED_METRICS:
+            raise ValueError(f"Unsupported distance metric: {distance_metric}")
+
+        self.distance_metric = distance_metric
+        self.model_name = model_name
+        # Row i of the matrix belongs to names[labels[i]] and is the
+        # image_indices[i]-th embedding of that person's profile
+        self.names: List[str] = []
+        self._rows = (np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+
+    @classmethod
+    def from_profiles(cls,
+                      profiles: Dict[str, Dict],
+                      distance_metric: str = "cosine",
+                      model_name: str = "VGG-Face") -> 'EmbeddingGallery':
+        """
+        Build a gallery from the family profiles dictionary.
+
+        Profiles embedded with a different model are left out, since their
+        vectors are not comparable with probes from this model.
+        """
+        gallery = cls(distance_metric, model_name)
+        for name, profile in profiles.items():
+            if profile.get("model_name", model_name) == model_name:
+                gallery.add_person(name, profile["embeddings"])
+        return gallery
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._rows[0]
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._rows[1]
+
+    @property
+    def image_indices(self) -> np.ndarray:
+        return self._rows[2]
+
+    def set_rows(self, matrix: np.ndarray, labels: np.ndarray, image_indices: np.ndarray) -> None:
+        """Swap in a new set of rows in one step."""
+        self._rows = (matrix, labels, image_indices)
+
+    def __len__(self) -> int:
+        return len(self._rows[1])
+
+    def digest(self) -> str:
+        """
+        Digest of the gallery's contents: the model and each person's rows.
+
+        Independent of the order people were added in, so a gallery updated
+        person by person and one rebuilt from the same profiles agree.
+        """
+        matrix, labels, image_indices = self._rows
+        digest = hashlib.sha1(self.model_name.encode())
+        for label, name in sorted(enumerate(self.names), key=lambda item: item[1]):
+            rows = np.flatnonzero(labels == label)
+            if not len(rows):
+                continue
+            rows = rows[np.argsort(image_indices[rows], kind="stable")]
+            digest.update(name.encode() + b"\0")
+            digest.update(np.ascontiguousarray(matrix[rows]).tobytes())
+        return digest.hexdigest()
+
+    def _prepare(self, vectors: Iterable) -> np.ndarray:
+        """Convert embeddings to a float32 matrix, normalized if the metric needs it."""
+        matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.distance_metric in NORMALIZED_METRICS:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+        return matrix
+
+    def add_person(self, name: str, embeddings: List[List[float]]) -> None:
+        """
+        Append embeddings for a person to the gallery.
+
+        Args:
+            name: Name of the family member
+            embeddings: Face embeddings in profile order
+        """
+        if not embeddings:
+            return
+
+        vectors = self._prepare(embeddings)
+        matrix, labels, image_indices = self._rows
+        if name in self.names:
+            label = self.names.index(name)
+            start = int(np.count_nonzero(labels == label))
+        else:
+            label = len(self.names)
+            self.names.append(name)
+            start = 0
+
+        self.set_rows(
+            vectors if not len(labels) else np.vstack([matrix, vectors]),
+            np.concatenate([labels, np.full(len(vectors), label, dtype=np.int32)]),
+            np.concatenate([image_indices, np.arange(start, start + len(vectors), dtype=np.int32)])
+        )
+
+    def remove_person(self, name: str) -> None:
+        """Drop every embedding belonging to a person."""
+        if name not in self.names:
+            return
+
+        matrix, labels, image_indices = self._rows
+        keep = labels != self.names.index(name)
+        self.set_rows(matrix[keep], labels[keep], image_indices[keep])
+
+    def distances(self, embedding: List[float], matrix: Optional[np.ndarray] = None) -> np.ndarray:
+        """Compute the distance from one probe embedding to every stored row (or to matrix's rows)."""
+        matrix = self.matrix if matrix is None else matrix
+        query = self._prepare(embedding)[0]
+        if self.distance_metric == "cosine":
+            return 1.0 - matrix @ query
+        if self.distance_metric == "euclidean_l2":
+            return np.sqrt(np.maximum(2.0 - 2.0 * (matrix @ query), 0.0))
+        return np.linalg.norm(matrix - query, axis=1)
+
+    def search(self,
+               embedding: List[float],
+               k: int = 1,
+               names: Optional[Iterable[str]] = None,
+               min_similarity: Optional[float] = None) -> List[Tuple[str, float, int]]:
+        """
+        Rank family members against a probe embedding.
+
+        Each person appears at most once, represented by their closest stored
+        embedding.
+
+        Args:
+            embedding: Probe face embedding
+            k: Maximum number of candidates to return
+            names: Optional subset of names to restrict the search to
+            min_similarity: Only return candidates whose similarity exceeds this value
+
+        Returns:
+            List of (name, similarity, image_index) tuples, best first
+        """
+        # One consistent version of the rows, even if an update swaps them meanwhile
+        matrix, labels, image_indices = self._rows
+        if not len(labels) or k < 1:
+            return []
+
+        similarities = 1.0 - self.distances(embedding, matrix)
+        rows = np.arange(len(labels))
+
+        if names is not None:
+            allowed = [self.names.index(n) for n in set(names) if n in self.names]
+            rows = rows[np.isin(labels, allowed)]
+        if min_similarity is not None:
+            rows = rows[similarities[rows] > min_similarity]
+        if not len(rows):
+            return []
+
+        # Sort rows by similarity, then keep the first (best) row of each person
+        rows = rows[np.argsort(-similarities[rows], kind="stable")]
+        _, first = np.unique(labels[rows], return_index=True)
+        best_rows = rows[np.sort(first)][:k]
+
+        return [
+            (self.names[labels[row]], float(similarities[row]), int(image_indices[row]))
+            for row in best_rows
+        ]
+
+
+def select_representatives(embeddings: List[List[float]],
+                           max_similarity: float = 0.98,
+                           max_count: Optional[int] = None) -> Tuple[List[int], Dict]:
+    """
+    Choose a diverse subset of one person's embeddings.
+
+    Vectors whose cosine similarity to an already kept vector exceeds
+    max_similarity are dropped as near-duplicates. If more than max_count
+    remain, farthest-point sampling keeps the max_count most spread out.
+
+    Args:
+        embeddings: One person's embeddings in profile order
+        max_similarity: Cosine similarity above which two vectors count as duplicates
+        max_count: Maximum number of embeddings to keep (None for no cap)
+
+    Returns:
+        Tuple of (indices to keep in profile order, report) where the report
+        holds the before/after sizes and how much the best match score of any
+        original vector drops when only the kept vectors remain
+    """
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    similarity = matrix @ matrix.T
+
+    # Greedy near-duplicate removal, keeping the earliest image of each group
+    kept = []
+    for i in range(len(matrix)):
+        if not kept or similarity[i, kept].max() <= max_similarity:
+            kept.append(i)
+
+    # Farthest-point sampling: start from the vector closest to the mean and
+    # repeatedly add the vector least similar to everything selected so far
+    if max_count is not None and len(kept) > max(1, max_count):
+        candidates = np.array(kept)
+        centroid = matrix[candidates].mean(axis=0)
+        selected = [int(candidates[np.argmax(matrix[candidates] @ centroid)])]
+        closest = similarity[candidates, selected[0]].copy()
+        while len(selected) < max_count:
+            pick = int(np.argmin(closest))
+            selected.append(int(candidates[pick]))
+            closest = np.maximum(closest, similarity[candidates, selected[-1]])
+        kept = sorted(selected)
+
+    # Every original vector scored 1.0 against itself; now it scores its best kept neighbour
+    retained = similarity[:, kept].max(axis=1)
+    report = {
+        "before": len(matrix),
+        "after": len(kept),
+        "mean_score_drop": float(np.mean(1.0 - retained)),
+        "max_score_drop": float(np.max(1.0 - retained)),
+    }
+    return kept, report
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Live Identification Stream
+# ==========================
+
+# Per-connection state for the /api/stream WebSocket of the ASGI server. The
+# camera page pushes JPEG frames as binary messages and the server answers
+# with recognition events only when the scene changes: a family member
+# entered, a family member left, or an unknown face appeared. A change must
+# be seen in a few consecutive frames before it is reported, so a single
+# misread frame does not produce an entered/left pair.
+#
+# Flow control: a connection holds at most one frame waiting for recognition.
+# A frame arriving while an older one is still waiting replaces it, so a
+# client that sends faster than the model keeps up with loses stale frames
+# instead of building a queue.
+
+import time
+import asyncio
+from typing import Dict, List, Optional
+
+UNKNOWN = "__unknown__"  # Observation of a face that matches no family member
+CONFIRM_FRAMES = 2  # Consecutive frames a change must be seen in before it is reported
+
+
+class LatestFrameSlot:
+    """Single-slot mailbox between a connection's reader and its recognition worker."""
+
+    def __init__(self):
+        self._frame: Optional[bytes] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame: bytes) -> None:
+        """Offer a frame, replacing (and dropping) any frame still waiting."""
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self.received += 1
+        self._ready.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Wait for the next frame; returns None once the slot is closed and empty."""
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+    def close(self) -> None:
+        """Stop accepting frames; a frame still waiting is dropped."""
+        if self._frame is not None:
+            self.dropped += 1
+            self._frame = None
+        self._closed = True
+        self._ready.set()
+
+
+class IdentificationStream:
+    def __init__(self, confirm_frames: int = CONFIRM_FRAMES):
+        """
+        Initialize the scene state of one stream.
+
+        Args:
+            confirm_frames: Consecutive frames a change must be seen in before it is reported
+        """
+        self.confirm_frames = max(1, confirm_frames)
+        self.current: Optional[str] = None  # Confirmed observation: a name, UNKNOWN or None (no face)
+        self.confidence = 0.0
+        self._candidate: Optional[str] = None
+        self._candidate_frames = 0
+        self.frames = 0
+        self.events = 0
+
+    def update(self, observation: Optional[str], confidence: float = 0.0) -> List[Dict]:
+        """
+        Feed the recognition result of one frame.
+
+        Args:
+            observation: Identified name, UNKNOWN for an unmatched face, or None if no face was found
+            confidence: Similarity of the best match
+
+        Returns:
+            Events caused by this frame (usually none)
+        """
+        self.frames += 1
+        if observation == self.current:
+            self._candidate, self._candidate_frames = None, 0
+            self.confidence = confidence
+            return []
+
+        if observation == self._candidate:
+            self._candidate_frames += 1
+        else:
+            self._candidate, self._candidate_frames = observation, 1
+        if self._candidate_frames < self.confirm_frames:
+            return []
+
+        events = []
+        now = time.time()
+        if self.current not in (None, UNKNOWN):
+            events.append({"event": "left", "name": self.current, "timestamp": now})
+        if observation == UNKNOWN:
+            events.append({"event": "unknown", "confidence": float(confidence), "timestamp": now})
+        elif observation is not None:
+            events.append({"event": "entered", "name": observation,
+                           "confidence": float(confidence), "timestamp": now})
+
+        self.current, self.confidence = observation, confidence
+        self._candidate, self._candidate_frames = None, 0
+        self.events += len(events)
+        return events
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Fast-Path Intent Router for the Face Recognition Agent
+# ======================================================
+
+# Answers structured requests to the agent by calling the matching tool
+# directly, without a round trip through the LLM. Recognised are JSON
+# payloads (an explicit {"tool": ..., "input": ...} or the fields a tool
+# takes) and plain commands such as "list family members", "identify
+# /path/to/photo.jpg" or "create profile for Ann with a.jpg b.jpg". Anything
+# the rules do not match unambiguously returns None and is left to the LLM.
+
+import re
+import json
+from typing import Callable, Dict, List, Optional
+
+IMAGE_PATH = r"\S+\.(?:jpe?g|png|bmp|webp)"
+
+LIST_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:list|show)(?:\s+(?:me|all|the|my|every))*"
+    r"\s+(?:family\s+members|family\s+profiles|profiles|family)\s*[.?!]?\s*$"
+    r"|^\s*who\s+(?:is|are)\s+in\s+(?:my|the)\s+family\s*[.?!]?\s*$",
+    re.IGNORECASE
+)
+IDENTIFY_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:identify|recognize|recognise|who\s+is(?:\s+this)?)"
+    r"(?:\s+(?:the\s+)?(?:person|face|people))?(?:\s+(?:in|on|from))?(?:\s+(?:the\s+)?(?:image|photo|picture))?"
+    rf"\s+['\"]?(?P<path>{IMAGE_PATH})['\"]?\s*[.?!]?\s*$",
+    re.IGNORECASE
+)
+CREATE_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:create|add|enroll|enrol)(?:\s+a)?(?:\s+new)?\s+(?:family\s+)?(?:profile|member)"
+    r"\s+(?:for\s+)?(?P<name>[A-Za-z][\w-]*)\s+(?:with|from|using)(?:\s+(?:the\s+)?(?:images?|photos?|pictures?))?"
+    rf"\s+(?P<paths>{IMAGE_PATH}(?:(?:\s*,\s*|\s+and\s+|\s+){IMAGE_PATH})*)\s*[.!]?\s*$",
+    re.IGNORECASE
+)
+
+
+class IntentRouter:
+    def __init__(self, tools: Dict[str, Callable[[str], str]]):
+        """
+        Initialize the router.
+
+        Args:
+            tools: Tool name to callable taking the tool's string input
+        """
+        self.tools = tools
+        self.routed = 0
+        self.passed_through = 0
+
+    def match(self, query: str) -> Optional[Dict]:
+        """
+        Find the tool call a query maps to.
+
+        Returns:
+            Dict with 'tool' and 'input', or None if the query should go to the LLM
+        """
+        call = self._match_json(query) or self._match_text(query)
+        if call is None or call["tool"] not in self.tools:
+            return None
+        return call
+
+    def _match_json(self, query: str) -> Optional[Dict]:
+        stripped = query.strip()
+        if not stripped.startswith("{"):
+            return None
+        try:
+            data = json.loads(stripped)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        # Explicit tool call
+        tool_name = data.get("tool") or data.get("action")
+        if tool_name:
+            tool_input = data.get("input", "")
+            return {"tool": tool_name, "input": tool_input if isinstance(tool_input, str) else json.dumps(tool_input)}
+
+        # Infer the tool from the fields given
+        if "name" in data and "image_paths" in data:
+            return {"tool": "create_family_profile", "input": stripped}
+        if "image_path" in data:
+            if any(key in data for key in ("k", "top_k", "threshold", "names")):
+                if "top_k" in data and "k" not in data:
+                    data["k"] = data.pop("top_k")
+                return {"tool": "rank_family_candidates", "input": json.dumps(data)}
+            return {"tool": "identify_person", "input": data["image_path"]}
+        return None
+
+    def _match_text(self, query: str) -> Optional[Dict]:
+        if LIST_PATTERN.match(query):
+            return {"tool": "list_family_members", "input": ""}
+
+        match = IDENTIFY_PATTERN.match(query)
+        if match:
+            return {"tool": "identify_person", "input": match.group("path")}
+
+        match = CREATE_PATTERN.match(query)
+        if match:
+            paths: List[str] = re.findall(IMAGE_PATH, match.group("paths"), re.IGNORECASE)
+            return {
+                "tool": "create_family_profile",
+                "input": json.dumps({"name": match.group("name"), "image_paths": paths})
+            }
+        return None
+
+    def route(self, query: str) -> Optional[Dict]:
+        """
+        Answer a query directly if it is a structured request.
+
+        Returns:
+            Dict shaped like the agent executor's result ('input', 'output')
+            plus the 'tool' used, or None if the query should go to the LLM
+        """
+        call = self.match(query)
+        if call is None:
+            self.passed_through += 1
+            return None
+
+        self.routed += 1
+        output = self.tools[call["tool"]](call["input"])
+        return {"input": query, "output": output, "tool": call["tool"]}
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Load Test for the Recognition API
+# =================================
+
+# Compares servers for the REST API (e.g. the Flask development server against
+# the ASGI server) under the same load. Each target is hit by a number of
+# concurrent clients for a fixed duration, once reusing keep-alive connections
+# and once opening a new connection per request, and the script reports
+# requests and connections per second plus latency percentiles.
+#
+#   python face_recognition.py            # option 4, Flask on :50001
+#   FACE_API_PORT=50002 python asgi_server.py
+#   python load_test.py --target flask=http://127.0.0.1:50001 \
+#                       --target asgi=http://127.0.0.1:50002 --concurrency 64
+#
+# Without --image the cheap GET /api/stats is used, which measures the
+# serving layer itself; with --image every request is a POST /api/identify.
+
+import json
+import time
+import base64
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+from typing import Dict, List, Optional, Tuple
+
+
+class HTTPConnection:
+    """Minimal HTTP/1.1 client connection that follows the server's keep-alive choice."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.connections_opened = 0
+
+    async def _connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.connections_opened += 1
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"", keep_alive: bool = True) -> int:
+        """Send one request and read the whole response; returns the status code."""
+        if self.writer is None:
+            await self._connect()
+
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if body:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode() + b"\r\n" + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        version, status = status_line.decode("latin-1").split()[:2]
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()
+
+        # HTTP/1.0 servers (such as the Flask development server) close after every response
+        if (not keep_alive or version == "HTTP/1.0"
+                or headers.get("connection", "").lower() == "close"
+                or "content-length" not in headers):
+            self.close()
+        return int(status)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_load(url: str,
+                   concurrency: int,
+                   duration: float,
+                   keep_alive: bool,
+                   method: str,
+                   path: str,
+                   body: bytes) -> Dict:
+    """
+    Drive one target with concurrent clients for a fixed duration.
+
+    Returns:
+        Dict with request/connection rates, error count, status counts and latency percentiles (ms)
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    connections = []
+    stop_at = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        connection = HTTPConnection(host, port)
+        connections.append(connection)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                status = await connection.request(method, path, body, keep_alive)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                connection.close()
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "requests_per_second": len(latencies) / elapsed,
+        "connections_per_second": sum(c.connections_opened for c in connections) / elapsed,
+        "latency_ms": {
+            "p50": 1000 * percentile(latencies, 0.50),
+            "p95": 1000 * percentile(latencies, 0.95),
+            "p99": 1000 * percentile(latencies, 0.99),
+            "max": 1000 * (latencies[-1] if latencies else 0.0),
+        },
+    }
+
+
+def parse_target(value: str) -> Tuple[str, str]:
+    name, sep, url = value.partition("=")
+    if not sep:
+        return value, value
+    return name, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the recognition API servers")
+    parser.add_argument("--target", action="append", required=True,
+                        help="name=url of a server to test; repeat to compare servers")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--image", help="Image to POST to /api/identify instead of GET /api/stats")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = base64.b64encode(f.read()).decode()
+        method, path, body = "POST", "/api/identify", json.dumps({"image": image}).encode()
+    else:
+        method, path, body = "GET", "/api/stats", b""
+
+    results = {}
+    for target in args.target:
+        name, url = parse_target(target)
+        for keep_alive in (True, False):
+            mode = "keep-alive" if keep_alive else "new connection per request"
+            print(f"Testing {name} ({url}), {mode}, {args.concurrency} clients for {args.duration:.0f}s...")
+            results[f"{name} / {mode}"] = asyncio.run(
+                run_load(url, args.concurrency, args.duration, keep_alive, method, path, body)
+            )
+
+    print(f"\n{'target':<40} {'req/s':>9} {'conn/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for label, result in results.items():
+        latency = result["latency_ms"]
+        print(f"{label:<40} {result['requests_per_second']:>9.1f} {result['connections_per_second']:>9.1f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} {result['errors']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# Background Archival of Identify Payloads
+# ========================================
+
+# Identify requests are kept for audit without slowing the request down: the
+# request path only puts the payload on a bounded queue, and a background
+# thread writes batches of payloads into rolling gzip-compressed JSON-lines
+# segment files. Each segment has a small index file beside it listing the
+# record ids, timestamps and line numbers it holds. When the queue is full the
+# payload is dropped and counted rather than blocking the request, and old
+# segments are deleted to stay within the age and size limits.
+
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import datetime
+import threading
+from uuid import uuid4
+from typing import Dict, List, Optional
+
+SEGMENT_PATTERN = "identify-*.jsonl.gz"
+
+
+class PayloadArchiver:
+    def __init__(self,
+                 directory: str,
+                 max_queue: int = 256,
+                 batch_size: int = 32,
+                 flush_interval: float = 1.0,
+                 segment_max_bytes: int = 64 * 1024 * 1024,
+                 segment_max_seconds: float = 3600.0,
+                 retention_seconds: float = 7 * 24 * 3600.0,
+                 max_total_bytes: int = 1024 * 1024 * 1024):
+        """
+        Initialize the payload archiver.
+
+        Args:
+            directory: Directory holding the segment and index files
+            max_queue: Payloads allowed to wait for the writer before new ones are dropped
+            batch_size: Largest number of payloads written per batch
+            flush_interval: Longest time a payload waits before its batch is written
+            segment_max_bytes: Uncompressed size after which a new segment is started
+            segment_max_seconds: Age after which a new segment is started
+            retention_seconds: Segments older than this are deleted
+            max_total_bytes: Oldest segments are deleted while the archive is larger than this
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.retention_seconds = retention_seconds
+        self.max_total_bytes = max_total_bytes
+
+        self.queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+
+        self._segment = None
+        self._index = None
+        self._segment_path: Optional[str] = None
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        self._segment_lines = 0
+        self._segment_seq = 0
+
+        self.archived = 0
+        self.dropped = 0
+        self.segments_deleted = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _ensure_started(self) -> None:
+        """Start the writer thread, again in a child process after a pre-fork server forks."""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Segment handles inherited from the parent belong to the parent
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._segment = self._index = None
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="payload-archiver", daemon=True)
+            self._thread.start()
+
+    def submit(self, payload: Dict) -> bool:
+        """
+        Queue a payload for archival without blocking.
+
+        Args:
+            payload: JSON-serializable request payload
+
+        Returns:
+            bool: True if queued, False if dropped because the writer is behind
+        """
+        self._ensure_started()
+        record = {
+            "id": uuid4().hex,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "payload": payload
+        }
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _run(self) -> None:
+        self._apply_retention()
+        while not self._stop.is_set() or not self.queue.empty():
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Error archiving identify payloads: {e}")
+                    with self._lock:
+                        self.dropped += len(batch)
+            elif self._segment is not None and time.time() - self._segment_started > self.segment_max_seconds:
+                self._roll()
+        self._roll()
+
+    def _next_batch(self) -> List[Dict]:
+        """Wait for the first payload, then collect more until the batch is full or the interval passes."""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _open_segment(self) -> None:
+        self._segment_seq += 1
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = f"identify-{stamp}-{os.getpid()}-{self._segment_seq:04d}"
+        self._segment_path = os.path.join(self.directory, f"{name}.jsonl.gz")
+        self._segment = gzip.open(self._segment_path, "ab")
+        self._index = open(os.path.join(self.directory, f"{name}.idx.jsonl"), "a")
+        self._segment_started = time.time()
+        self._segment_bytes = 0
+        self._segment_lines = 0
+
+    def _close_segment(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = self._index = None
+
+    def _roll(self) -> None:
+        """Close the current segment and enforce the retention limits."""
+        self._close_segment()
+        self._apply_retention()
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        if self._segment is None:
+            self._open_segment()
+
+        index_lines = []
+        for record in batch:
+            line = (json.dumps(record) + "\n").encode()
+            self._segment.write(line)
+            index_lines.append(json.dumps({
+                "id": record["id"],
+                "timestamp": record["timestamp"],
+                "line": self._segment_lines,
+                "bytes": len(line)
+            }) + "\n")
+            self._segment_lines += 1
+            self._segment_bytes += len(line)
+
+        # Sync-flush so every indexed record is readable even if the process dies
+        self._segment.flush()
+        self._index.write("".join(index_lines))
+        self._index.flush()
+        with self._lock:
+            self.archived += len(batch)
+
+        if (self._segment_bytes >= self.segment_max_bytes
+                or time.time() - self._segment_started > self.segment_max_seconds):
+            self._roll()
+
+    def _segments(self) -> List[str]:
+        """Segment files, oldest first."""
+        return sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)), key=os.path.getmtime)
+
+    def _apply_retention(self) -> None:
+        """Delete segments past the retention age, then the oldest ones while over the size limit."""
+        now = time.time()
+        segments = []
+        for path in self._segments():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            segments.append((path, st.st_mtime, st.st_size))
+
+        total = sum(size for _, _, size in segments)
+        for path, mtime, size in segments:
+            if path == self._segment_path and self._segment is not None:
+                continue
+            if now - mtime > self.retention_seconds or total > self.max_total_bytes:
+                self._delete_segment(path)
+                total -= size
+
+    def _delete_segment(self, path: str) -> None:
+        index_path = path[:-len(".jsonl.gz")] + ".idx.jsonl"
+        for file_path in (path, index_path):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.segments_deleted += 1
+
+    def read(self, record_id: str) -> Optional[Dict]:
+        """Look up an archived record by id using the segment indexes."""
+        for index_path in glob.glob(os.path.join(self.directory, "identify-*.idx.jsonl")):
+            with open(index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["id"] != record_id:
+                        continue
+                    segment_path = index_path[:-len(".idx.jsonl")] + ".jsonl.gz"
+                    with gzip.open(segment_path, "rb") as segment:
+                        for number, record_line in enumerate(segment):
+                            if number == entry["line"]:
+                                return json.loads(record_line)
+        return None
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write out everything still queued and close the current segment."""
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        """Archive counters."""
+        segments = self._segments()
+        with self._lock:
+            return {
+                "queued": self.queue.qsize(),
+                "archived": self.archived,
+                "dropped": self.dropped,
+                "segments": len(segments),
+                "segments_deleted": self.segments_deleted,
+                "bytes": sum(os.path.getsize(p) for p in segments if os.path.exists(p))
+            }
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# Profile Store with an Append-Only Mutation Log
+# ==============================================
+
+# Profile mutations (put, add embeddings, remove embeddings, delete, rename)
+# are appended to a checksummed log instead of rewriting whole pickles. The
+# per-person pickles in the profiles directory remain the snapshot store: the
+# log is periodically compacted into them and replayed on startup.
+#
+# Every record is idempotent (each embedding carries an entry id, and records
+# name the entries they add or remove), so replaying a log whose records were
+# already partly compacted is harmless and recovery after a crash is
+# deterministic. Records written before entry ids existed name embeddings by
+# image content hash and are still replayed that way.
+
+import os
+import zlib
+import fcntl
+import pickle
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Optional, Set
+
+# Frame header: payload length, CRC32 of the payload
+_HEADER = struct.Struct("<II")
+
+LOG_FILENAME = "profiles.log"
+LOCK_FILENAME = ".profiles.lock"
+
+
+def apply_record(profiles: Dict[str, Dict], record: Dict) -> Set[str]:
+    """
+    Apply one logged mutation to a profiles dictionary.
+
+    Args:
+        profiles: Profiles keyed by name, modified in place
+        record: Logged mutation
+
+    Returns:
+        Set of profile names the record touches
+    """
+    op = record["op"]
+    name = record["name"]
+
+    if op == "put":
+        profiles[name] = record["profile"]
+    elif op == "add":
+        profile = profiles.setdefault(name, {
+            "name": name,
+            "embeddings": [],
+            "image_paths": [],
+            "image_hashes": [],
+            "entry_ids": [],
+            "model_name": record["model_name"]
+        })
+        hashes = profile.setdefault("image_hashes", [None] * len(profile["embeddings"]))
+        entry_ids = profile.setdefault("entry_ids", [None] * len(profile["embeddings"]))
+        new_ids = record.get("entry_ids", [None] * len(record["embeddings"]))
+        for embedding, path, image_hash, entry_id in zip(
+                record["embeddings"], record["image_paths"], record["image_hashes"], new_ids):
+            # Records from before entry ids recognise their embeddings by image hash
+            applied = entry_id in entry_ids if entry_id is not None else image_hash in hashes
+            if applied:
+                continue
+            profile["embeddings"].append(embedding)
+            profile["image_paths"].append(path)
+            hashes.append(image_hash)
+            entry_ids.append(entry_id)
+    elif op == "remove":
+        profile = profiles.get(name)
+        if profile is not None:
+            count = len(profile["embeddings"])
+            hashes = profile.get("image_hashes", [None] * count)
+            entry_ids = profile.get("entry_ids", [None] * count)
+            if "entry_ids" in record:
+                removed = set(record["entry_ids"])
+                keep = [i for i, e in enumerate(entry_ids) if e not in removed]
+            else:
+                removed = set(record["image_hashes"])
+                keep = [i for i, h in enumerate(hashes) if h not in removed]
+            profile["embeddings"] = [profile["embeddings"][i] for i in keep]
+            profile["image_paths"] = [profile["image_paths"][i] for i in keep]
+            profile["image_hashes"] = [hashes[i] for i in keep]
+            profile["entry_ids"] = [entry_ids[i] for i in keep]
+    elif op == "delete":
+        profiles.pop(name, None)
+    elif op == "rename":
+        new_name = record["new_name"]
+        profile = profiles.pop(name, None)
+        # If new_name already exists, a crash mid-compaction left the old
+        # snapshot behind after the renamed one was written
+        if profile is not None and new_name not in profiles:
+            profile["name"] = new_name
+            profile["image_paths"] = record["image_paths"]
+            profiles[new_name] = profile
+        return {name, new_name}
+    else:
+        raise ValueError(f"Unknown profile log operation: {op}")
+
+    return {name}
+
+
+class ProfileStore:
+    def __init__(self, profiles_dir: str, compact_every: int = 100):
+        """
+        Initialize the profile store.
+
+        Args:
+            profiles_dir: Directory holding the profile snapshots and the log
+            compact_every: Number of logged records after which the log is compacted
+        """
+        self.profiles_dir = profiles_dir
+        self.compact_every = compact_every
+        self.log_path = os.path.join(profiles_dir, LOG_FILENAME)
+        self.lock_path = os.path.join(profiles_dir, LOCK_FILENAME)
+        self.pending_records = 0
+        self.replayed_records: List[Dict] = []
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        os.makedirs(profiles_dir, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        """
+        Serialize log writers and compaction across processes.
+
+        Reentrant within a thread, so callers can hold the lock across a
+        read-modify-append sequence that itself appends or compacts.
+        """
+        with self._thread_lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _snapshot_path(self, name: str) -> str:
+        return os.path.join(self.profiles_dir, f"{name}.pkl")
+
+    def _read_snapshot(self, name: str) -> Optional[Dict]:
+        try:
+            with open(self._snapshot_path(name), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_snapshot(self, name: str, profile: Dict) -> None:
+        """Atomically replace a profile snapshot."""
+        path = self._snapshot_path(name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(profile, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _read_log(self) -> List[Dict]:
+        """
+        Read every intact record from the log.
+
+        A torn or corrupt tail (from a crash mid-append) is truncated so that
+        later appends start from the last good record. Must be called with the
+        lock held.
+        """
+        try:
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            length, checksum = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            records.append(pickle.loads(payload))
+            offset = start + length
+
+        if offset < len(data):
+            print(f"Discarding {len(data) - offset} bytes of incomplete profile log records.")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(offset)
+        return records
+
+    def load(self) -> Dict[str, Dict]:
+        """Load the snapshot store and replay the mutation log on top of it."""
+        profiles = {}
+        for profile_file in Path(self.profiles_dir).glob("*.pkl"):
+            with open(profile_file, "rb") as f:
+                profiles[profile_file.stem] = pickle.load(f)
+
+        with self.locked():
+            records = self._read_log()
+        for record in records:
+            apply_record(profiles, record)
+
+        self.pending_records = len(records)
+        self.replayed_records = records
+        return profiles
+
+    def load_profile(self, name: str) -> Optional[Dict]:
+        """
+        Load one profile as currently stored, including records logged by other processes.
+
+        Returns:
+            The profile, or None if it does not exist
+        """
+        with self.locked():
+            records = self._read_log()
+            # Follow renames back to the snapshots the profile may have come from
+            names = {name}
+            for record in reversed(records):
+                if record["op"] == "rename" and record["new_name"] in names:
+                    names.add(record["name"])
+
+            profiles = {}
+            for source in names:
+                snapshot = self._read_snapshot(source)
+                if snapshot is not None:
+                    profiles[source] = snapshot
+        for record in records:
+            if record["name"] in names or record.get("new_name") in names:
+                apply_record(profiles, record)
+        return profiles.get(name)
+
+    def append(self, record: Dict) -> None:
+        """
+        Durably append a mutation to the log.
+
+        The write costs O(size of the record) regardless of how large the
+        affected profile already is.
+        """
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        frame = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self.locked():
+            with open(self.log_path, "ab") as f:
+                f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.pending_records += 1
+        if self.pending_records >= self.compact_every:
+            self.compact()
+
+    def compact(self) -> int:
+        """
+        Fold the log into the snapshot store and truncate it.
+
+        Only the profiles touched by logged records are read and rewritten.
+        The state is rebuilt from disk rather than from memory so that records
+        appended by other worker processes are never lost.
+
+        Returns:
+            int: Number of records compacted
+        """
+        with self.locked():
+            records = self._read_log()
+            if not records:
+                self.pending_records = 0
+                return 0
+
+            touched = set()
+            for record in records:
+                touched.add(record["name"])
+                if record["op"] == "rename":
+                    touched.add(record["new_name"])
+
+            profiles = {}
+            for name in touched:
+                snapshot = self._read_snapshot(name)
+                if snapshot is not None:
+                    profiles[name] = snapshot
+            for record in records:
+                apply_record(profiles, record)
+
+            for name in touched:
+                if name in profiles:
+                    self._write_snapshot(name, profiles[name])
+                elif os.path.exists(self._snapshot_path(name)):
+                    os.remove(self._snapshot_path(name))
+
+            # Snapshots are durable, the log can start over
+            with open(self.log_path, "wb") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.pending_records = 0
+        print(f"Compacted {len(records)} profile log records touching {len(touched)} profiles.")
+        return len(records)
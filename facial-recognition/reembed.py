@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Background Re-Embedding Migration
+# =================================
+
+# Re-embeds every stored profile image with a new face recognition model in a
+# throttled background thread while identification keeps serving from the
+# current model. Progress is checkpointed by image content hash, so an
+# interrupted migration resumes where it stopped. Once every image has been
+# re-embedded, the gallery is switched to the new model in one step.
+#
+# Images enrolled while the migration runs are caught up on by further
+# throttled passes, each starting from the stored profiles; only what arrives
+# between the last pass and the switch is embedded with the profile lock held.
+# A person none of whose images could be re-embedded would drop out of the
+# gallery, so the switch is refused while there are such profiles unless the
+# migration was started with drop_unusable=True; status() lists them.
+
+import os
+import time
+import pickle
+import threading
+from typing import List, Dict, Optional, Tuple
+
+
+class ReembedMigration:
+    def __init__(self,
+                 face_system,
+                 target_model: str,
+                 throttle_seconds: float = 0.5,
+                 checkpoint_every: int = 10,
+                 drop_unusable: bool = False):
+        """
+        Initialize a re-embedding migration.
+
+        Args:
+            face_system: FamilyRecognitionSystem whose gallery is migrated
+            target_model: Face recognition model to migrate to
+            throttle_seconds: Pause between images to leave CPU for live requests
+            checkpoint_every: Number of images between progress checkpoints
+            drop_unusable: Switch even if some profiles have no image usable with
+                the target model; those people then drop out of the gallery
+        """
+        self.face_system = face_system
+        self.target_model = target_model
+        self.throttle_seconds = throttle_seconds
+        self.checkpoint_every = checkpoint_every
+        self.drop_unusable = drop_unusable
+        self.state_path = os.path.join(face_system.profiles_dir, "migrations", f"{target_model}.pkl")
+
+        self.state = self._load_state()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.total = 0
+        self.completed = False
+        self.error: Optional[str] = None
+        # Profiles with no image usable with the target model, found at the switch
+        self.unusable_profiles: List[str] = []
+
+    def _load_state(self) -> Dict:
+        """Load checkpointed progress, if a previous run was interrupted."""
+        try:
+            with open(self.state_path, "rb") as f:
+                state = pickle.load(f)
+            print(f"Resuming migration to {self.target_model}: {len(state['embeddings'])} images already done.")
+            return state
+        except FileNotFoundError:
+            return {"target_model": self.target_model, "embeddings": {}, "failed": {}}
+
+    def _save_state(self) -> None:
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _pending(self, reload: bool = True) -> List[Tuple[str, str, str]]:
+        """
+        (name, image_path, image_hash) of every stored image not yet re-embedded.
+
+        Args:
+            reload: Reload the profiles from the store first, to include images
+                other processes enrolled; the caller may have just done so
+        """
+        pending = []
+        with self.face_system._mutation_lock, self.face_system.profile_store.locked():
+            if reload:
+                self.face_system._reload_profiles()
+            for name in list(self.face_system.family_profiles):
+                profile = self.face_system.family_profiles[name]
+                hashes = self.face_system._ensure_image_keys(name)["image_hashes"]
+                for path, image_hash in zip(profile["image_paths"], hashes):
+                    if image_hash not in self.state["embeddings"] and image_hash not in self.state["failed"]:
+                        pending.append((name, path, image_hash))
+        return pending
+
+    def _embed(self, image_path: str, image_hash: str) -> None:
+        try:
+            embedding = self.face_system._represent(image_path, model_name=self.target_model)
+            self.state["embeddings"][image_hash] = embedding
+        except Exception as e:
+            print(f"Could not re-embed {image_path} with {self.target_model}: {e}")
+            self.state["failed"][image_hash] = str(e)
+
+    def run(self) -> None:
+        """Re-embed all stored images, then switch the gallery to the target model."""
+        try:
+            pending = self._pending()
+            self.total = len(self.state["embeddings"]) + len(self.state["failed"]) + len(pending)
+            while pending:
+                self.total = len(self.state["embeddings"]) + len(self.state["failed"]) + len(pending)
+                for done, (name, image_path, image_hash) in enumerate(pending, start=1):
+                    if self.stop_event.is_set():
+                        self._save_state()
+                        print(f"Migration to {self.target_model} paused.")
+                        return
+                    self._embed(image_path, image_hash)
+                    if done % self.checkpoint_every == 0:
+                        self._save_state()
+                    time.sleep(self.throttle_seconds)
+                self._save_state()
+                # Pick up images enrolled while this pass was running
+                pending = self._pending()
+
+            self._switch()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error in migration to {self.target_model}: {e}")
+
+    def _switch(self) -> None:
+        """Swap every profile to the re-embedded vectors in one step."""
+        face_system = self.face_system
+        with face_system._mutation_lock, face_system.profile_store.locked():
+            # Start from the stored profiles, which other processes may have changed.
+            # run() caught up just before the lock, so only images enrolled since
+            # then are left to embed here
+            face_system._reload_profiles()
+            for name, image_path, image_hash in self._pending(reload=False):
+                self._embed(image_path, image_hash)
+
+            profiles = {}
+            unusable = []
+            for name, profile in face_system.family_profiles.items():
+                hashes = profile["image_hashes"]
+                keep = [i for i, h in enumerate(hashes) if h in self.state["embeddings"]]
+                if not keep:
+                    unusable.append(name)
+                    continue
+                profiles[name] = {
+                    "name": name,
+                    "embeddings": [self.state["embeddings"][hashes[i]] for i in keep],
+                    "image_paths": [profile["image_paths"][i] for i in keep],
+                    "image_hashes": [hashes[i] for i in keep],
+                    "entry_ids": [profile["entry_ids"][i] for i in keep],
+                    "model_name": self.target_model
+                }
+
+            self.unusable_profiles = sorted(unusable)
+            if unusable and not self.drop_unusable:
+                self._save_state()
+                self.error = (f"Profiles with no images usable with {self.target_model}: "
+                              f"{', '.join(self.unusable_profiles)}. Add images for them, or restart "
+                              f"the migration with drop_unusable=True to switch without them.")
+                print(f"Not switching to {self.target_model}. {self.error}")
+                return
+            for name in self.unusable_profiles:
+                # Nothing usable for this person with the new model; keep
+                # the old profile on disk so it can be re-enrolled later
+                print(f"Profile {name} has no images usable with {self.target_model}; leaving it out.")
+
+            face_system.switch_model(self.target_model, profiles)
+
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self.completed = True
+
+    def start(self) -> threading.Thread:
+        """Run the migration in a background thread."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self) -> None:
+        """Pause the migration after the current image; progress is kept."""
+        self.stop_event.set()
+
+    def status(self) -> Dict:
+        """Progress of the migration."""
+        return {
+            "target_model": self.target_model,
+            "embedded": len(self.state["embeddings"]),
+            "failed": len(self.state["failed"]),
+            "total": self.total,
+            "running": self.thread is not None and self.thread.is_alive(),
+            "completed": self.completed,
+            "unusable_profiles": self.unusable_profiles,
+            "error": self.error
+        }
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Opt-in Request Profiler
+# =======================
+
+# Profiles individual identify / enrollment calls in production. A call is
+# profiled when the client sends the X-Profile header or when it is picked by
+# 1-in-N sampling; every other call goes straight through. While a call is
+# profiled, a helper thread samples the stack of the thread running it, and the
+# samples are written as a collapsed-stack file (one "frame;frame;frame count"
+# line per stack, ready for flamegraph.pl or speedscope) next to a JSON summary
+# with a per-stage timing breakdown. The debug endpoints serve both files.
+
+import os
+import sys
+import glob
+import json
+import time
+import threading
+import itertools
+from uuid import uuid4
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROFILE_HEADER = "X-Profile"
+
+# Pipeline stages, recognised by a function on the sampled stack:
+# (stage, source file or None for any file, function name)
+STAGES = [
+    ("decode_image", "face_recognition.py", "save_base64_image"),
+    ("archive", "payload_archive.py", "submit"),
+    ("detect_faces", None, "extract_faces"),
+    ("quality_gate", "face_quality.py", "assess"),
+    ("embed", None, "represent"),
+    ("hash_image", "face_recognition.py", "_image_hash"),
+    ("copy_image", "face_recognition.py", "_save_profile_image"),
+    ("search", "gallery.py", "search"),
+    ("log_write", "profile_log.py", "append"),
+    ("compaction", "face_recognition.py", "compact_profile"),
+]
+
+
+class _StackSampler:
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float, root_code):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_code = root_code
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                if frame.f_code is self.root_code:
+                    # Stop at the profiler's own entry point; frames above it
+                    # belong to the web server, not the profiled call
+                    break
+                code = frame.f_code
+                frames.append((os.path.basename(code.co_filename), code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if frames:
+                self.samples[tuple(reversed(frames))] += 1
+
+
+class RequestProfiler:
+    def __init__(self,
+                 output_dir: str,
+                 enabled: bool = False,
+                 sample_every: int = 0,
+                 interval: float = 0.001,
+                 max_profiles: int = 200):
+        """
+        Initialize the request profiler.
+
+        Args:
+            output_dir: Directory holding the collapsed-stack and summary files
+            enabled: Whether profiling can be triggered at all; when False, run() only calls through
+            sample_every: Profile one in this many calls (0 to profile only on request)
+            interval: Seconds between stack samples
+            max_profiles: Number of stored profiles to keep
+        """
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self._counter = itertools.count(1)
+
+        if enabled:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def _wanted(self, headers) -> bool:
+        if headers and headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+            return True
+        return self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+
+    def run(self, label: str, headers, func: Callable, *args, **kwargs) -> Tuple[object, Optional[str]]:
+        """
+        Call func, profiling the call if it was requested or sampled.
+
+        Must be called on the thread that does the work, since that is the
+        thread whose stack is sampled.
+
+        Args:
+            label: Name of the profiled operation (e.g. 'identify')
+            headers: Request headers, checked for X-Profile (may be None)
+            func: Function to call with the remaining arguments
+
+        Returns:
+            Tuple of (func's result, profile id or None if not profiled)
+        """
+        if not self.enabled or not self._wanted(headers):
+            return func(*args, **kwargs), None
+
+        sampler = _StackSampler(threading.get_ident(), self.interval, RequestProfiler.run.__code__)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            sampler.stop()
+            wall_seconds = time.perf_counter() - start
+            profile_id = self._save(label, sampler.samples, wall_seconds)
+        return result, profile_id
+
+    def _save(self, label: str, samples: Counter, wall_seconds: float) -> Optional[str]:
+        """Write the collapsed stacks and the stage summary."""
+        profile_id = f"{time.strftime('%Y%m%d_%H%M%S')}-{label}-{uuid4().hex[:8]}"
+        total_samples = sum(samples.values())
+
+        stage_samples = Counter()
+        for stack, count in samples.items():
+            for stage, filename, function in STAGES:
+                if any(name == function and (filename is None or file == filename)
+                       for file, name, _ in stack):
+                    stage_samples[stage] += count
+
+        # Scale sample counts to the measured wall time of the call
+        seconds_per_sample = wall_seconds / total_samples if total_samples else 0.0
+        stages = {stage: count * seconds_per_sample for stage, count in stage_samples.most_common()}
+        summary = {
+            "id": profile_id,
+            "label": label,
+            "timestamp": time.time(),
+            "wall_seconds": wall_seconds,
+            "samples": total_samples,
+            "stages": stages,
+            "unattributed_seconds": max(0.0, wall_seconds - sum(stages.values()))
+        }
+
+        try:
+            path = os.path.join(self.output_dir, profile_id)
+            with open(f"{path}.collapsed", "w") as f:
+                for stack, count in samples.most_common():
+                    frames = ";".join(f"{name} ({file}:{line})" for file, name, line in stack)
+                    f.write(f"{frames} {count}\n")
+            with open(f"{path}.json", "w") as f:
+                json.dump(summary, f, indent=2)
+            self._prune()
+        except OSError as e:
+            print(f"Could not save profile {profile_id}: {e}")
+            return None
+        return profile_id
+
+    def _prune(self) -> None:
+        summaries = sorted(glob.glob(os.path.join(self.output_dir, "*.json")), key=os.path.getmtime)
+        for path in summaries[:-self.max_profiles]:
+            for file_path in (path, path[:-len(".json")] + ".collapsed"):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self) -> List[Dict]:
+        """Summaries of the stored profiles, newest first."""
+        summaries = []
+        for path in sorted(glob.glob(os.path.join(self.output_dir, "*.json")), key=os.path.getmtime, reverse=True):
+            try:
+                with open(path) as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return summaries
+
+    def get_profile(self, profile_id: str) -> Optional[Dict]:
+        """
+        Load one stored profile.
+
+        Returns:
+            The summary with the collapsed stacks under 'collapsed', or None if not found
+        """
+        # Profile ids never contain path separators
+        if os.path.basename(profile_id) != profile_id:
+            return None
+        path = os.path.join(self.output_dir, profile_id)
+        try:
+            with open(f"{path}.json") as f:
+                summary = json.load(f)
+            with open(f"{path}.collapsed") as f:
+                summary["collapsed"] = f.read()
+        except (OSError, ValueError):
+            return None
+        return summary
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# Response Cache for the Face Recognition Agent
+# =============================================
+
+# Caches agent answers and individual LLM completions so that repeated or
+# near-identical queries do not pay for another LangChain agent run. Every
+# key includes the gallery version, so cached answers are invalidated as soon
+# as a profile is created, changed or removed. Entries expire after a TTL and
+# the least recently used ones are evicted beyond a size limit. An optional
+# SQLite file adds a persistent tier that survives restarts.
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a key."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a user query: case, whitespace and trailing punctuation."""
+    return normalize_text(query).lower().rstrip(" ?.!")
+
+
+def make_key(*parts) -> str:
+    """Stable cache key from JSON-serializable parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self,
+                 max_entries: int = 512,
+                 ttl_seconds: float = 3600.0,
+                 persist_path: Optional[str] = None,
+                 max_persistent_entries: int = 10000,
+                 table: str = "responses"):
+        """
+        Initialize the response cache.
+
+        Args:
+            max_entries: Entries kept in memory before the least recently used is evicted
+            ttl_seconds: Seconds an entry stays valid
+            persist_path: Optional SQLite file for a persistent second tier
+            max_persistent_entries: Entries kept in the persistent tier
+            table: SQLite table of this cache, so several caches can share one file
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_persistent_entries = max_persistent_entries
+        self.table = table
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if persist_path:
+            os.makedirs(os.path.dirname(os.path.abspath(persist_path)), exist_ok=True)
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self._db.execute(f"DELETE FROM {table} WHERE expires < ?", (time.time(),))
+            self._db.commit()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached value, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.persistent_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        """Store a value under a key."""
+        expires = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                    (key, value, expires)
+                )
+                # Keep the persistent tier bounded, dropping entries closest to expiry
+                self._db.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                    "ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                    (self.max_persistent_entries,)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, expires: float) -> None:
+        """Insert into the memory tier with LRU eviction. Called with the lock held."""
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Hit and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache for single LLM calls, backed by a ResponseCache.
+
+    The prompt a ReAct agent sends already contains every tool observation
+    so far, so keying on it also keys on the tool outputs. Only the generated
+    text is kept, which is all the text-based ReAct agent reads.
+    """
+
+    def __init__(self, cache: ResponseCache, version: Callable[[], str]):
+        self.cache = cache
+        self.version = version
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return make_key("llm", normalize_text(prompt), llm_string, self.version())
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.cache.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [
+            ChatGeneration(message=AIMessage(content=g["text"])) if g["chat"] else Generation(text=g["text"])
+            for g in json.loads(value)
+        ]
+
+    def update(self, prompt: str, llm_string: str, return_val: Iterable) -> None:
+        generations = [{"chat": isinstance(g, ChatGeneration), "text": g.text} for g in return_val]
+        self.cache.put(self._key(prompt, llm_string), json.dumps(generations))
+
+    def clear(self, **kwargs) -> None:
+        self.cache.clear()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# Intent Router Latency Comparison
+# ================================
+
+# Runs the same agent queries through FaceRecognitionAgent with and without
+# the intent router, using a local stub LLM (a scripted FakeListLLM with a
+# per-call delay standing in for a Gemini round trip) and the benchmark's stub
+# face model, so no network or API key is needed. Answer caching is turned
+# off in both modes, so repeated queries measure the router alone.
+#
+#   python router_benchmark.py --llm-latency 0.8 --repeats 5
+
+import io
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.language_models.fake import FakeListLLM
+
+import face_recognition
+from face_recognition import FamilyRecognitionSystem, FaceRecognitionAgent
+from benchmark import StubDeepFace, ImageSource
+
+
+class StubLLM(FakeListLLM):
+    """Scripted LLM that waits a fixed time per call and counts its calls."""
+
+    latency: float = 0.0
+    calls: int = 0
+
+    def _call(self, *args, **kwargs) -> str:
+        time.sleep(self.latency)
+        self.calls += 1
+        return super()._call(*args, **kwargs)
+
+
+def react_responses(tool_name: str, tool_input: str) -> List[str]:
+    """The two LLM turns a ReAct agent needs for a single tool call."""
+    return [
+        f"Thought: I should use {tool_name}.\nAction: {tool_name}\nAction Input: {tool_input}",
+        "Thought: I now know the final answer\nFinal Answer: Done."
+    ]
+
+
+def build_queries(images: ImageSource) -> List[Tuple[str, str, str]]:
+    """(query, tool the LLM would pick, tool input the LLM would pass)."""
+    probe = images.images(0, 1, 256, offset=50)[0]
+    new_images = images.images(7, 2, 256)
+    return [
+        ("list family members", "list_family_members", ""),
+        (f"identify {probe}", "identify_person", probe),
+        (json.dumps({"image_path": probe, "k": 3}), "rank_family_candidates",
+         json.dumps({"image_path": probe, "k": 3})),
+        (f"create profile for Dana with {new_images[0]} {new_images[1]}", "create_family_profile",
+         json.dumps({"name": "Dana", "image_paths": new_images})),
+        (f"Does the person in {probe} look more like Ann or like Ben?", "rank_family_candidates",
+         json.dumps({"image_path": probe, "k": 2, "names": ["Ann", "Ben"]})),
+    ]
+
+
+def run_mode(face_system, queries, use_router: bool, llm_latency: float, repeats: int) -> Dict:
+    agent_queries = []
+    for _ in range(repeats):
+        agent_queries.extend(queries)
+
+    # Script the stub LLM for exactly the queries that will reach it
+    probe_agent = FaceRecognitionAgent(face_system, api_key="", llm=StubLLM(responses=["unused"]),
+                                       use_router=use_router, use_cache=False)
+    responses = []
+    for query, tool_name, tool_input in agent_queries:
+        if probe_agent.router is None or probe_agent.router.match(query) is None:
+            responses.extend(react_responses(tool_name, tool_input))
+    llm = StubLLM(responses=responses or ["unused"], latency=llm_latency)
+
+    agent = FaceRecognitionAgent(face_system, api_key="", llm=llm, use_router=use_router, use_cache=False)
+    agent.agent_executor.verbose = False
+
+    latencies: Dict[str, List[float]] = {}
+    for query, _, _ in agent_queries:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.run(query)
+        latencies.setdefault(query, []).append(time.perf_counter() - start)
+        if query.startswith("create profile"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                face_system.delete_profile("Dana")
+    return {
+        "llm_calls": llm.calls,
+        "latency_ms": {query: 1000.0 * float(np.mean(values)) for query, values in latencies.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare agent latency with and without the intent router")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Seconds per stub LLM call")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    face_recognition.DeepFace = StubDeepFace
+    images = ImageSource(tempfile.mkdtemp(prefix="router-benchmark-"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        face_system = FamilyRecognitionSystem(profiles_dir=tempfile.mkdtemp(),
+                                              profile_images_dir=tempfile.mkdtemp())
+        for person, name in enumerate(["Ann", "Ben", "Cleo"]):
+            face_system.create_profile(name, images.images(person, 3, 256))
+
+    queries = build_queries(images)
+    results = {
+        "llm_only": run_mode(face_system, queries, False, args.llm_latency, args.repeats),
+        "router": run_mode(face_system, queries, True, args.llm_latency, args.repeats),
+    }
+
+    print(f"{'query':<70} {'LLM only ms':>12} {'router ms':>12}")
+    for query, _, _ in queries:
+        label = query if len(query) <= 68 else query[:65] + "..."
+        print(f"{label:<70} {results['llm_only']['latency_ms'][query]:>12.1f} "
+              f"{results['router']['latency_ms'][query]:>12.1f}")
+    print(f"\nLLM calls: {results['llm_only']['llm_calls']} without the router, "
+          f"{results['router']['llm_calls']} with it")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
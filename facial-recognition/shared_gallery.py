@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# Shared Gallery for Multi-Worker Serving
+# =======================================
+
+# Publishes the embedding gallery as memory-mapped .npy files so that every
+# worker process of a pre-fork server maps the same pages read-only instead of
+# holding its own copy. Each publish writes a new generation and atomically
+# swaps a small CURRENT pointer; readers notice the new generation on their
+# next search and remap without reloading any profiles. CURRENT also records
+# a digest of the generation's contents, so a starting server can tell
+# whether a generation left over from an earlier run still matches the
+# stored profiles.
+
+import os
+import json
+import fcntl
+import glob
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Optional
+from gallery import EmbeddingGallery
+
+
+class SharedGallery:
+    def __init__(self,
+                 directory: str,
+                 distance_metric: str = "cosine",
+                 model_name: str = "VGG-Face",
+                 keep_generations: int = 3):
+        """
+        Initialize a shared gallery stored in a directory.
+
+        Args:
+            directory: Directory holding the generation files (ideally on tmpfs, e.g. /dev/shm)
+            distance_metric: Distance metric used by the gallery
+            model_name: Model assumed for the gallery before any generation is published
+            keep_generations: Number of published generations to keep on disk
+        """
+        self.directory = directory
+        self.distance_metric = distance_metric
+        self.model_name = model_name
+        self.keep_generations = max(2, keep_generations)
+        self.current_path = os.path.join(directory, "CURRENT")
+        self.lock_path = os.path.join(directory, ".lock")
+
+        self.generation = -1
+        self._current_stat = None
+        self._gallery = EmbeddingGallery(distance_metric, model_name)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _prefix(self, generation: int) -> str:
+        return os.path.join(self.directory, f"gallery-{generation:08d}")
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers across processes."""
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_current(self) -> dict:
+        try:
+            with open(self.current_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": -1}
+
+    def _read_generation(self) -> int:
+        return int(self._read_current()["generation"])
+
+    def _map_generation(self, generation: int) -> EmbeddingGallery:
+        """Map a published generation read-only."""
+        prefix = self._prefix(generation)
+        with open(f"{prefix}.json") as f:
+            meta = json.load(f)
+
+        gallery = EmbeddingGallery(self.distance_metric, meta.get("model_name", self.model_name))
+        gallery.names = meta["names"]
+        if meta["rows"]:
+            gallery.set_rows(np.load(f"{prefix}.matrix.npy", mmap_mode="r"),
+                             np.load(f"{prefix}.labels.npy", mmap_mode="r"),
+                             np.load(f"{prefix}.indices.npy", mmap_mode="r"))
+        return gallery
+
+    def exists(self) -> bool:
+        """Whether any generation has been published yet."""
+        return os.path.exists(self.current_path)
+
+    def refresh(self) -> EmbeddingGallery:
+        """
+        Return the latest published gallery, remapping only if a new generation exists.
+
+        The check is a single stat() of the CURRENT pointer, so it is cheap
+        enough to run before every search.
+        """
+        try:
+            st = os.stat(self.current_path)
+        except FileNotFoundError:
+            return self._gallery
+
+        stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat_key != self._current_stat:
+            generation = self._read_generation()
+            if generation != self.generation:
+                self._gallery = self._map_generation(generation)
+                self.generation = generation
+            self._current_stat = stat_key
+        return self._gallery
+
+    def _write_generation(self, gallery: EmbeddingGallery) -> int:
+        """Write a gallery as the next generation and swap the CURRENT pointer."""
+        generation = self._read_generation() + 1
+        prefix = self._prefix(generation)
+
+        for suffix, array in (("matrix", gallery.matrix),
+                              ("labels", gallery.labels),
+                              ("indices", gallery.image_indices)):
+            tmp_path = f"{prefix}.{suffix}.tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(array))
+            os.replace(tmp_path, f"{prefix}.{suffix}.npy")
+
+        tmp_path = f"{prefix}.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"names": gallery.names, "rows": len(gallery), "model_name": gallery.model_name}, f)
+        os.replace(tmp_path, f"{prefix}.json")
+
+        tmp_path = f"{self.current_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": generation, "digest": gallery.digest()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.current_path)
+
+        self._remove_old_generations(generation)
+        return generation
+
+    def _remove_old_generations(self, generation: int) -> None:
+        """Unlink generations no reader should switch to any more.
+
+        Workers still mapping an unlinked generation keep a valid mapping until
+        they refresh.
+        """
+        for path in glob.glob(os.path.join(self.directory, "gallery-*")):
+            try:
+                file_generation = int(os.path.basename(path).split(".")[0].split("-")[1])
+            except (IndexError, ValueError):
+                continue
+            if file_generation <= generation - self.keep_generations:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def publish(self, gallery: EmbeddingGallery) -> int:
+        """Publish a complete gallery as a new generation."""
+        with self._locked():
+            return self._write_generation(gallery)
+
+    def publish_if_changed(self, gallery: EmbeddingGallery) -> Optional[int]:
+        """
+        Publish a gallery unless the latest generation already holds the same contents.
+
+        Returns:
+            The published generation, or None if the latest one was kept
+        """
+        with self._locked():
+            if self._read_current().get("digest") == gallery.digest():
+                return None
+            return self._write_generation(gallery)
+
+    def replace_person(self,
+                       name: str,
+                       embeddings: Optional[List[List[float]]],
+                       model_name: Optional[str] = None) -> int:
+        """
+        Replace a person's rows and publish the result as a new generation.
+
+        The latest generation is re-read under the lock, so concurrent
+        enrollments from different workers are never lost.
+
+        Args:
+            name: Name of the family member
+            embeddings: New embeddings for the person, or None to remove them
+            model_name: Model the embeddings were computed with
+
+        Returns:
+            int: The published generation
+
+        Raises:
+            ValueError: If another worker switched the gallery to a different model
+        """
+        with self._locked():
+            latest = self._read_generation()
+            if latest >= 0:
+                current = self._map_generation(latest)
+            else:
+                current = EmbeddingGallery(self.distance_metric, model_name or self.model_name)
+
+            if embeddings and model_name is not None and model_name != current.model_name:
+                raise ValueError(
+                    f"Shared gallery now uses {current.model_name}; embeddings from {model_name} rejected."
+                )
+
+            # Copy out of the read-only mapping before mutating
+            gallery = EmbeddingGallery(self.distance_metric, current.model_name)
+            gallery.names = list(current.names)
+            gallery.set_rows(np.array(current.matrix), np.array(current.labels), np.array(current.image_indices))
+
+            gallery.remove_person(name)
+            if embeddings:
+                gallery.add_person(name, embeddings)
+            return self._write_generation(gallery)
@@ -0,0 +1,101 @@
+# Behaviour tests for identify admission control (admission.py).
+# Run with: python -m pytest test_admission.py
+
+import time
+import threading
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, DeadlineExceeded
+
+
+def test_requests_beyond_the_queue_are_rejected_with_retry_after():
+    admission = AdmissionController(max_in_flight=1, max_queue=1)
+    admission.acquire("a")
+    admission.enqueue("b")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.enqueue("c")
+    assert rejected.value.reason == "server over capacity"
+    assert rejected.value.retry_after >= 1
+
+
+def test_one_client_cannot_take_every_queue_place():
+    admission = AdmissionController(max_in_flight=1, max_queue=8)
+    admitted = 0
+    with pytest.raises(AdmissionRejected) as rejected:
+        for _ in range(9):
+            admission.enqueue("chatty")
+            admitted += 1
+    assert rejected.value.reason == "client over fair share"
+    assert admitted < 8
+    # A newcomer still gets in
+    admission.enqueue("quiet")
+
+
+def test_slots_are_granted_round_robin_across_clients():
+    admission = AdmissionController(max_in_flight=1, max_queue=8)
+    running = admission.acquire("a")
+    a1, a2 = admission.enqueue("a"), admission.enqueue("a")
+    b1 = admission.enqueue("b")
+
+    admission.release(running, 0.01)
+    assert a1.granted and not b1.granted
+    admission.release(admission.wait(a1), 0.01)
+    assert b1.granted and not a2.granted
+
+
+def test_expired_tickets_are_skipped_when_a_slot_frees():
+    admission = AdmissionController(max_in_flight=1, max_queue=8)
+    running = admission.acquire("a")
+    late = admission.enqueue("b", deadline=time.time() + 0.05)
+    live = admission.enqueue("c")
+    time.sleep(0.1)
+
+    admission.release(running, 0.01)
+
+    assert live.granted and not late.granted
+    with pytest.raises(DeadlineExceeded):
+        admission.wait(late)
+    stats = admission.stats()
+    assert stats["expired"] == 1
+    assert stats["queued"] == 0
+
+
+def test_wait_gives_up_at_the_deadline():
+    admission = AdmissionController(max_in_flight=1, max_queue=8)
+    admission.acquire("a")
+    ticket = admission.enqueue("b", deadline=time.time() + 0.05)
+
+    with pytest.raises(DeadlineExceeded):
+        admission.wait(ticket)
+    assert admission.stats()["queued"] == 0
+
+
+def test_cancel_hands_back_a_queued_or_granted_ticket():
+    admission = AdmissionController(max_in_flight=1, max_queue=8)
+    running = admission.acquire("a")
+    queued = admission.enqueue("b")
+
+    # A thread still blocked in wait() for the cancelled ticket is woken up
+    outcome = []
+
+    def wait():
+        try:
+            admission.wait(queued)
+            outcome.append("granted")
+        except DeadlineExceeded:
+            outcome.append("cancelled")
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.05)
+    admission.cancel(queued)
+    waiter.join(1)
+    assert outcome == ["cancelled"]
+
+    admission.cancel(running)
+    stats = admission.stats()
+    assert stats["in_flight"] == 0
+    assert stats["clients"] == 0
+    admission.acquire("c")
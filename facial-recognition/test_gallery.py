@@ -0,0 +1,75 @@
+# Behaviour tests for the embedding gallery (gallery.py).
+# Run with: python -m pytest test_gallery.py
+
+import numpy as np
+
+from gallery import EmbeddingGallery, select_representatives
+
+PROFILES = {
+    "Ann": {"embeddings": [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]], "model_name": "VGG-Face"},
+    "Bob": {"embeddings": [[0.0, 1.0, 0.0]], "model_name": "VGG-Face"},
+    "Cat": {"embeddings": [[0.0, 0.0, 1.0]], "model_name": "Facenet"},
+}
+
+
+def test_search_ranks_each_person_once_by_their_closest_embedding():
+    gallery = EmbeddingGallery.from_profiles(PROFILES)
+
+    results = gallery.search([0.9, 0.1, 0.0], k=5)
+
+    assert [name for name, _, _ in results] == ["Ann", "Bob"]
+    name, similarity, image_index = results[0]
+    assert image_index == 1
+    assert similarity > 0.99
+
+
+def test_search_honours_names_and_min_similarity():
+    gallery = EmbeddingGallery.from_profiles(PROFILES)
+
+    assert [r[0] for r in gallery.search([1.0, 0.0, 0.0], k=5, names=["Bob"])] == ["Bob"]
+    assert [r[0] for r in gallery.search([1.0, 0.0, 0.0], k=5, min_similarity=0.5)] == ["Ann"]
+
+
+def test_profiles_of_another_model_are_left_out():
+    gallery = EmbeddingGallery.from_profiles(PROFILES)
+
+    assert len(gallery) == 3
+    assert "Cat" not in gallery.names
+
+
+def test_remove_person_keeps_the_others_searchable():
+    gallery = EmbeddingGallery.from_profiles(PROFILES)
+    gallery.remove_person("Ann")
+
+    assert [r[0] for r in gallery.search([1.0, 0.0, 0.0], k=5)] == ["Bob"]
+
+
+def test_digest_is_independent_of_insertion_order():
+    forward = EmbeddingGallery.from_profiles(PROFILES)
+    backward = EmbeddingGallery.from_profiles(dict(reversed(list(PROFILES.items()))))
+
+    assert forward.digest() == backward.digest()
+
+    backward.add_person("Bob", [[0.1, 0.9, 0.0]])
+    assert forward.digest() != backward.digest()
+
+
+def test_digest_ignores_people_without_rows():
+    gallery = EmbeddingGallery.from_profiles(PROFILES)
+    before = gallery.digest()
+    gallery.add_person("Dan", [[0.5, 0.5, 0.0]])
+    gallery.remove_person("Dan")
+
+    assert gallery.digest() == before
+
+
+def test_select_representatives_drops_near_duplicates():
+    embeddings = [[1.0, 0.0], [1.0, 0.001], [0.0, 1.0]]
+
+    keep, report = select_representatives(embeddings, max_similarity=0.98)
+
+    # The earliest image of each group is kept
+    assert keep == [0, 2]
+    assert report["before"] == 3
+    assert report["after"] == 2
+    assert np.isclose(report["max_score_drop"], 0.0, atol=1e-3)
@@ -0,0 +1,114 @@
+# Behaviour tests for the append-only profile store (profile_log.py).
+# Run with: python -m pytest test_profile_log.py
+
+import os
+import tempfile
+
+from profile_log import ProfileStore, LOG_FILENAME
+
+
+def make_profile(name, count, prefix="e"):
+    return {
+        "name": name,
+        "embeddings": [[float(i), 1.0] for i in range(count)],
+        "image_paths": [f"/photos/{name}_{i}.jpg" for i in range(count)],
+        "image_hashes": [f"{name}-hash-{i}" for i in range(count)],
+        "entry_ids": [f"{prefix}{i}" for i in range(count)],
+        "model_name": "VGG-Face"
+    }
+
+
+def add_record(name, entry_id):
+    return {
+        "op": "add",
+        "name": name,
+        "embeddings": [[9.0, 9.0]],
+        "image_paths": [f"/photos/{name}_{entry_id}.jpg"],
+        "image_hashes": [f"{name}-hash-{entry_id}"],
+        "entry_ids": [entry_id],
+        "model_name": "VGG-Face"
+    }
+
+
+def test_replay_rebuilds_profiles_from_the_log():
+    directory = tempfile.mkdtemp()
+    store = ProfileStore(directory, compact_every=1000)
+    store.append({"op": "put", "name": "Ann", "profile": make_profile("Ann", 2)})
+    store.append(add_record("Ann", "new"))
+    store.append({"op": "remove", "name": "Ann", "entry_ids": ["e0"]})
+    store.append({"op": "put", "name": "Bob", "profile": make_profile("Bob", 1)})
+    store.append({"op": "rename", "name": "Bob", "new_name": "Robert",
+                  "image_paths": ["/photos/Robert_0.jpg"]})
+
+    profiles = ProfileStore(directory).load()
+
+    assert sorted(profiles) == ["Ann", "Robert"]
+    assert profiles["Ann"]["entry_ids"] == ["e1", "new"]
+    assert profiles["Robert"]["name"] == "Robert"
+    assert profiles["Robert"]["image_paths"] == ["/photos/Robert_0.jpg"]
+
+
+def test_replaying_already_compacted_records_is_harmless():
+    directory = tempfile.mkdtemp()
+    store = ProfileStore(directory, compact_every=1000)
+    store.append({"op": "put", "name": "Ann", "profile": make_profile("Ann", 1)})
+    store.append(add_record("Ann", "new"))
+    with store.locked():
+        records = store._read_log()
+    store.compact()
+
+    # A crash after the snapshots were written but before the log was truncated
+    for record in records:
+        store.append(record)
+    profiles = ProfileStore(directory).load()
+
+    assert profiles["Ann"]["entry_ids"] == ["e0", "new"]
+
+
+def test_torn_tail_is_truncated_and_later_appends_survive():
+    directory = tempfile.mkdtemp()
+    store = ProfileStore(directory, compact_every=1000)
+    store.append({"op": "put", "name": "Ann", "profile": make_profile("Ann", 1)})
+    log_path = os.path.join(directory, LOG_FILENAME)
+    intact = os.path.getsize(log_path)
+
+    # A crash mid-append leaves half a frame behind
+    store.append(add_record("Ann", "torn"))
+    with open(log_path, "r+b") as f:
+        f.truncate(os.path.getsize(log_path) - 5)
+
+    recovered = ProfileStore(directory, compact_every=1000)
+    profiles = recovered.load()
+    assert profiles["Ann"]["entry_ids"] == ["e0"]
+    assert os.path.getsize(log_path) == intact
+
+    recovered.append(add_record("Ann", "after"))
+    assert ProfileStore(directory).load()["Ann"]["entry_ids"] == ["e0", "after"]
+
+
+def test_compaction_writes_snapshots_and_empties_the_log():
+    directory = tempfile.mkdtemp()
+    store = ProfileStore(directory, compact_every=1000)
+    store.append({"op": "put", "name": "Ann", "profile": make_profile("Ann", 1)})
+    store.append({"op": "put", "name": "Bob", "profile": make_profile("Bob", 1)})
+    store.append({"op": "delete", "name": "Bob"})
+
+    assert store.compact() == 3
+    assert os.path.getsize(os.path.join(directory, LOG_FILENAME)) == 0
+    assert os.path.exists(os.path.join(directory, "Ann.pkl"))
+    assert not os.path.exists(os.path.join(directory, "Bob.pkl"))
+    assert sorted(ProfileStore(directory).load()) == ["Ann"]
+
+
+def test_load_profile_follows_renames():
+    directory = tempfile.mkdtemp()
+    store = ProfileStore(directory, compact_every=1000)
+    store.append({"op": "put", "name": "Bob", "profile": make_profile("Bob", 2)})
+    store.compact()
+    store.append({"op": "rename", "name": "Bob", "new_name": "Robert",
+                  "image_paths": ["/photos/Robert_0.jpg", "/photos/Robert_1.jpg"]})
+    store.append(add_record("Robert", "new"))
+
+    profile = store.load_profile("Robert")
+    assert profile["entry_ids"] == ["e0", "e1", "new"]
+    assert store.load_profile("Bob") is None
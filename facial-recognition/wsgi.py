@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# WSGI entry point for multi-worker (pre-fork) serving
+# ====================================================
+
+# Runs the REST API under several processes to get past the GIL, e.g.
+#
+#   gunicorn -w 4 -b 0.0.0.0:50001 wsgi:application
+#
+# Every worker maps the same shared gallery (see shared_gallery.py), so memory
+# stays flat as workers are added and an enrollment made through one worker is
+# visible to the others on their next request. Photos saved through
+# /api/save-profile-image are enrolled by whichever worker holds the profile
+# monitor's lock.
+
+import face_recognition
+from face_recognition import FamilyRecognitionSystem, SHARED_GALLERY_DIR, start_profile_monitor
+
+face_recognition.face_system = FamilyRecognitionSystem(shared_gallery_dir=SHARED_GALLERY_DIR)
+start_profile_monitor(face_recognition.face_system)
+application = face_recognition.app
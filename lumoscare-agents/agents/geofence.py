@@ -0,0 +1,628 @@
+# agents/geofence.py
+# Spatial index for safe-zone checks.
+#
+# Zones are bucketed into a uniform grid of lat/lon cells, so a location
+# update only runs the exact distance check against the few zones whose
+# bounding box overlaps the cell it falls into, instead of against every
+# zone. Each zone's center is converted to radians and its cos(lat) is
+# computed once when it is added.
+#
+# Backlogs of fixes (e.g. flushed by a device that reconnects) can be checked
+# with locate_batch, which does the cell lookup and the haversine for the whole
+# batch as NumPy array operations instead of one Python call per fix.
+#
+# depth() and depth_batch() report how far a fix is inside (or outside) its
+# nearest zone edge, for the hysteresis in geofence_state. Zones are filed
+# under every cell within margin_m of them, so a fix up to margin_m outside a
+# zone still has that zone among its candidates.
+#
+# evaluate() adds a slack: a distance the point can move without its depth
+# crossing any of the given thresholds, its deepest zone changing, or it
+# leaving its grid cell (and with it, the set of candidate zones). Every
+# zone's depth changes by at most the distance moved, so a later fix closer
+# than the slack is known to give the same answer without being checked.
+#
+# Zones are circles (CircleZone) or polygons (PolygonZone). A polygon is
+# projected once to planar meters around its own center, and keeps a slab
+# index of its edges for point-in-polygon and a coarse grid of which edges
+# are near each cell for the distance to its boundary, so a check costs about
+# the same however many vertices the polygon has.
+from math import radians, degrees, cos, sin, asin, sqrt, floor, ceil, inf
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Mean radius of the earth in meters, as used by the original distance check
+EARTH_RADIUS_M = 6371e3
+
+# Edge length of a grid cell in meters (measured along a meridian)
+DEFAULT_CELL_SIZE_M = 500.0
+
+# Polygon depths are clamped to this many meters either side of the edge; it
+# has to cover the index margin and the hysteresis margins
+POLYGON_DEPTH_LIMIT_M = 50.0
+
+# Bits per grid coordinate in the packed int64 cell keys used by locate_batch;
+# enough for cells down to about 10 m
+_CELL_BITS = 21
+_CELL_OFFSET = 1 << (_CELL_BITS - 1)
+_CELL_MASK = (1 << _CELL_BITS) - 1
+
+
+def haversine_distance(lat1_rad, lon1_rad, cos_lat1, lat2_rad, lon2_rad, cos_lat2):
+    """Great-circle distance in meters between two points given in radians."""
+    a = sin((lat2_rad - lat1_rad) / 2) ** 2 + cos_lat1 * cos_lat2 * sin((lon2_rad - lon1_rad) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(min(1.0, sqrt(a)))
+
+
+def haversine_distance_array(lat1_rad, lon1_rad, cos_lat1, lat2_rad, lon2_rad, cos_lat2):
+    """Element-wise haversine_distance over NumPy arrays."""
+    a = np.sin((lat2_rad - lat1_rad) / 2) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon2_rad - lon1_rad) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+class CircleZone:
+    """A circular safe zone with its trigonometry precomputed."""
+
+    __slots__ = ("zone_id", "name", "patient_id", "latitude", "longitude", "radius",
+                 "lat_rad", "lon_rad", "cos_lat")
+
+    def __init__(self, zone_id, name, latitude, longitude, radius, patient_id=None):
+        self.zone_id = zone_id
+        self.name = name
+        self.patient_id = patient_id  # None applies the zone to every patient
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius
+        self.lat_rad = radians(latitude)
+        self.lon_rad = radians(longitude)
+        self.cos_lat = cos(self.lat_rad)
+
+    @classmethod
+    def from_dict(cls, zone, patient_id=None):
+        """Build a zone from the safe_zones dict format ({"name", "center", "radius"})."""
+        return cls(
+            zone_id=zone.get("id", zone.get("_id", zone["name"])),
+            name=zone["name"],
+            latitude=zone["center"]["latitude"],
+            longitude=zone["center"]["longitude"],
+            radius=zone["radius"],
+            patient_id=zone.get("patient_id", patient_id)
+        )
+
+    def bounding_box(self, margin_m=0.0) -> Tuple[float, float, float, float]:
+        """(min_lat, min_lon, max_lat, max_lon) in degrees enclosing the circle grown by margin_m."""
+        dlat = degrees((self.radius + margin_m) / EARTH_RADIUS_M)
+        # Longitude degrees shrink with cos(lat); near the poles cover every longitude
+        cos_edge = cos(radians(min(89.9, abs(self.latitude) + dlat)))
+        dlon = min(180.0, dlat / cos_edge)
+        return (self.latitude - dlat, self.longitude - dlon,
+                self.latitude + dlat, self.longitude + dlon)
+
+    def distance_to(self, lat_rad, lon_rad, cos_lat):
+        """Distance in meters from a point (in radians) to the zone's center."""
+        return haversine_distance(lat_rad, lon_rad, cos_lat, self.lat_rad, self.lon_rad, self.cos_lat)
+
+    def contains(self, lat_rad, lon_rad, cos_lat):
+        return self.distance_to(lat_rad, lon_rad, cos_lat) <= self.radius
+
+    def depth_at(self, lat_rad, lon_rad, cos_lat):
+        """Meters inside the edge (negative outside)."""
+        return self.radius - self.distance_to(lat_rad, lon_rad, cos_lat)
+
+
+class PolygonZone:
+    """
+    A polygonal safe zone in local planar coordinates.
+
+    Vertices are projected to meters east (x) and north (y) of the bounding
+    box center. Edges are filed into horizontal slabs, so point-in-polygon
+    only ray-casts against the edges of one slab. For the depth, a grid over
+    the polygon records for each cell either which side of the polygon the
+    whole cell is on (when no edge is within the depth limit) or the edges
+    near enough to matter, which are checked as one array operation.
+
+    Depths are distances to the boundary in the projection, divided by the
+    largest factor by which the projection can stretch a distance within
+    reach of the zone and clamped to +-depth_limit_m. That keeps them from
+    changing by more than the distance a point moves, which the slack in
+    GeofenceIndex.evaluate relies on.
+    """
+
+    __slots__ = ("zone_id", "name", "patient_id", "vertices", "depth_limit_m",
+                 "lat0", "lon0", "cos0", "scale", "xs", "ys", "min_x", "min_y", "max_x", "max_y",
+                 "_slab_y0", "_slab_height", "_slabs", "_edges",
+                 "_grid_x0", "_grid_y0", "_grid_size", "_grid_cols", "_grid_rows", "_grid")
+
+    def __init__(self, zone_id, name, vertices, patient_id=None, depth_limit_m=POLYGON_DEPTH_LIMIT_M):
+        vertices = [(float(lat), float(lon)) for lat, lon in vertices]
+        if len(vertices) > 1 and vertices[0] == vertices[-1]:
+            vertices = vertices[:-1]
+        if len(vertices) < 3:
+            raise ValueError(f"polygon zone {zone_id!r} needs at least 3 vertices")
+        self.zone_id = zone_id
+        self.name = name
+        self.patient_id = patient_id  # None applies the zone to every patient
+        self.vertices = vertices
+        self.depth_limit_m = depth_limit_m
+
+        lats = np.array([v[0] for v in vertices])
+        lons = np.array([v[1] for v in vertices])
+        self.lat0 = radians((lats.min() + lats.max()) / 2)
+        self.lon0 = radians((lons.min() + lons.max()) / 2)
+        self.cos0 = cos(self.lat0)
+        self.xs = EARTH_RADIUS_M * self.cos0 * (np.radians(lons) - self.lon0)
+        self.ys = EARTH_RADIUS_M * (np.radians(lats) - self.lat0)
+        self.min_x, self.max_x = float(self.xs.min()), float(self.xs.max())
+        self.min_y, self.max_y = float(self.ys.min()), float(self.ys.max())
+
+        # Within reach (twice the depth limit) the projection stretches east-west
+        # distances by at most cos0 / cos(most poleward latitude), and chords are
+        # shorter than arcs by a factor close to 1 for zone-sized areas
+        reach = 2 * depth_limit_m
+        poleward = min(radians(89.9), max(abs(radians(lats.min())), abs(radians(lats.max())))
+                       + reach / EARTH_RADIUS_M)
+        extent = sqrt((self.max_x - self.min_x + 2 * reach) ** 2
+                      + (self.max_y - self.min_y + 2 * reach) ** 2) / EARTH_RADIUS_M
+        self.scale = max(1.0, self.cos0 / cos(poleward)) / (1 - extent ** 2 / 6)
+
+        x1, y1 = self.xs, self.ys
+        x2, y2 = np.roll(self.xs, -1), np.roll(self.ys, -1)
+        keep = (x1 != x2) | (y1 != y2)  # Repeated vertices make zero-length edges
+        edges = np.stack([x1[keep], y1[keep], x2[keep], y2[keep]], axis=1)
+        self._build_slabs(edges)
+        self._build_grid(edges)
+
+    @classmethod
+    def from_dict(cls, zone, patient_id=None):
+        """Build a zone from {"name", "polygon": [{"latitude", "longitude"}, ...]}."""
+        return cls(
+            zone_id=zone.get("id", zone.get("_id", zone["name"])),
+            name=zone["name"],
+            vertices=[(vertex["latitude"], vertex["longitude"]) for vertex in zone["polygon"]],
+            patient_id=zone.get("patient_id", patient_id)
+        )
+
+    def _build_slabs(self, edges):
+        # One slab per edge: a horizontal ray then meets a handful of edges
+        count = len(edges)
+        self._slab_y0 = self.min_y
+        self._slab_height = (self.max_y - self.min_y) / count or 1.0
+        self._slabs = [[] for _ in range(count)]
+        for edge in map(tuple, edges.tolist()):
+            x1, y1, x2, y2 = edge
+            first = int((min(y1, y2) - self._slab_y0) / self._slab_height)
+            last = min(count - 1, int((max(y1, y2) - self._slab_y0) / self._slab_height))
+            for slab in range(first, last + 1):
+                self._slabs[slab].append(edge)
+
+    def _build_grid(self, edges):
+        limit = self.depth_limit_m
+        reach = 2 * limit
+        # Cells half the depth limit across, but at most about 256 to a side
+        size = max(limit / 2, (self.max_x - self.min_x + 2 * reach) / 256, (self.max_y - self.min_y + 2 * reach) / 256)
+        self._grid_size = size
+        self._grid_x0 = self.min_x - reach
+        self._grid_y0 = self.min_y - reach
+        self._grid_cols = ceil((self.max_x - self.min_x + 2 * reach) / size)
+        self._grid_rows = ceil((self.max_y - self.min_y + 2 * reach) / size)
+
+        x1, y1 = edges[:, 0], edges[:, 1]
+        dx, dy = edges[:, 2] - x1, edges[:, 3] - y1
+        length2 = dx * dx + dy * dy
+        self._edges = (x1, y1, dx, dy, length2)
+        # An edge within the limit of any point in a cell is within limit plus half a diagonal of its center
+        near = limit + size * sqrt(2) / 2
+        centers_x = self._grid_x0 + (np.arange(self._grid_cols) + 0.5) * size
+        self._grid = []
+        for row in range(self._grid_rows):
+            center_y = self._grid_y0 + (row + 0.5) * size
+            px, py = centers_x[:, None], center_y
+            t = np.clip(((px - x1) * dx + (py - y1) * dy) / length2, 0.0, 1.0)
+            distance = np.hypot(x1 + t * dx - px, y1 + t * dy - py)
+            for col in range(self._grid_cols):
+                close = np.flatnonzero(distance[col] <= near)
+                if len(close):
+                    self._grid.append(close.astype(np.int32))
+                else:
+                    # Nothing near: the whole cell is on one side, deeper than the limit
+                    self._grid.append(self._contains_xy(float(centers_x[col]), center_y))
+
+    def project(self, lat_rad, lon_rad):
+        return EARTH_RADIUS_M * self.cos0 * (lon_rad - self.lon0), EARTH_RADIUS_M * (lat_rad - self.lat0)
+
+    def _contains_xy(self, x, y):
+        if not (self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y):
+            return False
+        slab = min(len(self._slabs) - 1, int((y - self._slab_y0) / self._slab_height))
+        inside = False
+        for x1, y1, x2, y2 in self._slabs[slab]:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def bounding_box(self, margin_m=0.0) -> Tuple[float, float, float, float]:
+        """(min_lat, min_lon, max_lat, max_lon) in degrees enclosing the polygon grown by margin_m."""
+        pad = margin_m * self.scale
+        return (degrees(self.lat0 + (self.min_y - pad) / EARTH_RADIUS_M),
+                degrees(self.lon0 + (self.min_x - pad) / (EARTH_RADIUS_M * self.cos0)),
+                degrees(self.lat0 + (self.max_y + pad) / EARTH_RADIUS_M),
+                degrees(self.lon0 + (self.max_x + pad) / (EARTH_RADIUS_M * self.cos0)))
+
+    def contains(self, lat_rad, lon_rad, cos_lat):
+        return self._contains_xy(*self.project(lat_rad, lon_rad))
+
+    def depth_at(self, lat_rad, lon_rad, cos_lat):
+        """Meters inside the edge (negative outside), clamped to +-depth_limit_m."""
+        x, y = self.project(lat_rad, lon_rad)
+        col = floor((x - self._grid_x0) / self._grid_size)
+        row = floor((y - self._grid_y0) / self._grid_size)
+        if not (0 <= col < self._grid_cols and 0 <= row < self._grid_rows):
+            return -self.depth_limit_m
+        cell = self._grid[row * self._grid_cols + col]
+        if cell is True or cell is False:
+            return self.depth_limit_m if cell else -self.depth_limit_m
+        x1, y1, dx, dy, length2 = (values[cell] for values in self._edges)
+        t = np.clip(((x - x1) * dx + (y - y1) * dy) / length2, 0.0, 1.0)
+        distance = float(np.sqrt(((x1 + t * dx - x) ** 2 + (y1 + t * dy - y) ** 2).min()))
+        depth = min(distance / self.scale, self.depth_limit_m)
+        return depth if self._contains_xy(x, y) else -depth
+
+
+Zone = Union[CircleZone, PolygonZone]
+
+
+def zone_from_dict(zone, patient_id=None) -> Zone:
+    """A circle or polygon zone from its dict form, by whether it has a "polygon"."""
+    if "polygon" in zone:
+        return PolygonZone.from_dict(zone, patient_id)
+    return CircleZone.from_dict(zone, patient_id)
+
+
+class GeofenceIndex:
+    """Uniform-grid index from (patient, cell) to the safe zones overlapping that cell."""
+
+    def __init__(self, cell_size_m=DEFAULT_CELL_SIZE_M, margin_m=0.0):
+        self.cell_deg = degrees(cell_size_m / EARTH_RADIUS_M)
+        self.margin_m = margin_m  # Distance outside a zone within which it stays a candidate
+        self.zones: Dict[object, Zone] = {}
+        self._zone_counts: Dict[object, int] = {}  # patient_id (None for shared) -> number of zones
+        self._cells: Dict[Tuple, List[Zone]] = {}
+        self._arrays = None  # Array form of the index for locate_batch, rebuilt after changes
+        self.version = 0  # Bumped on every change, so cached results can tell they are stale
+        self.lookups = 0
+        self.distance_checks = 0
+
+    @classmethod
+    def from_zones(cls, zones: Iterable[dict], patient_id=None, cell_size_m=DEFAULT_CELL_SIZE_M, margin_m=0.0):
+        """Build an index from zones in the safe_zones dict format, circles or polygons."""
+        index = cls(cell_size_m, margin_m)
+        for zone in zones:
+            index.add_zone(zone_from_dict(zone, patient_id))
+        return index
+
+    def __len__(self):
+        return len(self.zones)
+
+    def has_zones(self, patient_id=None):
+        """Whether any zone applies to the patient; with none, depth is -inf everywhere."""
+        return None in self._zone_counts or patient_id in self._zone_counts
+
+    def _cell(self, latitude, longitude):
+        return floor(latitude / self.cell_deg), floor(longitude / self.cell_deg)
+
+    def _cell_keys(self, zone):
+        min_lat, min_lon, max_lat, max_lon = zone.bounding_box(self.margin_m)
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                yield (zone.patient_id, row, col)
+
+    def add_zone(self, zone: Zone):
+        """Add a zone, replacing any zone with the same id."""
+        if isinstance(zone, PolygonZone) and zone.depth_limit_m < self.margin_m:
+            raise ValueError(f"polygon zone {zone.zone_id!r} has a depth limit of {zone.depth_limit_m} m, "
+                             f"less than the index margin of {self.margin_m} m")
+        if zone.zone_id in self.zones:
+            self.remove_zone(zone.zone_id)
+        self.zones[zone.zone_id] = zone
+        self._zone_counts[zone.patient_id] = self._zone_counts.get(zone.patient_id, 0) + 1
+        for key in self._cell_keys(zone):
+            self._cells.setdefault(key, []).append(zone)
+        self._arrays = None
+        self.version += 1
+
+    def remove_zone(self, zone_id):
+        zone = self.zones.pop(zone_id, None)
+        if zone is None:
+            return
+        self._zone_counts[zone.patient_id] -= 1
+        if not self._zone_counts[zone.patient_id]:
+            del self._zone_counts[zone.patient_id]
+        for key in self._cell_keys(zone):
+            cell = self._cells.get(key)
+            if cell is not None:
+                cell.remove(zone)
+                if not cell:
+                    del self._cells[key]
+        self._arrays = None
+        self.version += 1
+
+    def candidates(self, latitude, longitude, patient_id=None) -> List[Zone]:
+        """Zones whose bounding box overlaps the point's cell: the patient's own and shared ones."""
+        row, col = self._cell(latitude, longitude)
+        shared = self._cells.get((None, row, col), [])
+        if patient_id is None:
+            return shared
+        own = self._cells.get((patient_id, row, col), [])
+        return own + shared if shared else own
+
+    def locate(self, latitude, longitude, patient_id=None) -> Optional[Zone]:
+        """The first zone containing the point, or None if it is outside all of them."""
+        self.lookups += 1
+        candidates = self.candidates(latitude, longitude, patient_id)
+        if not candidates:
+            return None
+        lat_rad, lon_rad = radians(latitude), radians(longitude)
+        cos_lat = cos(lat_rad)
+        for zone in candidates:
+            self.distance_checks += 1
+            if zone.contains(lat_rad, lon_rad, cos_lat):
+                return zone
+        return None
+
+    def depth(self, latitude, longitude, patient_id=None) -> Tuple[float, Optional[Zone]]:
+        """
+        How far the point is inside its deepest zone, in meters, and that zone.
+
+        Negative depths mean the point is outside every zone by that much. They
+        are exact down to -margin_m; below that the result only says the point
+        is more than margin_m from every zone (-inf if no zone is near).
+        """
+        self.lookups += 1
+        best, best_zone = -inf, None
+        candidates = self.candidates(latitude, longitude, patient_id)
+        if not candidates:
+            return best, best_zone
+        lat_rad, lon_rad = radians(latitude), radians(longitude)
+        cos_lat = cos(lat_rad)
+        for zone in candidates:
+            self.distance_checks += 1
+            depth = zone.depth_at(lat_rad, lon_rad, cos_lat)
+            if depth > best:
+                best, best_zone = depth, zone
+        return best, best_zone
+
+    def evaluate(self, latitude, longitude, patient_id=None, thresholds=()):
+        """
+        depth() plus the slack: how far (in meters) the point can move while
+        the depth stays on the same side of every threshold and the deepest
+        zone stays the same.
+
+        Returns:
+            Tuple of (depth, deepest zone or None, slack)
+        """
+        self.lookups += 1
+        lat_rad, lon_rad = radians(latitude), radians(longitude)
+        cos_lat = cos(lat_rad)
+        best, second, best_zone = -inf, -inf, None
+        for zone in self.candidates(latitude, longitude, patient_id):
+            self.distance_checks += 1
+            depth = zone.depth_at(lat_rad, lon_rad, cos_lat)
+            if depth > best:
+                best, second, best_zone = depth, best, zone
+            elif depth > second:
+                second = depth
+
+        # Zones that are not candidates are more than margin_m away anywhere in
+        # this cell, so they cannot matter until the point leaves it. A move of
+        # d meters changes latitude by at most d / R radians, and longitude by
+        # at most what a chord at the cell's most poleward edge allows.
+        row, col = self._cell(latitude, longitude)
+        cell_rad = radians(self.cell_deg)
+        lat_edge = min(lat_rad - row * cell_rad, (row + 1) * cell_rad - lat_rad)
+        lon_edge = min(lon_rad - col * cell_rad, (col + 1) * cell_rad - lon_rad)
+        cos_edge = cos(min(radians(89.9), max(abs(row), abs(row + 1)) * cell_rad))
+        slack = min(EARTH_RADIUS_M * lat_edge, 2 * EARTH_RADIUS_M * cos_edge * sin(lon_edge / 2))
+
+        if best > -inf:
+            for threshold in thresholds:
+                slack = min(slack, abs(best - threshold))
+            if second > -inf:
+                # Both depths can move toward each other
+                slack = min(slack, (best - second) / 2)
+        return best, best_zone, max(0.0, slack)
+
+    def is_within(self, latitude, longitude, patient_id=None):
+        """Same result shape as is_within_safe_zones: (inside, zone name or None)."""
+        zone = self.locate(latitude, longitude, patient_id)
+        return (True, zone.name) if zone is not None else (False, None)
+
+    def stats(self):
+        return {
+            "zones": len(self.zones),
+            "cells": len(self._cells),
+            "lookups": self.lookups,
+            "distance_checks": self.distance_checks
+        }
+
+    def _build_arrays(self):
+        """
+        Flatten the grid into arrays: circle parameters by position, and a
+        CSR-style table from packed (patient, row, col) keys to circle
+        positions. Cells holding a polygon are listed in polygon_keys; fixes
+        falling in them are checked one at a time.
+        """
+        zone_list = [zone for zone in self.zones.values() if isinstance(zone, CircleZone)]
+        position = {id(zone): i for i, zone in enumerate(zone_list)}
+        # Code 0 is reserved for zones shared by every patient
+        patient_codes = {None: 0}
+        for zone in self.zones.values():
+            patient_codes.setdefault(zone.patient_id, len(patient_codes))
+
+        keys = np.array([self._pack(patient_codes[patient_id], row, col)
+                         for patient_id, row, col in self._cells], dtype=np.int64)
+        cells = [[position[id(zone)] for zone in cell if isinstance(zone, CircleZone)]
+                 for cell in self._cells.values()]
+        has_polygon = np.array([len(members) < len(cell) for members, cell in zip(cells, self._cells.values())],
+                               dtype=bool)
+        order = np.argsort(keys)
+        counts = np.array([len(cells[i]) for i in order], dtype=np.int64)
+        members = [member for i in order for member in cells[i]]
+
+        self._arrays = {
+            "patient_codes": patient_codes,
+            "polygon_keys": np.sort(keys[has_polygon]) if len(keys) else keys,
+            "keys": keys[order],
+            "starts": np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64),
+            "counts": counts,
+            "members": np.array(members, dtype=np.int64),
+            "lat_rad": np.array([zone.lat_rad for zone in zone_list]),
+            "lon_rad": np.array([zone.lon_rad for zone in zone_list]),
+            "cos_lat": np.array([zone.cos_lat for zone in zone_list]),
+            "radius": np.array([zone.radius for zone in zone_list], dtype=float),
+            "zone_ids": np.empty(len(zone_list), dtype=object)
+        }
+        self._arrays["zone_ids"][:] = [zone.zone_id for zone in zone_list]
+        return self._arrays
+
+    @staticmethod
+    def _pack(patient_code, row, col):
+        return ((patient_code << (2 * _CELL_BITS))
+                | (((row + _CELL_OFFSET) & _CELL_MASK) << _CELL_BITS)
+                | ((col + _CELL_OFFSET) & _CELL_MASK))
+
+    def _batch_keys(self, arrays, patient_ids, latitudes, longitudes):
+        """Packed own-zone and shared-zone cell keys per fix, and the fixes in radians."""
+        # Map patient ids to the codes used in the packed keys; unknown patients get
+        # -1, which matches no key, so they are checked against shared zones only
+        patient_codes = arrays["patient_codes"]
+        codes = np.fromiter((patient_codes.get(pid, -1) if pid is not None else -1 for pid in patient_ids),
+                            dtype=np.int64, count=len(latitudes))
+
+        rows = np.floor(latitudes / self.cell_deg).astype(np.int64)
+        cols = np.floor(longitudes / self.cell_deg).astype(np.int64)
+        cell_bits = (((rows + _CELL_OFFSET) & _CELL_MASK) << _CELL_BITS) | ((cols + _CELL_OFFSET) & _CELL_MASK)
+        own_keys = np.where(codes >= 0, (codes << (2 * _CELL_BITS)) | cell_bits, -1)
+        lat_rad = np.radians(latitudes)
+        return own_keys, cell_bits, (lat_rad, np.radians(longitudes), np.cos(lat_rad))
+
+    @staticmethod
+    def _polygon_fixes(arrays, own_keys, cell_bits):
+        """Positions of the fixes whose own or shared cell holds a polygon."""
+        polygon_keys = arrays["polygon_keys"]
+        if not len(polygon_keys):
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(np.isin(own_keys, polygon_keys) | np.isin(cell_bits, polygon_keys))
+
+    def _candidate_pairs(self, arrays, fixes, fix_keys, points):
+        """
+        Expand fixes to (fix, zone) candidate pairs for one set of cell keys,
+        ordered by fix and then candidate order, with the distance of each pair.
+        """
+        slot = np.minimum(np.searchsorted(arrays["keys"], fix_keys), len(arrays["keys"]) - 1)
+        counts = np.where(arrays["keys"][slot] == fix_keys, arrays["counts"][slot], 0)
+        total = int(counts.sum())
+        fix = np.repeat(fixes, counts)
+        offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        zone = arrays["members"][np.repeat(arrays["starts"][slot], counts) + offset]
+        self.distance_checks += total
+
+        lat_rad, lon_rad, cos_lat = points
+        distance = haversine_distance_array(
+            lat_rad[fix], lon_rad[fix], cos_lat[fix],
+            arrays["lat_rad"][zone], arrays["lon_rad"][zone], arrays["cos_lat"][zone]
+        )
+        return fix, zone, distance
+
+    def locate_batch(self, patient_ids, latitudes, longitudes):
+        """
+        Check many fixes at once.
+
+        Each fix is matched against the same candidates as in locate(), and the
+        first zone containing it wins, so results agree with calling locate()
+        per fix. Fixes in cells that hold a polygon are passed to locate().
+
+        Args:
+            patient_ids: Array of patient ids (None for shared zones only)
+            latitudes: Array of latitudes in degrees
+            longitudes: Array of longitudes in degrees
+
+        Returns:
+            Tuple of (bool array inside, object array of zone ids or None)
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        n = len(latitudes)
+        inside = np.zeros(n, dtype=bool)
+        zone_ids = np.full(n, None, dtype=object)
+        if n == 0 or not self.zones:
+            return inside, zone_ids
+        arrays = self._arrays or self._build_arrays()
+        own_keys, cell_bits, points = self._batch_keys(arrays, patient_ids, latitudes, longitudes)
+        scalar = self._polygon_fixes(arrays, own_keys, cell_bits)
+        for i in scalar:
+            zone = self.locate(latitudes[i], longitudes[i], patient_ids[i])
+            if zone is not None:
+                inside[i], zone_ids[i] = True, zone.zone_id
+
+        # The patient's own zones are tried before the shared ones, as in candidates()
+        pending = np.setdiff1d(np.arange(n), scalar, assume_unique=True)
+        for fix_keys in (own_keys, cell_bits):
+            fix, zone, distance = self._candidate_pairs(arrays, pending, fix_keys[pending], points)
+            if len(fix):
+                hit = distance <= arrays["radius"][zone]
+                fix, zone = fix[hit], zone[hit]
+                first = np.ones(len(fix), dtype=bool)
+                first[1:] = fix[1:] != fix[:-1]
+                inside[fix[first]] = True
+                zone_ids[fix[first]] = arrays["zone_ids"][zone[first]]
+            pending = pending[~inside[pending]]
+            if not len(pending):
+                break
+
+        self.lookups += n - len(scalar)
+        return inside, zone_ids
+
+    def depth_batch(self, patient_ids, latitudes, longitudes):
+        """
+        depth() for many fixes at once.
+
+        Returns:
+            Tuple of (float array of depths in meters, object array of the
+            deepest zone's id or None)
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        n = len(latitudes)
+        depths = np.full(n, -inf)
+        zone_ids = np.full(n, None, dtype=object)
+        if n == 0 or not self.zones:
+            return depths, zone_ids
+        arrays = self._arrays or self._build_arrays()
+        own_keys, cell_bits, points = self._batch_keys(arrays, patient_ids, latitudes, longitudes)
+        scalar = self._polygon_fixes(arrays, own_keys, cell_bits)
+        for i in scalar:
+            depth, zone = self.depth(latitudes[i], longitudes[i], patient_ids[i])
+            depths[i], zone_ids[i] = depth, zone.zone_id if zone is not None else None
+
+        # Unlike locate_batch, a shared zone may be deeper than an own one, so both passes see every fix
+        fixes = np.setdiff1d(np.arange(n), scalar, assume_unique=True)
+        for fix_keys in (own_keys, cell_bits):
+            fix, zone, distance = self._candidate_pairs(arrays, fixes, fix_keys[fixes], points)
+            if not len(fix):
+                continue
+            depth = arrays["radius"][zone] - distance
+            # Deepest candidate per fix: sort by fix, then by depth descending
+            order = np.lexsort((-depth, fix))
+            fix, zone, depth = fix[order], zone[order], depth[order]
+            first = np.ones(len(fix), dtype=bool)
+            first[1:] = fix[1:] != fix[:-1]
+            fix, zone, depth = fix[first], zone[first], depth[first]
+            deeper = depth > depths[fix]
+            depths[fix[deeper]] = depth[deeper]
+            zone_ids[fix[deeper]] = arrays["zone_ids"][zone[deeper]]
+
+        self.lookups += n - len(scalar)
+        return depths, zone_ids
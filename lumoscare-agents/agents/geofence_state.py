@@ -0,0 +1,265 @@
+# agents/geofence_state.py
+# Per-patient inside/outside state for safe-zone alerts.
+#
+# A GPS fix near a zone's edge jitters back and forth across it, and a patient
+# who stays outside keeps sending fixes that are outside. Alerting on every
+# such fix turns both cases into a stream of alerts and phone calls. Instead
+# each patient has a state that changes only when the fixes say so clearly
+# and for long enough:
+#   - hysteresis: leaving takes a fix more than GEOFENCE_EXIT_MARGIN_M beyond
+#     the zone's edge, and coming back takes one GEOFENCE_ENTER_MARGIN_M
+#     inside it; fixes in between keep the current state
+#   - dwell: the new side has to hold for the dwell time, measured by fix
+#     timestamps, before the change is confirmed
+#   - cooldown: an exit within GEOFENCE_ALERT_COOLDOWN_S of the last alert
+#     still changes the state but does not alert again
+# Only confirmed transitions are reported, so a patient who stays outside for
+# an hour produces one alert.
+#
+# Most fixes from a resting patient are a few meters from the last one. The
+# tracker remembers the last fix it checked against the zones (the anchor)
+# and the slack GeofenceIndex.evaluate gave for it; a fix closer to the
+# anchor than the slack is on the same side of every threshold, with the same
+# deepest zone, so it reuses the anchor's result instead of being checked.
+# The distance used is an upper bound on the true one, so this is exact.
+#
+# A patient with no safe zones at all (the backend has none on file and
+# there are no defaults) is never reported as outside: their fixes are
+# counted and otherwise ignored.
+import os
+from math import radians, cos
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from agents.geofence import EARTH_RADIUS_M
+
+INSIDE = "inside"
+OUTSIDE = "outside"
+UNKNOWN = "unknown"
+
+GEOFENCE_EXIT_MARGIN_M = float(os.getenv('GEOFENCE_EXIT_MARGIN_M', '25'))  # Beyond the edge before a fix counts as outside
+GEOFENCE_ENTER_MARGIN_M = float(os.getenv('GEOFENCE_ENTER_MARGIN_M', '10'))  # Inside the edge before a fix counts as inside
+GEOFENCE_EXIT_DWELL_S = float(os.getenv('GEOFENCE_EXIT_DWELL_S', '30'))  # Time outside before an exit is confirmed
+GEOFENCE_ENTER_DWELL_S = float(os.getenv('GEOFENCE_ENTER_DWELL_S', '60'))  # Time inside before a return is confirmed
+GEOFENCE_ALERT_COOLDOWN_S = float(os.getenv('GEOFENCE_ALERT_COOLDOWN_S', '900'))  # Minimum time between exit alerts
+
+
+class GeofenceTransition:
+    """A confirmed change of a patient's state, at the fix that confirmed it."""
+
+    __slots__ = ("patient_id", "previous", "state", "zone_id", "latitude", "longitude", "timestamp", "alert")
+
+    def __init__(self, patient_id, previous, state, zone_id, latitude, longitude, timestamp, alert):
+        self.patient_id = patient_id
+        self.previous = previous
+        self.state = state
+        self.zone_id = zone_id  # The zone entered, or the zone left on an exit
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timestamp = timestamp
+        self.alert = alert  # False for entries and for exits inside the cooldown
+
+
+class PatientGeofenceState:
+    __slots__ = ("state", "zone_id", "candidate", "candidate_since", "last_fix", "last_alert",
+                 "anchor_lat", "anchor_lon", "anchor_cos", "anchor_depth", "anchor_zone_id",
+                 "anchor_slack", "anchor_version")
+
+    def __init__(self):
+        self.state = UNKNOWN
+        self.zone_id = None
+        self.candidate = None  # Side the recent fixes point to, while it is not confirmed
+        self.candidate_since = None
+        self.last_fix = None
+        self.last_alert = None
+        # Last fix checked against the zones (in radians) and its result
+        self.anchor_lat = self.anchor_lon = self.anchor_cos = 0.0
+        self.anchor_depth = None
+        self.anchor_zone_id = None
+        self.anchor_slack = 0.0
+        self.anchor_version = None
+
+
+class GeofenceTracker:
+    """Turns a patient's fixes into confirmed enter/exit transitions."""
+
+    def __init__(self, index,
+                 exit_margin_m=GEOFENCE_EXIT_MARGIN_M,
+                 enter_margin_m=GEOFENCE_ENTER_MARGIN_M,
+                 exit_dwell_s=GEOFENCE_EXIT_DWELL_S,
+                 enter_dwell_s=GEOFENCE_ENTER_DWELL_S,
+                 alert_cooldown_s=GEOFENCE_ALERT_COOLDOWN_S,
+                 skip_unmoved=True):
+        if index.margin_m < exit_margin_m:
+            # Depths below -margin_m are not exact, so the exit threshold has to lie within it
+            raise ValueError(f"index margin {index.margin_m} m is smaller than the exit margin {exit_margin_m} m")
+        self.index = index
+        self.exit_margin_m = exit_margin_m
+        self.enter_margin_m = enter_margin_m
+        self.exit_dwell_s = exit_dwell_s
+        self.enter_dwell_s = enter_dwell_s
+        self.alert_cooldown_s = alert_cooldown_s
+        self.skip_unmoved = skip_unmoved
+        self.thresholds = (enter_margin_m, -exit_margin_m)
+        self.patients: Dict[object, PatientGeofenceState] = {}
+        self.stats_counters = {"fixes": 0, "stale_fixes": 0, "no_zone_fixes": 0, "transitions": 0, "alerts": 0,
+                               "suppressed_alerts": 0, "evaluations": 0, "skipped_evaluations": 0}
+
+    def state(self, patient_id):
+        patient = self.patients.get(patient_id)
+        return patient.state if patient is not None else UNKNOWN
+
+    def _side(self, depth):
+        if depth >= self.enter_margin_m:
+            return INSIDE
+        if depth < -self.exit_margin_m:
+            return OUTSIDE
+        return None  # Within the hysteresis band around the edge
+
+    def observe(self, patient_id, depth, zone_id, latitude, longitude, timestamp) -> Optional[GeofenceTransition]:
+        """
+        Feed one fix, already measured against the zones.
+
+        Args:
+            patient_id: Patient the fix belongs to
+            depth: Meters inside the deepest zone (negative outside), from GeofenceIndex.depth
+            zone_id: Id of that zone, or None
+            latitude, longitude: The fix, reported back in the transition
+            timestamp: Unix time the fix was taken
+
+        Returns:
+            The transition this fix confirmed, or None
+        """
+        self.stats_counters["fixes"] += 1
+        patient = self._patient(patient_id)
+        if patient.last_fix is not None and timestamp < patient.last_fix:
+            # Older than a fix already applied; it cannot change the current state
+            self.stats_counters["stale_fixes"] += 1
+            return None
+        patient.last_fix = timestamp
+
+        side = self._side(depth)
+        if side is None:
+            # In the band: neither confirms nor cancels a pending change
+            return None
+        if side == patient.state:
+            patient.candidate = None
+            if side == INSIDE:
+                patient.zone_id = zone_id
+            return None
+
+        if patient.candidate != side:
+            patient.candidate, patient.candidate_since = side, timestamp
+        dwell = self.exit_dwell_s if side == OUTSIDE else self.enter_dwell_s
+        if timestamp - patient.candidate_since < dwell:
+            return None
+
+        previous = patient.state
+        alert = False
+        if side == OUTSIDE:
+            if patient.last_alert is not None and timestamp - patient.last_alert < self.alert_cooldown_s:
+                self.stats_counters["suppressed_alerts"] += 1
+            else:
+                alert = True
+                patient.last_alert = timestamp
+                self.stats_counters["alerts"] += 1
+            zone_id = patient.zone_id
+            patient.zone_id = None
+        else:
+            patient.zone_id = zone_id
+        patient.state, patient.candidate = side, None
+        self.stats_counters["transitions"] += 1
+        return GeofenceTransition(patient_id, previous, side, zone_id, latitude, longitude, timestamp, alert)
+
+    def _patient(self, patient_id):
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            patient = self.patients[patient_id] = PatientGeofenceState()
+        return patient
+
+    def _within_slack(self, patient, lat_rad, lon_rad):
+        # Moving along the anchor's parallel and then along a meridian is never
+        # shorter than the great-circle distance, so this bounds the distance moved
+        if patient.anchor_version != self.index.version:
+            return False
+        moved = EARTH_RADIUS_M * (abs(lat_rad - patient.anchor_lat)
+                                  + patient.anchor_cos * abs(lon_rad - patient.anchor_lon))
+        return moved < patient.anchor_slack
+
+    def _without_zones(self, patient_id, count=1):
+        # A patient with no safe zones at all is not outside one; their fixes cannot change the state
+        if self.index.has_zones(patient_id):
+            return False
+        self.stats_counters["no_zone_fixes"] += count
+        return True
+
+    def update(self, patient_id, latitude, longitude, timestamp) -> Optional[GeofenceTransition]:
+        if self._without_zones(patient_id):
+            return None
+        patient = self._patient(patient_id)
+        lat_rad, lon_rad = radians(latitude), radians(longitude)
+        if self.skip_unmoved and self._within_slack(patient, lat_rad, lon_rad):
+            self.stats_counters["skipped_evaluations"] += 1
+            depth, zone_id = patient.anchor_depth, patient.anchor_zone_id
+        else:
+            self.stats_counters["evaluations"] += 1
+            depth, zone, slack = self.index.evaluate(latitude, longitude, patient_id, self.thresholds)
+            zone_id = zone.zone_id if zone is not None else None
+            self._set_anchor(patient, lat_rad, lon_rad, depth, zone_id, slack)
+        return self.observe(patient_id, depth, zone_id, latitude, longitude, timestamp)
+
+    def _set_anchor(self, patient, lat_rad, lon_rad, depth, zone_id, slack):
+        patient.anchor_lat, patient.anchor_lon = lat_rad, lon_rad
+        patient.anchor_cos = cos(lat_rad)
+        patient.anchor_depth, patient.anchor_zone_id, patient.anchor_slack = depth, zone_id, slack
+        patient.anchor_version = self.index.version
+
+    def update_batch(self, patient_id, latitudes, longitudes, timestamps) -> List[GeofenceTransition]:
+        """Feed a patient's fixes in timestamp order; the zone checks run as one depth_batch pass."""
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        n = len(latitudes)
+        if self._without_zones(patient_id, n):
+            return []
+        depths = np.empty(n)
+        zone_ids = np.empty(n, dtype=object)
+
+        # Fixes within the slack of the patient's anchor reuse its result; the rest are checked together
+        patient = self._patient(patient_id)
+        lat_rad, lon_rad = np.radians(latitudes), np.radians(longitudes)
+        if self.skip_unmoved and patient.anchor_version == self.index.version:
+            moved = EARTH_RADIUS_M * (np.abs(lat_rad - patient.anchor_lat)
+                                      + patient.anchor_cos * np.abs(lon_rad - patient.anchor_lon))
+            skipped = moved < patient.anchor_slack
+        else:
+            skipped = np.zeros(n, dtype=bool)
+        depths[skipped] = patient.anchor_depth
+        zone_ids[skipped] = patient.anchor_zone_id
+        checked = np.flatnonzero(~skipped)
+        if len(checked):
+            depths[checked], zone_ids[checked] = self.index.depth_batch(
+                np.full(len(checked), patient_id, dtype=object), latitudes[checked], longitudes[checked]
+            )
+            # Anchor on the last checked fix, which needs its slack as well
+            last = checked[-1]
+            depth, zone, slack = self.index.evaluate(latitudes[last], longitudes[last], patient_id, self.thresholds)
+            self._set_anchor(patient, float(lat_rad[last]), float(lon_rad[last]),
+                             depth, zone.zone_id if zone is not None else None, slack)
+        self.stats_counters["evaluations"] += len(checked)
+        self.stats_counters["skipped_evaluations"] += n - len(checked)
+
+        transitions = []
+        for depth, zone_id, latitude, longitude, timestamp in zip(
+                depths.tolist(), zone_ids, latitudes.tolist(), longitudes.tolist(), timestamps):
+            transition = self.observe(patient_id, depth, zone_id, latitude, longitude, timestamp)
+            if transition is not None:
+                transitions.append(transition)
+        return transitions
+
+    def stats(self):
+        counts = {INSIDE: 0, OUTSIDE: 0, UNKNOWN: 0}
+        for patient in self.patients.values():
+            counts[patient.state] += 1
+        return {"patients": len(self.patients), **{f"patients_{k}": v for k, v in counts.items()},
+                **self.stats_counters}
@@ -0,0 +1,88 @@
+# agents/http_client.py
+# Shared non-blocking HTTP client for all LumosCare agents.
+#
+# The agents run on one Bureau event loop, so a blocking requests.post in any
+# handler stalls every agent until it returns. All outbound calls go through
+# one aiohttp session instead: connections are pooled and kept alive, each
+# host gets a bounded number of concurrent connections, and every request has
+# a timeout.
+import os
+import json
+import asyncio
+import aiohttp
+
+# Timeouts in seconds for one outbound request
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '10'))
+
+# Concurrent connections, overall and per host; requests beyond the limit wait for a free connection
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '8'))
+
+# How long an idle connection is kept open for reuse
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))
+
+
+class HttpResponse:
+    # The parts of a requests.Response the agents use, read fully before the connection is released
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers if headers is not None else {}  # Case-insensitive when it came from aiohttp
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpClient:
+    def __init__(self,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 total_timeout=HTTP_TOTAL_TIMEOUT,
+                 max_connections=HTTP_MAX_CONNECTIONS,
+                 max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+                 keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT):
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._loop = None
+
+    def _get_session(self):
+        # The session is bound to the loop it was created on, so create it
+        # lazily inside the running loop (and again if the loop changed)
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._loop = loop
+        return self._session
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request and read the whole response.
+
+        Raises aiohttp.ClientError or asyncio.TimeoutError on connection
+        failures and timeouts, like requests.post raises its exceptions.
+        """
+        async with self._get_session().request(method, url, **kwargs) as response:
+            return HttpResponse(response.status, await response.text(), response.headers)
+
+    async def post(self, url, json=None, **kwargs):
+        return await self.request("POST", url, json=json, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# The client every agent shares
+http_client = HttpClient()
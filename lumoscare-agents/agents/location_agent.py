@@ -3,11 +3,16 @@ from uagents import Agent, Context
 from uagents.setup import fund_agent_if_low
 import json
 import os
+import time
 from dotenv import load_dotenv
 from datetime import datetime
-from agents.protocols import location_protocol, LocationUpdateMessage, alert_protocol, AlertMessage
+from agents.protocols import location_protocol, LocationUpdateMessage, LocationBatchMessage, alert_protocol, AlertMessage
 from agents.notification_agent import notification_agent  # Import it
-import requests
+from agents.zone_store import ZoneStore
+from agents.geofence_state import GeofenceTracker, GEOFENCE_EXIT_MARGIN_M, INSIDE, OUTSIDE
+from agents.location_forwarder import location_forwarder
+from agents.outbox import outbox
+import numpy as np
 
 # Load environment variables
 load_dotenv()
@@ -26,7 +31,8 @@ location_agent = Agent(
 # Fund the agent
 fund_agent_if_low(location_agent.wallet.address())
 
-# Define patient's safe zones (in a real app, this would come from a database)
+# Default safe zones, used for a patient until their own zones have been loaded
+# from the healthcare service (or if they cannot be)
 safe_zones = [
     {
         "name": "Home",
@@ -40,42 +46,19 @@ safe_zones = [
     }
 ]
 
+# Each patient's safe zones with a spatial index over them, loaded and refreshed in the
+# background; zones stay candidates up to the exit margin beyond their edge for the hysteresis below
+zone_store = ZoneStore(default_zones=safe_zones, margin_m=GEOFENCE_EXIT_MARGIN_M)
+
+# Per-patient inside/outside state; alerts are sent only when a patient is confirmed to have left
+geofence_tracker = GeofenceTracker(zone_store)
+
 # Function to check if a location is within any safe zone
-def is_within_safe_zones(latitude, longitude):
-    from math import sin, cos, sqrt, atan2, radians
-    
-    # Function to calculate distance between two points
-    def calculate_distance(lat1, lon1, lat2, lon2):
-        # Approximate radius of earth in meters
-        R = 6371e3
-        
-        lat1_rad = radians(lat1)
-        lon1_rad = radians(lon1)
-        lat2_rad = radians(lat2)
-        lon2_rad = radians(lon2)
-        
-        dlon = lon2_rad - lon1_rad
-        dlat = lat2_rad - lat1_rad
-        
-        a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        
-        distance = R * c
-        return distance
-    
-    # Check each safe zone
-    for zone in safe_zones:
-        zone_lat = zone["center"]["latitude"]
-        zone_lon = zone["center"]["longitude"]
-        distance = calculate_distance(latitude, longitude, zone_lat, zone_lon)
-        
-        if distance <= zone["radius"]:
-            return True, zone["name"]
-    
-    return False, None
+def is_within_safe_zones(latitude, longitude, patient_id=None):
+    return zone_store.is_within(latitude, longitude, patient_id)
 
 # Add this function to trigger a phone call via the healthcare service
-def trigger_phone_call(patient_id, phone_number, message, priority="high"):
+def trigger_phone_call(patient_id, phone_number, message, priority="high", alert=None):
     url = f"{HEALTHCARE_SERVICE_URL}/api/make-call"
     payload = {
         "patientId": patient_id,
@@ -83,14 +66,62 @@ def trigger_phone_call(patient_id, phone_number, message, priority="high"):
         "message": message,
         "priority": priority
     }
-    try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            print(f"[LocationAgent] Phone call triggered successfully: {response.json()}")
-        else:
-            print(f"[LocationAgent] Failed to trigger phone call: {response.status_code} {response.text}")
-    except Exception as e:
-        print(f"[LocationAgent] Error triggering phone call: {e}")
+    # Delivered (and retried) by the outbox workers; a call about an alert is coalesced with
+    # the NotificationAgent's call about the same AlertMessage
+    alert_type, alert_message = (alert.alert_type, alert.message) if alert is not None else (None, None)
+    key = outbox.enqueue_call(url, payload, alert_type=alert_type, alert_message=alert_message)
+    print(f"[LocationAgent] Phone call queued: {key}")
+
+# Message and fix counters, read by the throughput mode of test_location_agent
+location_stats = {"messages": 0, "batches": 0, "fixes": 0, "duplicate_fixes": 0}
+
+# (session, highest batch sequence number processed) per patient, to skip resent fixes
+last_sequence = {}
+
+def report_transition(ctx: Context, transition):
+    if transition.state == INSIDE:
+        zone_name = zone_store.zone_name(transition.patient_id, transition.zone_id)
+        print(f"[LocationAgent] ✅ Patient {transition.patient_id} is within safe zone: {zone_name}")
+        ctx.logger.info(f"Patient {transition.patient_id} is within safe zone: {zone_name}")
+    elif not transition.alert:
+        print(f"[LocationAgent] Patient {transition.patient_id} left the safe zones again within the alert cooldown; not alerting")
+
+async def send_location_alert(ctx: Context, patient_id, latitude, longitude):
+    print(f"[LocationAgent] ⚠️ ALERT: Patient {patient_id} has left all safe zones!")
+    ctx.logger.warning(f"ALERT: Patient {patient_id} has left all safe zones!")
+    
+    # Prepare alert data for caregiver
+    alert_data = {
+        "alert_type": "location",
+        "patient_id": patient_id,
+        "message": f"Patient has left all safe zones. Current coordinates: {latitude}, {longitude}",
+        "priority": "high",
+        "timestamp": datetime.now().isoformat()
+    }
+    
+    print(f"[LocationAgent] Alert data: {json.dumps(alert_data, indent=2)}")
+    ctx.logger.info(f"Alert data: {json.dumps(alert_data)}")
+    
+    # Send alert to NotificationAgent
+    alert = AlertMessage(
+        patient_id=patient_id,
+        message=f"Patient has left all safe zones. Current coordinates: {latitude}, {longitude}",
+        priority="high",
+        timestamp=datetime.now().isoformat(),
+        alert_type="location"
+    )
+
+    await ctx.send(
+        notification_agent.address,
+        alert
+    )
+    print(f"[LocationAgent] 🚀 Sent alert to NotificationAgent!")
+
+    # Trigger phone call to caregiver (replace with actual phone number or make configurable);
+    # the NotificationAgent asks for a call about the same alert, and the outbox places only one
+    phone_number = "+16693407283"  # TODO: Replace with actual caregiver/patient number or make configurable
+    message = f"ALERT: Patient {patient_id} has left all safe zones. Current location: {latitude}, {longitude}"
+    trigger_phone_call(patient_id, phone_number, message, priority="high", alert=alert)
 
 @location_agent.on_message(model=LocationUpdateMessage)
 async def handle_location_update(ctx: Context, sender: str, msg: LocationUpdateMessage):
@@ -104,71 +135,75 @@ async def handle_location_update(ctx: Context, sender: str, msg: LocationUpdateM
     patient_id = msg.patient_id
     print(f"[LocationAgent] Received location update from {sender}")
     print(f"[LocationAgent] Patient ID: {patient_id}, Location: {latitude}, {longitude}")
+    location_stats["messages"] += 1
+    location_stats["fixes"] += 1
     
-    # Forward to healthcare service
-    try:
-        healthcare_service_url = f"{HEALTHCARE_SERVICE_URL}/api/location-update"
-        payload = {
-            "patientId": patient_id,
-            "latitude": latitude,
-            "longitude": longitude
-        }
-        
-        print(f"[LocationAgent] Forwarding to healthcare service at {healthcare_service_url}")
-        print(f"[LocationAgent] Payload: {payload}")
-        
-        response = requests.post(healthcare_service_url, json=payload)
-        
-        if response.status_code == 200:
-            print(f"[LocationAgent] Successfully forwarded data to healthcare service")
-            print(f"[LocationAgent] Response: {response.json()}")
-        else:
-            print(f"[LocationAgent] Failed to forward data to healthcare service: {response.status_code}")
-            print(f"[LocationAgent] Response: {response.text}")
-    except Exception as e:
-        print(f"[LocationAgent] Error connecting to healthcare service: {str(e)}")
-        print(f"[LocationAgent] Service URL: {healthcare_service_url}")
-    
-    # Check if location is within safe zones
-    within_safe_zone, zone_name = is_within_safe_zones(latitude, longitude)
-    
-    if within_safe_zone:
-        print(f"[LocationAgent] ✅ Patient {patient_id} is within safe zone: {zone_name}")
-        ctx.logger.info(f"Patient {patient_id} is within safe zone: {zone_name}")
-    else:
-        print(f"[LocationAgent] ⚠️ ALERT: Patient {patient_id} has left all safe zones!")
-        ctx.logger.warning(f"ALERT: Patient {patient_id} has left all safe zones!")
-        
-        # Prepare alert data for caregiver
-        alert_data = {
-            "alert_type": "location",
-            "patient_id": patient_id,
-            "message": f"Patient has left all safe zones. Current coordinates: {latitude}, {longitude}",
-            "priority": "high",
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        print(f"[LocationAgent] Alert data: {json.dumps(alert_data, indent=2)}")
-        ctx.logger.info(f"Alert data: {json.dumps(alert_data)}")
-        
-        # Send alert to NotificationAgent
-        alert = AlertMessage(
-            patient_id=patient_id,
-            message=f"Patient has left all safe zones. Current coordinates: {latitude}, {longitude}",
-            priority="high",
-            timestamp=datetime.now().isoformat()
-        )
-
-        await ctx.send(
-            notification_agent.address,
-            alert
-        )
-        print(f"[LocationAgent] 🚀 Sent alert to NotificationAgent!")
-
-        # Trigger phone call to caregiver (replace with actual phone number or make configurable)
-        phone_number = "+16693407283"  # TODO: Replace with actual caregiver/patient number or make configurable
-        message = f"ALERT: Patient {patient_id} has left all safe zones. Current location: {latitude}, {longitude}"
-        trigger_phone_call(patient_id, phone_number, message, priority="high")
+    # Check the fix against the safe zones; only a confirmed change of state is reported.
+    # Use the device's timestamp when it sent one, so single fixes and batches share a clock
+    timestamp = msg.timestamp if msg.timestamp is not None else time.time()
+    transition = geofence_tracker.update(patient_id, latitude, longitude, timestamp)
+
+    # Forward to the healthcare service in the next bulk request, or at once if the patient just left
+    exited = transition is not None and transition.state == OUTSIDE
+    location_forwarder.add(patient_id, latitude, longitude, timestamp, urgent=exited)
+
+    if transition is None:
+        print(f"[LocationAgent] Patient {patient_id} is still {geofence_tracker.state(patient_id)}")
+        return
+    report_transition(ctx, transition)
+    if transition.alert:
+        await send_location_alert(ctx, patient_id, latitude, longitude)
+
+@location_agent.on_message(model=LocationBatchMessage)
+async def handle_location_batch(ctx: Context, sender: str, msg: LocationBatchMessage):
+    patient_id = msg.patient_id
+    count = len(msg.latitudes)
+    if len(msg.longitudes) != count or len(msg.timestamps) != count:
+        ctx.logger.warning(f"Discarding malformed location batch from {sender}: array lengths differ")
+        return
+    location_stats["messages"] += 1
+    location_stats["batches"] += 1
+
+    # Skip fixes already processed from an earlier (resent) batch of the same
+    # session, then handle the rest in the order they were taken
+    session, seen = last_sequence.get(patient_id, (msg.session, -1))
+    if session != msg.session:
+        seen = -1
+    sequences = np.arange(msg.first_sequence, msg.first_sequence + count)
+    fresh = sequences > seen
+    location_stats["duplicate_fixes"] += int(count - fresh.sum())
+    if not fresh.any():
+        return
+    order = np.argsort(np.asarray(msg.timestamps)[fresh], kind="stable")
+    timestamps = np.asarray(msg.timestamps)[fresh][order]
+    latitudes = np.asarray(msg.latitudes)[fresh][order]
+    longitudes = np.asarray(msg.longitudes)[fresh][order]
+    last_sequence[patient_id] = (msg.session, int(sequences[fresh].max()))
+    location_stats["fixes"] += len(latitudes)
+    print(f"\n[LocationAgent] Received batch of {len(latitudes)} location updates for patient {patient_id} from {sender}")
+
+    # Check every fix against the safe zones in one pass, then replay them through the patient's state
+    transitions = geofence_tracker.update_batch(patient_id, latitudes, longitudes, timestamps.tolist())
+
+    exited = any(transition.state == OUTSIDE for transition in transitions)
+    location_forwarder.add_batch(patient_id, latitudes.tolist(), longitudes.tolist(), timestamps.tolist(),
+                                 urgent=exited)
+    if not transitions:
+        print(f"[LocationAgent] Patient {patient_id} is still {geofence_tracker.state(patient_id)}")
+    for transition in transitions:
+        report_transition(ctx, transition)
+        if transition.alert:
+            await send_location_alert(ctx, patient_id, transition.latitude, transition.longitude)
+
+@location_agent.on_event("startup")
+async def start_outbox(ctx: Context):
+    await outbox.start()
+    await location_forwarder.start()
+    await zone_store.start()
+
+@location_agent.on_event("shutdown")
+async def flush_locations(ctx: Context):
+    await location_forwarder.stop()
 
 # Register the protocol
 location_agent.include(location_protocol)
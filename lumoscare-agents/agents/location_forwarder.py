@@ -0,0 +1,145 @@
+# agents/location_forwarder.py
+# Buffered forwarding of location fixes to the healthcare service.
+#
+# Forwarding every fix as its own POST costs one request per fix. The
+# forwarder instead buffers fixes per patient and sends everything buffered
+# as one bulk request when LOCATION_FLUSH_SIZE fixes are waiting or the
+# oldest has waited LOCATION_FLUSH_INTERVAL seconds, whichever comes first.
+# Fixes that matter for safety (a patient leaving their safe zones) skip the
+# wait: that patient's buffer is sent at once. Bulk requests go through the
+# outbox like every other outbound call. Fixes still in the buffer when the
+# process stops are lost, which bounds the loss to one flush interval.
+import os
+import time
+import asyncio
+
+from agents.outbox import outbox as shared_outbox
+
+HEALTHCARE_SERVICE_URL = os.getenv('HEALTHCARE_SERVICE_URL', 'http://localhost:3000')
+LOCATION_BULK_PATH = os.getenv('LOCATION_BULK_PATH', '/api/location-update/bulk')  # Served by model/src/healthcare_service.ts
+LOCATION_FLUSH_SIZE = int(os.getenv('LOCATION_FLUSH_SIZE', '200'))  # Buffered fixes that trigger a flush
+LOCATION_FLUSH_INTERVAL = float(os.getenv('LOCATION_FLUSH_INTERVAL', '1.0'))  # Longest a fix waits in the buffer
+
+
+class LocationForwarder:
+    def __init__(self,
+                 url=f"{HEALTHCARE_SERVICE_URL}{LOCATION_BULK_PATH}",
+                 flush_size=LOCATION_FLUSH_SIZE,
+                 flush_interval=LOCATION_FLUSH_INTERVAL,
+                 outbox=shared_outbox):
+        self.url = url
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.outbox = outbox
+        self._buffers = {}  # patient_id -> list of fix dicts, in arrival order
+        self._buffered = 0
+        self._oldest = None  # When the oldest buffered fix arrived (monotonic)
+        self._task = None
+        self._wakeup = None
+        self.stats_counters = {"fixes": 0, "flushes": 0, "urgent_flushes": 0, "flushed_fixes": 0,
+                               "max_flush_size": 0, "total_lag": 0.0, "max_lag": 0.0}
+
+    def add(self, patient_id, latitude, longitude, timestamp, urgent=False):
+        self.add_batch(patient_id, [latitude], [longitude], [timestamp], urgent)
+
+    def add_batch(self, patient_id, latitudes, longitudes, timestamps, urgent=False):
+        # Buffer a patient's fixes; urgent sends that patient's buffer right away
+        fixes = [{"latitude": lat, "longitude": lon, "timestamp": ts}
+                 for lat, lon, ts in zip(latitudes, longitudes, timestamps)]
+        if not fixes:
+            return
+        now = time.monotonic()
+        for fix in fixes:
+            fix["_buffered"] = now
+        self._buffers.setdefault(patient_id, []).extend(fixes)
+        self._buffered += len(fixes)
+        self.stats_counters["fixes"] += len(fixes)
+        if self._oldest is None:
+            self._oldest = now
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+        if urgent:
+            self.stats_counters["urgent_flushes"] += 1
+            self._flush([patient_id])
+        elif self._buffered >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        # Send every buffered fix as one bulk request
+        self._flush(list(self._buffers))
+
+    def _flush(self, patient_ids):
+        updates = []
+        flushed = 0
+        oldest = None
+        for patient_id in patient_ids:
+            fixes = self._buffers.pop(patient_id, None)
+            if not fixes:
+                continue
+            oldest = fixes[0]["_buffered"] if oldest is None else min(oldest, fixes[0]["_buffered"])
+            for fix in fixes:
+                del fix["_buffered"]
+            updates.append({"patientId": patient_id, "locations": fixes})
+            flushed += len(fixes)
+        if not updates:
+            return
+        self._buffered -= flushed
+        if not self._buffers:
+            self._oldest = None
+        else:
+            self._oldest = min(fixes[0]["_buffered"] for fixes in self._buffers.values())
+
+        self.outbox.enqueue("locations", self.url, {"updates": updates})
+
+        # Lag: how long the oldest fix in this flush waited in the buffer
+        lag = time.monotonic() - oldest
+        counters = self.stats_counters
+        counters["flushes"] += 1
+        counters["flushed_fixes"] += flushed
+        counters["max_flush_size"] = max(counters["max_flush_size"], flushed)
+        counters["total_lag"] += lag
+        counters["max_lag"] = max(counters["max_lag"], lag)
+        print(f"[LocationForwarder] Flushed {flushed} fixes for {len(updates)} patients "
+              f"(oldest waited {lag * 1000:.0f} ms)")
+
+    async def start(self):
+        # Start the interval flusher on the running loop; safe to call more than once
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    async def _run(self):
+        while True:
+            if self._oldest is None:
+                # Nothing buffered: sleep until the next fix arrives
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._oldest + self.flush_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self.flush()
+
+    def stats(self):
+        counters = self.stats_counters
+        flushes = counters["flushes"]
+        return {
+            "buffered": self._buffered,
+            **{k: v for k, v in counters.items() if k != "total_lag"},
+            "mean_flush_size": counters["flushed_fixes"] / flushes if flushes else 0.0,
+            "mean_lag": counters["total_lag"] / flushes if flushes else 0.0
+        }
+
+
+# The forwarder the location agent uses
+location_forwarder = LocationForwarder()
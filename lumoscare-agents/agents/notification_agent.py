@@ -5,7 +5,7 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime
 from agents.protocols import alert_protocol, AlertMessage, phone_call_protocol, PhoneCallMessage
-import requests
+from agents.outbox import outbox
 
 # Load environment variables
 load_dotenv()
@@ -23,16 +23,10 @@ notification_agent = Agent(
     endpoint="http://127.0.0.1:8004"
 )
 
-# Function to send alert to mobile app notification API
+# Function to send alert to mobile app notification API (delivered by the outbox)
 def send_alert_to_mobile_api(alert_data):
-    try:
-        response = requests.post(MOBILE_ALERT_API_URL, json=alert_data)
-        if response.status_code == 200:
-            print(f"[NotificationAgent] Successfully sent alert to mobile API: {response.json()}")
-        else:
-            print(f"[NotificationAgent] Failed to send alert to mobile API: {response.status_code} {response.text}")
-    except Exception as e:
-        print(f"[NotificationAgent] Error sending alert to mobile API: {e}")
+    key = outbox.enqueue("alert", MOBILE_ALERT_API_URL, alert_data)
+    print(f"[NotificationAgent] Mobile alert queued: {key}")
 
 @notification_agent.on_message(model=AlertMessage)
 async def handle_alert(ctx: Context, sender: str, msg: AlertMessage):
@@ -68,31 +62,24 @@ async def handle_alert(ctx: Context, sender: str, msg: AlertMessage):
         }
         send_alert_to_mobile_api(mobile_alert_payload)
         
-        try:
-            # Forward to healthcare service for Twilio integration
-            healthcare_service_url = f"{HEALTHCARE_SERVICE_URL}/api/make-call"
-            payload = {
-                "patientId": msg.patient_id,
-                "phoneNumber": PATIENT_PHONE_NUMBER,
-                "message": f"EMERGENCY ALERT: {msg.message}",
-                "priority": "high"
-            }
-            
-            print(f"[NotificationAgent] Forwarding to healthcare service at {healthcare_service_url}")
-            print(f"[NotificationAgent] Payload: {payload}")
-            
-            response = requests.post(healthcare_service_url, json=payload)
-            
-            if response.status_code == 200:
-                print(f"[NotificationAgent] Successfully initiated emergency call")
-                print(f"[NotificationAgent] Response: {response.json()}")
-            else:
-                print(f"[NotificationAgent] Failed to initiate emergency call: {response.status_code}")
-                print(f"[NotificationAgent] Response: {response.text}")
-                
-        except Exception as e:
-            print(f"[NotificationAgent] ❌ Error making emergency call: {str(e)}")
-            print(f"[NotificationAgent] Service URL: {healthcare_service_url}")
+        # Forward to healthcare service for Twilio integration
+        healthcare_service_url = f"{HEALTHCARE_SERVICE_URL}/api/make-call"
+        payload = {
+            "patientId": msg.patient_id,
+            "phoneNumber": PATIENT_PHONE_NUMBER,
+            "message": f"EMERGENCY ALERT: {msg.message}",
+            "priority": "high"
+        }
+        
+        print(f"[NotificationAgent] Queueing emergency call to healthcare service at {healthcare_service_url}")
+        print(f"[NotificationAgent] Payload: {payload}")
+        # The location agent asks for a call about the same alert; the outbox places one
+        outbox.enqueue_call(healthcare_service_url, payload,
+                            alert_type=msg.alert_type, alert_message=msg.message)
+
+@notification_agent.on_event("startup")
+async def start_outbox(ctx: Context):
+    await outbox.start()
 
 # Register the protocol
 notification_agent.include(alert_protocol)
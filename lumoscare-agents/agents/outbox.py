@@ -0,0 +1,307 @@
+# agents/outbox.py
+# Durable outbox for the agents' outbound HTTP calls.
+#
+# Handlers do not call the healthcare service or the mobile alert API
+# themselves: they enqueue the request into a local SQLite table and return.
+# Worker tasks deliver queued requests with bounded concurrency, retry
+# failures with exponential backoff and jitter, and move requests that keep
+# failing (or are rejected outright) to a dead-letter state instead of
+# dropping them. Every request carries an Idempotency-Key header that stays
+# the same across retries, and enqueueing a key that is already queued is a
+# no-op, so a retry or a resent alert cannot turn into a second phone call.
+#
+# Requests can also be coalesced: of all requests enqueued under the same
+# coalesce key within a window, only the first is sent. Calls made about an
+# alert are keyed by the patient and the alert's type and message, so when the
+# location agent and the notification agent both ask for a call about the same
+# alert, the patient's phone rings once, while a different alert still gets
+# its own call. Calls asked for explicitly (a PhoneCallMessage) are never
+# coalesced. If the request that claimed a key is dead-lettered, the claim is
+# released so the next call about that alert is placed.
+#
+# Several agent processes may share the outbox file. A worker that takes a
+# request holds a lease on it; if its process dies mid-delivery, any process
+# takes the request over once the lease runs out, while requests other live
+# processes are delivering are left alone. The database is opened on first
+# use, so importing this module creates no files.
+import os
+import time
+import json
+import random
+import sqlite3
+import asyncio
+from uuid import uuid4
+
+from agents.http_client import http_client
+
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.expanduser('~/.lumoscare/outbox.db'))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '4'))  # Requests delivered concurrently
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))  # Attempts before a request is dead-lettered
+OUTBOX_BASE_DELAY = float(os.getenv('OUTBOX_BASE_DELAY', '1'))  # Seconds before the first retry; doubles per attempt
+OUTBOX_MAX_DELAY = float(os.getenv('OUTBOX_MAX_DELAY', '300'))  # Longest wait between attempts
+OUTBOX_LEASE_SECONDS = float(os.getenv('OUTBOX_LEASE_SECONDS', '60'))  # Longest a delivery may hold a request; above HTTP_TOTAL_TIMEOUT
+CALL_COALESCE_SECONDS = float(os.getenv('CALL_COALESCE_SECONDS', '300'))  # Further calls about the same alert within this window are dropped
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DEAD = "dead"
+
+# Statuses worth retrying; any other 4xx means the request itself is wrong
+RETRYABLE_STATUSES = {408, 425, 429}
+
+
+class Outbox:
+    def __init__(self,
+                 path=OUTBOX_PATH,
+                 workers=OUTBOX_WORKERS,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 base_delay=OUTBOX_BASE_DELAY,
+                 max_delay=OUTBOX_MAX_DELAY,
+                 lease_seconds=OUTBOX_LEASE_SECONDS,
+                 client=http_client):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.client = client
+        # Marks the requests this process is delivering
+        self.owner = uuid4().hex
+        self._connection = None
+
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+        self.stats_counters = {"enqueued": 0, "duplicates": 0, "delivered": 0, "retries": 0, "dead": 0,
+                               "coalesced": 0}
+
+    @property
+    def _db(self):
+        # Open (and create) the database on first use rather than on import
+        if self._connection is None:
+            self._connection = self._open()
+        return self._connection
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                created REAL NOT NULL,
+                last_error TEXT,
+                owner TEXT,
+                lease_until REAL
+            )
+        """)
+        # Files created before leases existed
+        columns = {row[1] for row in db.execute("PRAGMA table_info(outbox)")}
+        if "lease_until" not in columns:
+            db.execute("ALTER TABLE outbox ADD COLUMN owner TEXT")
+            db.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+        db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt)")
+        # Last request enqueued per coalesce key; kept after delivery, unlike outbox rows
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS coalesced (
+                coalesce_key TEXT PRIMARY KEY,
+                idempotency_key TEXT NOT NULL,
+                enqueued REAL NOT NULL
+            )
+        """)
+        db.commit()
+        return db
+
+    def enqueue(self, kind, url, payload, idempotency_key=None, coalesce_key=None, coalesce_window=0.0):
+        # Persist a request for delivery and return its idempotency key. With a
+        # coalesce_key, a request within coalesce_window seconds of the last one
+        # under that key is dropped and the earlier request's key is returned.
+        key = idempotency_key or str(uuid4())
+        now = time.time()
+        if coalesce_key is not None:
+            # Claim the key only if its window has passed; the conditional upsert keeps
+            # two processes sharing the file from both sending
+            claimed = self._db.execute(
+                "INSERT INTO coalesced (coalesce_key, idempotency_key, enqueued) VALUES (?, ?, ?) "
+                "ON CONFLICT (coalesce_key) DO UPDATE SET idempotency_key = excluded.idempotency_key, "
+                "enqueued = excluded.enqueued WHERE coalesced.enqueued <= ?",
+                (coalesce_key, key, now, now - coalesce_window)
+            ).rowcount
+            if not claimed:
+                self._db.commit()
+                self.stats_counters["coalesced"] += 1
+                row = self._db.execute(
+                    "SELECT idempotency_key FROM coalesced WHERE coalesce_key = ?", (coalesce_key,)
+                ).fetchone()
+                return row[0]
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, kind, url, payload, state, next_attempt, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, kind, url, json.dumps(payload), PENDING, now, now)
+        )
+        self._db.commit()
+        if cursor.rowcount:
+            self.stats_counters["enqueued"] += 1
+            if self._wakeup is not None:
+                self._wakeup.set()
+        else:
+            self.stats_counters["duplicates"] += 1
+        return key
+
+    def enqueue_call(self, url, payload, alert_type=None, alert_message=None, window=CALL_COALESCE_SECONDS):
+        # Queue a /api/make-call request. A call about an alert (alert_type given) is placed at
+        # most once per alert per window, whichever agent asks; other calls are always placed
+        coalesce_key = None
+        if alert_type is not None:
+            coalesce_key = f"call:{payload['patientId']}:{alert_type}:{alert_message}"
+        return self.enqueue("call", url, payload, coalesce_key=coalesce_key, coalesce_window=window)
+
+    async def start(self):
+        # Start the delivery workers on the running loop; safe to call from every agent's startup
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Whatever this process was delivering is picked up again on the next start;
+        # other processes' deliveries are theirs to finish
+        if self._connection is not None:
+            self._db.execute("UPDATE outbox SET state = ?, owner = NULL, lease_until = NULL "
+                             "WHERE state = ? AND owner = ?", (PENDING, IN_FLIGHT, self.owner))
+            self._db.commit()
+
+    def _claim(self):
+        # Take the oldest due request, or one whose delivery lease ran out (its process died);
+        # the conditional update keeps two processes sharing the file from both taking it
+        now = time.time()
+        while True:
+            row = self._db.execute(
+                "SELECT id, idempotency_key, kind, url, payload, attempts, state, lease_until FROM outbox "
+                "WHERE (state = ? AND next_attempt <= ?) OR (state = ? AND lease_until <= ?) "
+                "ORDER BY next_attempt LIMIT 1",
+                (PENDING, now, IN_FLIGHT, now)
+            ).fetchone()
+            if row is None:
+                return None
+            cursor = self._db.execute(
+                "UPDATE outbox SET state = ?, owner = ?, lease_until = ? "
+                "WHERE id = ? AND state = ? AND lease_until IS ?",
+                (IN_FLIGHT, self.owner, now + self.lease_seconds, row[0], row[6], row[7])
+            )
+            self._db.commit()
+            if cursor.rowcount:
+                return row[:6]
+
+    def _next_due(self):
+        row = self._db.execute(
+            "SELECT MIN(CASE WHEN state = ? THEN next_attempt ELSE lease_until END) FROM outbox "
+            "WHERE state IN (?, ?)", (PENDING, PENDING, IN_FLIGHT)
+        ).fetchone()
+        return row[0]
+
+    async def _worker(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                # Sleep until the next retry is due or something new is enqueued
+                next_due = self._next_due()
+                timeout = None if next_due is None else max(0.0, next_due - time.time())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._deliver(*row)
+
+    async def _deliver(self, row_id, key, kind, url, payload, attempts):
+        attempts += 1
+        try:
+            response = await self.client.post(url, json=json.loads(payload), headers={"Idempotency-Key": key})
+            if 200 <= response.status_code < 300:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self._db.commit()
+                self.stats_counters["delivered"] += 1
+                print(f"[Outbox] Delivered {kind} request to {url} (attempt {attempts})")
+                return
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retryable = True
+
+        if not retryable or attempts >= self.max_attempts:
+            self._db.execute(
+                "UPDATE outbox SET state = ?, attempts = ?, last_error = ? WHERE id = ?",
+                (DEAD, attempts, error, row_id)
+            )
+            # The alert was never delivered, so the next request about it must not be coalesced away
+            self._db.execute("DELETE FROM coalesced WHERE idempotency_key = ?", (key,))
+            self._db.commit()
+            self.stats_counters["dead"] += 1
+            print(f"[Outbox] ❌ Gave up on {kind} request to {url} after {attempts} attempts: {error}")
+            return
+
+        # Exponential backoff with full jitter
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+        self._db.execute(
+            "UPDATE outbox SET state = ?, attempts = ?, next_attempt = ?, last_error = ?, "
+            "owner = NULL, lease_until = NULL WHERE id = ?",
+            (PENDING, attempts, time.time() + delay, error, row_id)
+        )
+        self._db.commit()
+        self.stats_counters["retries"] += 1
+        print(f"[Outbox] {kind} request to {url} failed ({error}); retrying in {delay:.1f}s")
+
+    def dead_letters(self):
+        rows = self._db.execute(
+            "SELECT id, idempotency_key, kind, url, payload, attempts, created, last_error FROM outbox "
+            "WHERE state = ? ORDER BY id", (DEAD,)
+        ).fetchall()
+        return [
+            {"id": r[0], "idempotency_key": r[1], "kind": r[2], "url": r[3], "payload": json.loads(r[4]),
+             "attempts": r[5], "created": r[6], "last_error": r[7]}
+            for r in rows
+        ]
+
+    def requeue_dead(self, row_id=None):
+        # Give dead-lettered requests (all, or one by id) a fresh set of attempts
+        query = "UPDATE outbox SET state = ?, attempts = 0, next_attempt = ? WHERE state = ?"
+        params = [PENDING, time.time(), DEAD]
+        if row_id is not None:
+            query += " AND id = ?"
+            params.append(row_id)
+        cursor = self._db.execute(query, params)
+        self._db.commit()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return cursor.rowcount
+
+    def stats(self):
+        counts = dict(self._db.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+        return {
+            "pending": counts.get(PENDING, 0),
+            "in_flight": counts.get(IN_FLIGHT, 0),
+            "dead_letters": counts.get(DEAD, 0),
+            **self.stats_counters
+        }
+
+
+# The outbox every agent shares; its database is opened on first use
+outbox = Outbox()
@@ -5,7 +5,7 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime
 from agents.protocols import phone_call_protocol, PhoneCallMessage
-import requests
+from agents.outbox import outbox
 
 # Load environment variables
 load_dotenv()
@@ -39,31 +39,23 @@ async def handle_phone_call(ctx: Context, sender: str, msg: PhoneCallMessage):
     print(f"  Message: {message}")
     print(f"  Priority: {priority}")
     
-    try:
-        # Forward to healthcare service for Twilio integration
-        healthcare_service_url = f"{HEALTHCARE_SERVICE_URL}/api/make-call"
-        payload = {
-            "patientId": patient_id,
-            "phoneNumber": phone_number,
-            "message": message,
-            "priority": priority
-        }
-        
-        print(f"[PhoneCallAgent] Forwarding to healthcare service at {healthcare_service_url}")
-        print(f"[PhoneCallAgent] Payload: {payload}")
-        
-        response = requests.post(healthcare_service_url, json=payload)
-        
-        if response.status_code == 200:
-            print(f"[PhoneCallAgent] Successfully initiated call through healthcare service")
-            print(f"[PhoneCallAgent] Response: {response.json()}")
-        else:
-            print(f"[PhoneCallAgent] Failed to initiate call: {response.status_code}")
-            print(f"[PhoneCallAgent] Response: {response.text}")
-            
-    except Exception as e:
-        print(f"[PhoneCallAgent] ❌ Error making phone call: {str(e)}")
-        print(f"[PhoneCallAgent] Service URL: {healthcare_service_url}")
+    # Forward to healthcare service for Twilio integration; the outbox delivers and retries it
+    healthcare_service_url = f"{HEALTHCARE_SERVICE_URL}/api/make-call"
+    payload = {
+        "patientId": patient_id,
+        "phoneNumber": phone_number,
+        "message": message,
+        "priority": priority
+    }
+    
+    print(f"[PhoneCallAgent] Queueing call to healthcare service at {healthcare_service_url}")
+    print(f"[PhoneCallAgent] Payload: {payload}")
+    key = outbox.enqueue_call(healthcare_service_url, payload)
+    print(f"[PhoneCallAgent] Call queued: {key}")
+
+@phone_call_agent.on_event("startup")
+async def start_outbox(ctx: Context):
+    await outbox.start()
 
 # Register the protocol
 phone_call_agent.include(phone_call_protocol)
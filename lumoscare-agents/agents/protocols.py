@@ -2,18 +2,35 @@
 from uagents import Protocol, Model
 from datetime import datetime
 from pydantic import Field
+from typing import List, Optional
 
 # Message Models
 class LocationUpdateMessage(Model):
     latitude: float
     longitude: float
     patient_id: str
+    timestamp: Optional[float] = None  # Unix time the device took the fix; the receive time if unset
+
+# Several fixes from one device in a single envelope, as parallel arrays.
+# Fix i was taken at timestamps[i] (Unix time) and has sequence number
+# first_sequence + i; the receiver skips sequence numbers it has already seen,
+# so a device may safely resend a backlog. Sequence numbers count within a
+# session: a device that restarts its numbering sends a new session id, and
+# the receiver forgets the sequence numbers seen in the old one.
+class LocationBatchMessage(Model):
+    patient_id: str
+    latitudes: List[float]
+    longitudes: List[float]
+    timestamps: List[float]
+    first_sequence: int = 0
+    session: str = ""
 
 class AlertMessage(Model):
     patient_id: str
     message: str
     priority: str
     timestamp: str
+    alert_type: str = "general"  # e.g. "location"; with the message, identifies the alert
 
 class PhoneCallMessage(Model):
     patient_id: str
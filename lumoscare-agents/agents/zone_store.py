@@ -0,0 +1,259 @@
+# agents/zone_store.py
+# Per-patient safe zones for the location agent.
+#
+# Safe zones belong to a patient (the backend's SafeZone model), so each
+# patient gets a GeofenceIndex of their own, loaded from the backend's
+# GET /api/safe-zones/patient/:patientId (backend/server.js, BACKEND_URL), or
+# from a local JSON file standing in for it (SAFE_ZONE_FILE). Location updates never wait for the
+# network: a patient seen for the first time is checked against the default
+# zones while their own zones load in the background. After that each
+# patient is refreshed every SAFE_ZONE_REFRESH_INTERVAL seconds with a
+# conditional request (If-None-Match with the last ETag), so unchanged zones
+# cost a 304 and only patients whose zones changed get a new index, built
+# aside and swapped in whole.
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Dict
+
+import numpy as np
+
+from agents.geofence import GeofenceIndex, CircleZone, PolygonZone, zone_from_dict
+from agents.http_client import http_client
+
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:50001')  # The Express backend, which owns safe zones
+SAFE_ZONE_URL = os.getenv('SAFE_ZONE_URL', f"{BACKEND_URL}/api/safe-zones/patient")  # Patient id is appended
+SAFE_ZONE_FILE = os.getenv('SAFE_ZONE_FILE')  # Local stand-in: JSON object of patient id -> list of zones
+SAFE_ZONE_API_TOKEN = os.getenv('SAFE_ZONE_API_TOKEN')  # Sent as a bearer token if set
+SAFE_ZONE_REFRESH_INTERVAL = float(os.getenv('SAFE_ZONE_REFRESH_INTERVAL', '60'))  # Seconds between refreshes per patient
+SAFE_ZONE_RETRY_INTERVAL = float(os.getenv('SAFE_ZONE_RETRY_INTERVAL', '10'))  # Seconds before retrying a failed load
+SAFE_ZONE_FETCH_CONCURRENCY = int(os.getenv('SAFE_ZONE_FETCH_CONCURRENCY', '4'))  # Patients loaded at once
+
+
+def parse_zone(doc):
+    """
+    A zone from a backend SafeZone document (GeoJSON Point with a radius, or
+    Polygon), or from the safe_zones dict format. Returns None for inactive
+    zones.
+    """
+    if not doc.get("isActive", True):
+        return None
+    if "center" in doc or "polygon" in doc:
+        # Every zone in a patient's index applies to that patient
+        return zone_from_dict({**doc, "patient_id": None})
+    geometry = doc["coordinates"]
+    if geometry.get("type") == "Polygon":
+        # Outer ring only, as [longitude, latitude] pairs; holes are not supported
+        return PolygonZone(
+            zone_id=doc.get("_id", doc.get("id", doc["name"])),
+            name=doc["name"],
+            vertices=[(latitude, longitude) for longitude, latitude in geometry["coordinates"][0]]
+        )
+    # GeoJSON point: coordinates are [longitude, latitude]
+    longitude, latitude = geometry["coordinates"][:2]
+    return CircleZone(
+        zone_id=doc.get("_id", doc.get("id", doc["name"])),
+        name=doc["name"],
+        latitude=latitude,
+        longitude=longitude,
+        radius=doc.get("radius", 100)
+    )
+
+
+class PatientZones:
+    __slots__ = ("index", "version", "loaded", "next_refresh")
+
+    def __init__(self, index):
+        self.index = index
+        self.version = None  # ETag (or content hash) of the zones the index was built from
+        self.loaded = False  # False while the patient is still on the default zones
+        self.next_refresh = 0.0
+
+
+class ZoneStore:
+    def __init__(self,
+                 default_zones=(),
+                 margin_m=0.0,
+                 url=SAFE_ZONE_URL,
+                 path=SAFE_ZONE_FILE,
+                 refresh_interval=SAFE_ZONE_REFRESH_INTERVAL,
+                 retry_interval=SAFE_ZONE_RETRY_INTERVAL,
+                 concurrency=SAFE_ZONE_FETCH_CONCURRENCY,
+                 client=http_client):
+        self.margin_m = margin_m
+        self.url = url
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.concurrency = concurrency
+        self.client = client
+        # Zones for patients whose own zones are not loaded (or could not be)
+        self.default_index = self._build_index(zone_from_dict(zone) for zone in default_zones)
+        self.patients: Dict[object, PatientZones] = {}
+        self.version = 0  # Bumped whenever a patient's index is replaced
+        self._task = None
+        self._wakeup = None
+        self.stats_counters = {"fetches": 0, "not_modified": 0, "unchanged": 0, "rebuilds": 0, "errors": 0}
+
+    def _build_index(self, zones):
+        index = GeofenceIndex(margin_m=self.margin_m)
+        for zone in zones:
+            if zone is not None:
+                index.add_zone(zone)
+        return index
+
+    def index_for(self, patient_id) -> GeofenceIndex:
+        """The patient's current index; never waits, and schedules a first load for new patients."""
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            patient = self.patients[patient_id] = PatientZones(self.default_index)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return patient.index
+
+    def has_zones(self, patient_id=None):
+        return self.index_for(patient_id).has_zones(patient_id)
+
+    def zone_name(self, patient_id, zone_id):
+        zone = self.index_for(patient_id).zones.get(zone_id)
+        return zone.name if zone is not None else zone_id
+
+    # GeofenceIndex's lookups, answered from each patient's own index
+
+    def is_within(self, latitude, longitude, patient_id=None):
+        return self.index_for(patient_id).is_within(latitude, longitude)
+
+    def depth(self, latitude, longitude, patient_id=None):
+        return self.index_for(patient_id).depth(latitude, longitude)
+
+    def evaluate(self, latitude, longitude, patient_id=None, thresholds=()):
+        return self.index_for(patient_id).evaluate(latitude, longitude, thresholds=thresholds)
+
+    def depth_batch(self, patient_ids, latitudes, longitudes):
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        depths = np.empty(len(latitudes))
+        zone_ids = np.empty(len(latitudes), dtype=object)
+        by_patient = {}
+        for i, patient_id in enumerate(patient_ids):
+            by_patient.setdefault(patient_id, []).append(i)
+        for patient_id, rows in by_patient.items():
+            rows = np.asarray(rows)
+            depths[rows], zone_ids[rows] = self.index_for(patient_id).depth_batch(
+                np.full(len(rows), None, dtype=object), latitudes[rows], longitudes[rows]
+            )
+        return depths, zone_ids
+
+    def _read_file(self):
+        with open(self.path) as f:
+            return f.read()
+
+    async def _fetch(self, patient_id, version):
+        """
+        The patient's zone documents and their version, or (None, version)
+        if they have not changed since `version`.
+        """
+        if self.path:
+            # Local stand-in; read off the loop so a slow disk cannot stall it
+            text = await asyncio.to_thread(self._read_file)
+            docs = json.loads(text).get(str(patient_id), [])
+            new_version = hashlib.sha1(json.dumps(docs, sort_keys=True).encode()).hexdigest()
+            if new_version == version:
+                self.stats_counters["not_modified"] += 1
+                return None, version
+            return docs, new_version
+
+        headers = {}
+        if version is not None:
+            headers["If-None-Match"] = version
+        if SAFE_ZONE_API_TOKEN:
+            headers["Authorization"] = f"Bearer {SAFE_ZONE_API_TOKEN}"
+        response = await self.client.get(f"{self.url}/{patient_id}", headers=headers)
+        if response.status_code == 304:
+            self.stats_counters["not_modified"] += 1
+            return None, version
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        body = response.json()
+        docs = body.get("data", []) if isinstance(body, dict) else body
+        new_version = response.headers.get("ETag") or hashlib.sha1(response.text.encode()).hexdigest()
+        return docs, new_version
+
+    async def refresh(self, patient_id):
+        """Reload one patient's zones, rebuilding their index only if they changed."""
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            patient = self.patients[patient_id] = PatientZones(self.default_index)
+        self.stats_counters["fetches"] += 1
+        try:
+            docs, version = await self._fetch(patient_id, patient.version)
+        except Exception as e:
+            self.stats_counters["errors"] += 1
+            patient.next_refresh = time.time() + (self.refresh_interval if patient.loaded else self.retry_interval)
+            print(f"[ZoneStore] Could not load safe zones for patient {patient_id}: {type(e).__name__}: {e}")
+            return False
+
+        patient.next_refresh = time.time() + self.refresh_interval
+        if docs is None:
+            return False
+        if version == patient.version:
+            # Same ETag on a full response (e.g. the server ignores If-None-Match)
+            self.stats_counters["unchanged"] += 1
+            return False
+        index = self._build_index(parse_zone(doc) for doc in docs)
+        if len(index):
+            print(f"[ZoneStore] Loaded {len(index)} safe zones for patient {patient_id}")
+        else:
+            # The backend answers [] for patients without zones; an empty index would put them outside everywhere
+            index = self.default_index
+            print(f"[ZoneStore] Patient {patient_id} has no safe zones; using the default zones")
+        patient.index = index
+        patient.version = version
+        self.version += 1
+        patient.loaded = True
+        self.stats_counters["rebuilds"] += 1
+        return True
+
+    async def start(self):
+        # Start the background loader on the running loop; safe to call more than once
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(patient_id):
+            async with semaphore:
+                await self.refresh(patient_id)
+
+        while True:
+            now = time.time()
+            due = [pid for pid, patient in self.patients.items() if patient.next_refresh <= now]
+            if due:
+                await asyncio.gather(*(refresh(pid) for pid in due))
+                continue
+            # Sleep until the next refresh is due or a new patient shows up
+            next_due = min((patient.next_refresh for patient in self.patients.values()), default=None)
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {
+            "patients": len(self.patients),
+            "loaded": sum(1 for patient in self.patients.values() if patient.loaded),
+            **self.stats_counters
+        }
@@ -0,0 +1,390 @@
+# benchmark_geofence.py
+# Measures the cost of one safe-zone check with the grid index against the
+# original linear haversine scan, for many patients with many zones each.
+# With --batch it times locate_batch on backlogs of 10^3 to 10^6 fixes
+# against checking the same fixes one at a time. With --alerts it replays
+# noisy traces of patients near their home zone and counts the outbound alert
+# and call requests with and without the per-patient geofence state. With
+# --skip it replays traces of patients who mostly rest and sometimes walk,
+# and compares the tracker with and without skipping fixes that stayed within
+# the slack of the last checked one. With --polygons it times checks
+# against polygon zones of growing vertex counts.
+#
+#   python benchmark_geofence.py --patients 200 --zones-per-patient 20
+#   python benchmark_geofence.py --batch --sizes 1000 10000 100000 1000000
+#   python benchmark_geofence.py --alerts --trace-minutes 60 --fix-interval 5
+#   python benchmark_geofence.py --skip --patients 200 --trace-minutes 120
+#   python benchmark_geofence.py --polygons --vertices 8 64 512 4096
+import time
+import random
+import argparse
+from math import sin, cos, sqrt, atan2, radians, pi
+
+import numpy as np
+
+from agents.geofence import GeofenceIndex, CircleZone, PolygonZone
+from agents.geofence_state import GeofenceTracker, GEOFENCE_EXIT_MARGIN_M
+
+# Zones are scattered around Los Angeles, like the example safe zones
+CENTER_LAT, CENTER_LON = 34.0522, -118.2437
+SPREAD_DEG = 0.3
+
+# Meters per degree of latitude
+METERS_PER_DEG = 111195.0
+
+
+def linear_is_within_safe_zones(latitude, longitude, zones):
+    """The original is_within_safe_zones: full haversine against every zone."""
+    def calculate_distance(lat1, lon1, lat2, lon2):
+        R = 6371e3
+        lat1_rad = radians(lat1)
+        lon1_rad = radians(lon1)
+        lat2_rad = radians(lat2)
+        lon2_rad = radians(lon2)
+        dlon = lon2_rad - lon1_rad
+        dlat = lat2_rad - lat1_rad
+        a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
+        c = 2 * atan2(sqrt(a), sqrt(1-a))
+        return R * c
+
+    for zone in zones:
+        distance = calculate_distance(latitude, longitude, zone["center"]["latitude"], zone["center"]["longitude"])
+        if distance <= zone["radius"]:
+            return True, zone["name"]
+    return False, None
+
+
+def make_zones(rng, patients, zones_per_patient):
+    zones = []
+    for p in range(patients):
+        for z in range(zones_per_patient):
+            zones.append({
+                "id": f"p{p}-z{z}",
+                "name": f"Zone {z}",
+                "patient_id": f"patient-{p}",
+                "center": {
+                    "latitude": CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                    "longitude": CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+                },
+                "radius": rng.uniform(30, 300)
+            })
+    return zones
+
+
+def make_fixes(rng, zones, patients, count):
+    """Location fixes, half of them placed near one of the patient's own zones."""
+    by_patient = {}
+    for zone in zones:
+        by_patient.setdefault(zone["patient_id"], []).append(zone)
+    fixes = []
+    for _ in range(count):
+        patient_id = f"patient-{rng.randrange(patients)}"
+        if rng.random() < 0.5:
+            zone = rng.choice(by_patient[patient_id])
+            lat = zone["center"]["latitude"] + rng.gauss(0, 0.001)
+            lon = zone["center"]["longitude"] + rng.gauss(0, 0.001)
+        else:
+            lat = CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+            lon = CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        fixes.append((patient_id, lat, lon))
+    return fixes, by_patient
+
+
+def time_per_call(func, fixes):
+    start = time.perf_counter()
+    results = [func(*fix) for fix in fixes]
+    return (time.perf_counter() - start) / len(fixes) * 1e6, results
+
+
+def build_index(zones, cell_size):
+    start = time.perf_counter()
+    index = GeofenceIndex(cell_size)
+    for zone in zones:
+        index.add_zone(CircleZone.from_dict(zone))
+    return index, (time.perf_counter() - start) * 1000
+
+
+def run_batch(args, rng, zones):
+    """Time locate_batch on backlogs of each size against scalar checks of the same fixes."""
+    index, _ = build_index(zones, args.cell_size)
+    # The array form of the index is built on first use; keep that out of the timings
+    index.locate_batch(np.array([zones[0]["patient_id"]], dtype=object), [CENTER_LAT], [CENTER_LON])
+    by_patient = {}
+    for zone in zones:
+        by_patient.setdefault(zone["patient_id"], []).append(zone)
+
+    print(f"{len(zones)} zones for {args.patients} patients; "
+          f"scalar timings use at most the first {args.scalar_limit} fixes of each backlog")
+    print(f"{'fixes':>9} {'linear us/fix':>14} {'index us/fix':>13} {'batch us/fix':>13} {'batch ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        fixes, _ = make_fixes(rng, zones, args.patients, size)
+        patient_ids = np.array([fix[0] for fix in fixes], dtype=object)
+        latitudes = np.array([fix[1] for fix in fixes])
+        longitudes = np.array([fix[2] for fix in fixes])
+
+        sample = fixes[:args.scalar_limit]
+        linear_us, expected = time_per_call(
+            lambda p, lat, lon: linear_is_within_safe_zones(lat, lon, by_patient[p]), sample
+        )
+        index_us, _ = time_per_call(lambda p, lat, lon: index.is_within(lat, lon, p), sample)
+
+        start = time.perf_counter()
+        inside, _ = index.locate_batch(patient_ids, latitudes, longitudes)
+        batch_seconds = time.perf_counter() - start
+        batch_us = batch_seconds / size * 1e6
+
+        mismatches = sum(1 for e, a in zip(expected, inside) if e[0] != a)
+        print(f"{size:>9} {linear_us:>14.2f} {index_us:>13.2f} {batch_us:>13.3f} "
+              f"{batch_seconds * 1000:>10.1f} {linear_us / batch_us:>7.0f}x"
+              + (f"  ({mismatches} mismatches)" if mismatches else ""))
+
+
+def make_trace(rng, args, radius, scenario):
+    """
+    (latitude, longitude, timestamp) fixes for one patient around a zone at the center.
+
+    "leaves": inside for the first sixth of the trace, then standing 30 m beyond the edge.
+    "edge": standing right on the edge for the whole trace.
+    """
+    bearing = rng.uniform(0, 2 * pi)
+    cos_center = cos(radians(CENTER_LAT))
+    count = int(args.trace_minutes * 60 / args.fix_interval)
+    fixes = []
+    for i in range(count):
+        if scenario == "leaves":
+            distance = radius * 0.4 if i < count // 6 else radius + 30
+        else:
+            distance = radius
+        north = distance * cos(bearing) + rng.gauss(0, args.gps_noise)
+        east = distance * sin(bearing) + rng.gauss(0, args.gps_noise)
+        fixes.append((CENTER_LAT + north / METERS_PER_DEG,
+                      CENTER_LON + east / (METERS_PER_DEG * cos_center),
+                      i * args.fix_interval))
+    return fixes
+
+
+def run_alerts(args, rng):
+    """Outbound requests for the same traces, alerting on every outside fix versus on transitions."""
+    radius = 100.0
+    zones = [{"id": "home", "name": "Home", "center": {"latitude": CENTER_LAT, "longitude": CENTER_LON},
+              "radius": radius}]
+    index = GeofenceIndex.from_zones(zones, margin_m=GEOFENCE_EXIT_MARGIN_M)
+
+    print(f"{args.patients} patients per scenario, {args.trace_minutes:.0f} min traces, "
+          f"a fix every {args.fix_interval:.0f} s, GPS noise {args.gps_noise:.0f} m")
+    print(f"{'scenario':>9} {'fixes':>8} {'outside fixes':>14} {'old requests':>13} {'alerts':>7} "
+          f"{'new requests':>13} {'reduction':>10}")
+    for scenario in ("leaves", "edge"):
+        tracker = GeofenceTracker(index)
+        fixes = outside = alerts = 0
+        for p in range(args.patients):
+            for latitude, longitude, timestamp in make_trace(rng, args, radius, scenario):
+                fixes += 1
+                if not index.is_within(latitude, longitude)[0]:
+                    outside += 1
+                transition = tracker.update(f"patient-{p}", latitude, longitude, timestamp)
+                if transition is not None and transition.alert:
+                    alerts += 1
+        # Before: every outside fix sent an alert, which posted a mobile alert and placed a call from
+        # the notification agent, and the location agent placed a second call. Now each alert posts a
+        # mobile alert and the two call requests are coalesced into one.
+        old_requests = 3 * outside
+        new_requests = 2 * alerts
+        reduction = f"{old_requests / new_requests:.0f}x" if new_requests else "-"
+        print(f"{scenario:>9} {fixes:>8} {outside:>14} {old_requests:>13} {alerts:>7} "
+              f"{new_requests:>13} {reduction:>10}")
+
+
+def make_walking_trace(rng, args, zones):
+    """
+    A patient alternating between resting (GPS noise around one spot, often
+    inside one of their zones) and walking at about 1.3 m/s.
+    """
+    cos_center = cos(radians(CENTER_LAT))
+    zone = rng.choice(zones)
+    lat, lon = zone["center"]["latitude"], zone["center"]["longitude"]
+    count = int(args.trace_minutes * 60 / args.fix_interval)
+    fixes = []
+    while len(fixes) < count:
+        if rng.random() < 0.7:
+            for _ in range(int(rng.uniform(5, 30) * 60 / args.fix_interval)):
+                fixes.append((lat + rng.gauss(0, args.gps_noise) / METERS_PER_DEG,
+                              lon + rng.gauss(0, args.gps_noise) / (METERS_PER_DEG * cos_center)))
+        else:
+            heading = rng.uniform(0, 2 * pi)
+            for _ in range(int(rng.uniform(2, 10) * 60 / args.fix_interval)):
+                heading += rng.gauss(0, 0.3)
+                step = 1.3 * args.fix_interval
+                lat += step * cos(heading) / METERS_PER_DEG
+                lon += step * sin(heading) / (METERS_PER_DEG * cos_center)
+                fixes.append((lat, lon))
+            if rng.random() < 0.5:
+                # Rest at one of the patient's zones next
+                zone = rng.choice(zones)
+                lat, lon = zone["center"]["latitude"], zone["center"]["longitude"]
+    return [(lat, lon, i * args.fix_interval) for i, (lat, lon) in enumerate(fixes[:count])]
+
+
+def run_skip(args, rng):
+    """Fixes checked and time per fix, with and without movement-aware skipping."""
+    zones = make_zones(rng, args.patients, args.zones_per_patient)
+    index = GeofenceIndex(args.cell_size, margin_m=GEOFENCE_EXIT_MARGIN_M)
+    by_patient = {}
+    for zone in zones:
+        index.add_zone(CircleZone.from_dict(zone))
+        by_patient.setdefault(zone["patient_id"], []).append(zone)
+    fixes = []
+    for patient_id, patient_zones in by_patient.items():
+        fixes.extend((patient_id, lat, lon, timestamp) for lat, lon, timestamp in
+                     make_walking_trace(rng, args, patient_zones))
+    # Interleave the patients as their fixes would arrive
+    fixes.sort(key=lambda fix: fix[3])
+
+    results = {}
+    for skip in (False, True):
+        tracker = GeofenceTracker(index, skip_unmoved=skip)
+        start = time.perf_counter()
+        transitions = [tracker.update(*fix) for fix in fixes]
+        seconds = time.perf_counter() - start
+        # What each fix led to: the patient's state afterwards and the transition, if any
+        states = [(t.state, t.zone_id, t.alert) if t is not None else None for t in transitions]
+        results[skip] = (seconds / len(fixes) * 1e6, tracker.stats(), states)
+
+    full_us, full_stats, full_states = results[False]
+    skip_us, skip_stats, skip_states = results[True]
+    mismatches = sum(1 for a, b in zip(full_states, skip_states) if a != b)
+    skipped = skip_stats["skipped_evaluations"]
+    print(f"{len(fixes)} fixes from {args.patients} patients over {args.trace_minutes:.0f} min "
+          f"(a fix every {args.fix_interval:.0f} s, GPS noise {args.gps_noise:.0f} m), "
+          f"{len(zones)} zones")
+    print(f"  every fix checked:   {full_us:6.2f} us/fix, {full_stats['evaluations']} zone checks, "
+          f"{full_stats['transitions']} transitions")
+    print(f"  skipping unmoved:    {skip_us:6.2f} us/fix, {skip_stats['evaluations']} zone checks, "
+          f"{skipped} skipped ({skipped / len(fixes):.0%}), {skip_stats['transitions']} transitions")
+    print(f"  states differing from checking every fix: {mismatches}")
+
+
+def make_polygon(rng, lat, lon, radius, vertices):
+    """
+    An irregular but smooth outline, like a property or campus boundary,
+    traced with the given number of vertices.
+    """
+    cos_center = cos(radians(lat))
+    lobes = [(rng.randint(2, 6), rng.uniform(0.05, 0.2), rng.uniform(0, 2 * pi)) for _ in range(3)]
+    points = []
+    for i in range(vertices):
+        angle = 2 * pi * i / vertices
+        distance = radius * (1 + sum(size * sin(count * angle + phase) for count, size, phase in lobes))
+        points.append({"latitude": lat + distance * cos(angle) / METERS_PER_DEG,
+                       "longitude": lon + distance * sin(angle) / (METERS_PER_DEG * cos_center)})
+    return points
+
+
+def linear_contains(zone, lat_rad, lon_rad):
+    """Ray casting against every edge of the polygon, as a plain polygon test would."""
+    x, y = zone.project(lat_rad, lon_rad)
+    xs, ys = zone.xs, zone.ys
+    x2, y2 = np.roll(xs, -1), np.roll(ys, -1)
+    spans = (ys > y) != (y2 > y)
+    crossing = spans & (x < xs + (y - ys) * (x2 - xs) / np.where(spans, y2 - ys, 1.0))
+    return bool(crossing.sum() % 2)
+
+
+def run_polygons(args, rng):
+    """Time per fix against polygon zones as their vertex count grows."""
+    print(f"{args.patients} patients with one polygon zone each (about {args.polygon_radius:.0f} m in radius"
+          f"), {args.fixes} fixes near them; every-edge timings use the first {args.scalar_limit} fixes")
+    print(f"{'vertices':>9} {'build ms':>9} {'every edge us/fix':>18} {'locate us/fix':>14} {'depth us/fix':>13} "
+          f"{'mismatches':>11}")
+    for vertices in args.vertices:
+        centers = [(CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+                   for _ in range(args.patients)]
+        zones = [{"id": f"p{p}", "name": f"Zone {p}", "patient_id": f"patient-{p}",
+                  "polygon": make_polygon(rng, lat, lon, args.polygon_radius, vertices)}
+                 for p, (lat, lon) in enumerate(centers)]
+
+        start = time.perf_counter()
+        index = GeofenceIndex(args.cell_size, margin_m=GEOFENCE_EXIT_MARGIN_M)
+        for zone in zones:
+            index.add_zone(PolygonZone.from_dict(zone))
+        build_ms = (time.perf_counter() - start) * 1000 / len(zones)
+
+        fixes = []
+        for _ in range(args.fixes):
+            p = rng.randrange(args.patients)
+            lat, lon = centers[p]
+            distance = args.polygon_radius * 1.2 * sqrt(rng.random())
+            angle = rng.uniform(0, 2 * pi)
+            fixes.append((f"patient-{p}", lat + distance * cos(angle) / METERS_PER_DEG,
+                          lon + distance * sin(angle) / (METERS_PER_DEG * cos(radians(lat)))))
+
+        by_patient = {zone["patient_id"]: index.zones[zone["id"]] for zone in zones}
+        sample = fixes[:args.scalar_limit]
+        linear_us, expected = time_per_call(
+            lambda p, lat, lon: linear_contains(by_patient[p], radians(lat), radians(lon)), sample
+        )
+        locate_us, actual = time_per_call(lambda p, lat, lon: index.locate(lat, lon, p), fixes)
+        depth_us, _ = time_per_call(lambda p, lat, lon: index.depth(lat, lon, p), fixes)
+        mismatches = sum(1 for e, a in zip(expected, actual) if e != (a is not None))
+        print(f"{vertices:>9} {build_ms:>9.1f} {linear_us:>18.2f} {locate_us:>14.2f} {depth_us:>13.2f} {mismatches:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the safe-zone grid index")
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--zones-per-patient", type=int, default=20)
+    parser.add_argument("--fixes", type=int, default=20000)
+    parser.add_argument("--cell-size", type=float, default=500.0, help="Grid cell size in meters")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--batch", action="store_true", help="Benchmark locate_batch on backlogs of fixes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--scalar-limit", type=int, default=100000,
+                        help="Fixes per backlog timed with the scalar checks")
+    parser.add_argument("--alerts", action="store_true",
+                        help="Count alert and call requests on synthetic traces near a zone's edge")
+    parser.add_argument("--skip", action="store_true",
+                        help="Compare the tracker with and without skipping fixes that barely moved")
+    parser.add_argument("--polygons", action="store_true",
+                        help="Time checks against polygon zones with growing vertex counts")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[8, 32, 128, 512, 2048, 8192])
+    parser.add_argument("--polygon-radius", type=float, default=400.0, help="Rough polygon radius in meters")
+    parser.add_argument("--trace-minutes", type=float, default=60.0)
+    parser.add_argument("--fix-interval", type=float, default=5.0, help="Seconds between fixes")
+    parser.add_argument("--gps-noise", type=float, default=8.0, help="GPS error (standard deviation) in meters")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.alerts:
+        run_alerts(args, rng)
+        return
+    if args.skip:
+        run_skip(args, rng)
+        return
+    if args.polygons:
+        run_polygons(args, rng)
+        return
+    zones = make_zones(rng, args.patients, args.zones_per_patient)
+    if args.batch:
+        run_batch(args, rng, zones)
+        return
+    fixes, by_patient = make_fixes(rng, zones, args.patients, args.fixes)
+    index, build_ms = build_index(zones, args.cell_size)
+
+    all_zones_us, _ = time_per_call(lambda p, lat, lon: linear_is_within_safe_zones(lat, lon, zones), fixes)
+    own_zones_us, expected = time_per_call(
+        lambda p, lat, lon: linear_is_within_safe_zones(lat, lon, by_patient[p]), fixes
+    )
+    index_us, actual = time_per_call(lambda p, lat, lon: index.is_within(lat, lon, p), fixes)
+
+    mismatches = sum(1 for e, a in zip(expected, actual) if e[0] != a[0])
+    print(f"{len(zones)} zones for {args.patients} patients, {len(fixes)} fixes, "
+          f"{index.stats()['cells']} cells of {args.cell_size:.0f} m (built in {build_ms:.1f} ms)")
+    print(f"  linear scan, all zones:      {all_zones_us:8.2f} us/update")
+    print(f"  linear scan, patient zones:  {own_zones_us:8.2f} us/update")
+    print(f"  grid index:                  {index_us:8.2f} us/update "
+          f"({index.distance_checks / index.lookups:.2f} distance checks/update)")
+    print(f"  inside/outside mismatches against the linear scan: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
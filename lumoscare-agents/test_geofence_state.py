@@ -0,0 +1,112 @@
+# test_geofence_state.py
+# Behaviour tests for the per-patient geofence state (agents/geofence_state.py).
+# Run with: python -m pytest test_geofence_state.py
+from agents.geofence import GeofenceIndex
+from agents.geofence_state import GeofenceTracker, INSIDE, OUTSIDE, UNKNOWN
+
+HOME = {"name": "Home", "center": {"latitude": 34.0522, "longitude": -118.2437}, "radius": 100}
+
+# Positions relative to Home (0.001 degrees of latitude is about 111 m)
+CENTER = (34.0522, -118.2437)
+EDGE_BAND = (34.0522 + 0.001, -118.2437)  # About 11 m outside the edge: within the exit margin
+AWAY = (34.0522 + 0.0015, -118.2437)  # About 67 m outside the edge
+
+
+def make_tracker(**kwargs):
+    index = GeofenceIndex.from_zones([HOME], margin_m=25)
+    options = dict(exit_margin_m=25, enter_margin_m=10, exit_dwell_s=30, enter_dwell_s=60, alert_cooldown_s=900)
+    options.update(kwargs)
+    return GeofenceTracker(index, **options)
+
+
+def feed(tracker, position, start, end, step=5, patient_id="Robin"):
+    # Fixes every `step` seconds from start to end inclusive; returns the transitions
+    transitions = []
+    for timestamp in range(start, end + 1, step):
+        transition = tracker.update(patient_id, position[0], position[1], timestamp)
+        if transition is not None:
+            transitions.append(transition)
+    return transitions
+
+
+def settle_inside(tracker):
+    [entered] = feed(tracker, CENTER, 0, 60)
+    assert entered.state == INSIDE and not entered.alert
+    return 60
+
+
+def test_an_exit_is_confirmed_once_after_the_dwell_time():
+    tracker = make_tracker()
+    t = settle_inside(tracker)
+
+    assert feed(tracker, AWAY, t + 5, t + 30) == []
+    [exited] = feed(tracker, AWAY, t + 35, t + 600)
+
+    assert exited.state == OUTSIDE
+    assert exited.previous == INSIDE
+    assert exited.alert
+    assert exited.zone_id == "Home"
+    assert tracker.stats()["alerts"] == 1
+
+
+def test_fixes_in_the_hysteresis_band_keep_the_state():
+    tracker = make_tracker()
+    t = settle_inside(tracker)
+
+    assert feed(tracker, EDGE_BAND, t + 5, t + 600) == []
+    assert tracker.state("Robin") == INSIDE
+
+
+def test_a_brief_excursion_does_not_alert():
+    tracker = make_tracker()
+    t = settle_inside(tracker)
+
+    assert feed(tracker, AWAY, t + 5, t + 20) == []
+    assert feed(tracker, CENTER, t + 25, t + 100) == []
+    assert tracker.state("Robin") == INSIDE
+
+
+def test_a_second_exit_within_the_cooldown_does_not_alert():
+    tracker = make_tracker()
+    t = settle_inside(tracker)
+    [first] = feed(tracker, AWAY, t + 5, t + 40)
+    [back] = feed(tracker, CENTER, t + 45, t + 120)
+    [second] = feed(tracker, AWAY, t + 125, t + 170)
+
+    assert first.alert
+    assert back.state == INSIDE
+    assert second.state == OUTSIDE and not second.alert
+    assert tracker.stats()["suppressed_alerts"] == 1
+
+
+def test_fixes_older_than_the_last_one_are_ignored():
+    tracker = make_tracker()
+    t = settle_inside(tracker)
+    feed(tracker, AWAY, t + 5, t + 20)
+
+    assert tracker.update("Robin", AWAY[0], AWAY[1], t - 100) is None
+    assert tracker.stats()["stale_fixes"] == 1
+
+
+def test_batches_give_the_same_transitions_as_single_fixes():
+    single, batched = make_tracker(), make_tracker()
+    track = [CENTER] * 13 + [AWAY] * 10 + [CENTER] * 20
+    timestamps = [5 * i for i in range(len(track))]
+
+    expected = []
+    for (latitude, longitude), timestamp in zip(track, timestamps):
+        transition = single.update("Robin", latitude, longitude, timestamp)
+        if transition is not None:
+            expected.append((transition.state, transition.timestamp, transition.alert))
+    actual = batched.update_batch("Robin", [p[0] for p in track], [p[1] for p in track], timestamps)
+
+    assert len(expected) == 3
+    assert [(t.state, t.timestamp, t.alert) for t in actual] == expected
+
+
+def test_a_patient_without_zones_is_never_outside():
+    tracker = GeofenceTracker(GeofenceIndex(margin_m=25), exit_dwell_s=0)
+
+    assert feed(tracker, AWAY, 0, 600) == []
+    assert tracker.state("Robin") == UNKNOWN
+    assert tracker.stats()["no_zone_fixes"] == 121
@@ -0,0 +1,160 @@
+# test_http_client.py
+# Shows that a slow healthcare service no longer stalls the other agents.
+#
+# Starts a local stand-in for the healthcare service whose /api/make-call
+# takes SLOW_CALL_SECONDS to answer, while /api/alerts answers at once. The
+# phone call agent's handler queues a call to the slow endpoint while the
+# notification agent's handler queues mobile alerts; the outbox workers
+# deliver both through the shared client, and a heartbeat measures how long
+# the shared event loop is ever blocked. For comparison the same run is
+# repeated with a blocking requests.post standing in for the old code.
+#
+#   python test_http_client.py
+import os
+import time
+import asyncio
+import tempfile
+import threading
+from aiohttp import web
+
+STAND_IN_PORT = 8099
+SLOW_CALL_SECONDS = 2.0
+
+# Point every agent at the stand-in before the agents read their settings
+os.environ["HEALTHCARE_SERVICE_URL"] = f"http://127.0.0.1:{STAND_IN_PORT}"
+os.environ["MOBILE_ALERT_API_URL"] = f"http://127.0.0.1:{STAND_IN_PORT}/api/alerts"
+os.environ["OUTBOX_PATH"] = os.path.join(tempfile.mkdtemp(), "outbox.db")
+
+import requests
+from agents import phone_call_agent as phone_module
+from agents import notification_agent as notification_module
+from agents.http_client import http_client, HttpResponse
+from agents.outbox import outbox
+from agents.protocols import PhoneCallMessage, AlertMessage
+
+# Times at which the stand-in received a mobile alert
+alerts_received = []
+
+
+class StubLogger:
+    def info(self, *args): pass
+    def warning(self, *args): pass
+
+
+class StubContext:
+    # Just enough of uagents' Context for calling the handlers directly
+    logger = StubLogger()
+
+    async def send(self, destination, message):
+        pass
+
+
+async def make_call(request):
+    await asyncio.sleep(SLOW_CALL_SECONDS)
+    return web.json_response({"status": "call placed"})
+
+
+async def alerts(request):
+    alerts_received.append(time.perf_counter())
+    return web.json_response({"status": "alert stored"})
+
+
+def start_stand_in():
+    # The stand-in runs on its own thread and loop, like a separate service would
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/api/make-call", make_call)
+        app.router.add_post("/api/alerts", alerts)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", STAND_IN_PORT).start()
+        started.set()
+
+    def run():
+        loop.run_until_complete(serve())
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+
+
+async def heartbeat(stop, interval=0.02):
+    # Longest time the loop took to come back to this task
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run_scenario(patient_id):
+    ctx = StubContext()
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    scenario_start = time.perf_counter()
+
+    alerts_received.clear()
+
+    # An explicit call request is always placed (only calls about the same alert are coalesced)
+    call = PhoneCallMessage(patient_id=patient_id, phone_number="+10000000000",
+                            message="Emergency: You have left your safe zone!", priority="high")
+    await phone_module.handle_phone_call(ctx, "test", call)
+    await asyncio.sleep(0.1)
+
+    # A medium-priority alert only logs; the mobile alert is what touches the network
+    for _ in range(5):
+        notification_module.send_alert_to_mobile_api(
+            {"patient_id": "Andrew", "type": "medium", "title": "Check-in", "description": "Check-in"}
+        )
+        await notification_module.handle_alert(ctx, "test", AlertMessage(
+            patient_id="Andrew", message="Check-in", priority="medium", timestamp="now"
+        ))
+
+    # Wait until the outbox has delivered everything, including the slow call
+    while outbox.stats()["pending"] or outbox.stats()["in_flight"]:
+        await asyncio.sleep(0.02)
+    stop.set()
+    assert len(alerts_received) == 5, f"stand-in received {len(alerts_received)} of 5 alerts"
+    return max(alerts_received) - scenario_start, await beat
+
+
+async def blocking_post(url, json=None, **kwargs):
+    # The old behaviour: a synchronous requests.post on the event loop
+    response = requests.post(url, json=json, **kwargs)
+    return HttpResponse(response.status_code, response.text)
+
+
+async def main():
+    start_stand_in()
+    await outbox.start()
+    try:
+        pooled_alert, pooled_stall = await run_scenario("Robin")
+
+        original_post = http_client.post
+        http_client.post = blocking_post
+        try:
+            blocking_alert, blocking_stall = await run_scenario("John")
+        finally:
+            http_client.post = original_post
+    finally:
+        await outbox.stop()
+        await http_client.close()
+
+    print("\n=== Results ===")
+    print(f"Slow /api/make-call takes {SLOW_CALL_SECONDS:.1f}s")
+    print(f"Shared async client: mobile alerts delivered after {pooled_alert * 1000:.0f} ms, "
+          f"longest event loop stall {pooled_stall * 1000:.0f} ms")
+    print(f"Blocking requests:   mobile alerts delivered after {blocking_alert * 1000:.0f} ms, "
+          f"longest event loop stall {blocking_stall * 1000:.0f} ms")
+
+    assert pooled_stall < SLOW_CALL_SECONDS / 4, "event loop was blocked by the slow call"
+    assert pooled_alert < SLOW_CALL_SECONDS / 2, "mobile alerts waited for the slow call"
+    print("PASS: other agents keep running while the healthcare service is slow")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,19 @@
 # test_location_agent.py
+import os
+import time
+import random
 import asyncio
+from uuid import uuid4
 from uagents import Agent, Context
-from agents.location_agent import location_agent
-from agents.protocols import location_protocol, LocationUpdateMessage
+from agents.location_agent import location_agent, location_stats
+from agents.location_forwarder import location_forwarder
+from agents.protocols import location_protocol, LocationUpdateMessage, LocationBatchMessage
+
+# Throughput mode: set THROUGHPUT_FIXES to send that many fixes at startup, as
+# single LocationUpdateMessages (THROUGHPUT_BATCH_SIZE=1) or in batches, e.g.
+#   THROUGHPUT_FIXES=2000 THROUGHPUT_BATCH_SIZE=50 python main.py
+THROUGHPUT_FIXES = int(os.getenv("THROUGHPUT_FIXES", "0"))
+THROUGHPUT_BATCH_SIZE = int(os.getenv("THROUGHPUT_BATCH_SIZE", "1"))
 
 # Create a test agent
 test_agent = Agent(
@@ -27,11 +38,65 @@ all_steps_sent = False
 @test_agent.on_event("startup")
 async def on_startup(ctx: Context):
     print("[TestDevice] Agent started")
+    if THROUGHPUT_FIXES > 0:
+        await measure_throughput(ctx, THROUGHPUT_FIXES, THROUGHPUT_BATCH_SIZE)
+
+async def measure_throughput(ctx: Context, fix_count, batch_size):
+    # Fixes jittering around the first step's location (inside the Home zone), taken
+    # one second apart up to now so that later live fixes are not older than them
+    rng = random.Random(42)
+    base = steps[0]
+    now = time.time()
+    fixes = [
+        (base["latitude"] + rng.gauss(0, 0.0002), base["longitude"] + rng.gauss(0, 0.0002),
+         now - (fix_count - 1 - i))
+        for i in range(fix_count)
+    ]
+    # Sequence numbers below start at 0 on every run
+    session = uuid4().hex
+    target = location_stats["fixes"] + fix_count
+    envelopes = 0
+
+    start = time.perf_counter()
+    if batch_size <= 1:
+        for latitude, longitude, timestamp in fixes:
+            await ctx.send(location_agent.address, LocationUpdateMessage(
+                latitude=latitude, longitude=longitude, patient_id=base["patient_id"], timestamp=timestamp
+            ))
+            envelopes += 1
+    else:
+        for first in range(0, fix_count, batch_size):
+            chunk = fixes[first:first + batch_size]
+            await ctx.send(location_agent.address, LocationBatchMessage(
+                patient_id=base["patient_id"],
+                latitudes=[fix[0] for fix in chunk],
+                longitudes=[fix[1] for fix in chunk],
+                timestamps=[fix[2] for fix in chunk],
+                first_sequence=first,
+                session=session
+            ))
+            envelopes += 1
+    sent = time.perf_counter() - start
+
+    # The Bureau runs every agent on this event loop, so wait for the location agent to catch up
+    while location_stats["fixes"] < target:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    print(f"[TestDevice] Throughput: {fix_count} fixes in {envelopes} envelopes (batch size {batch_size})")
+    print(f"[TestDevice]   sent in {sent:.2f}s, processed in {elapsed:.2f}s: "
+          f"{fix_count / elapsed:.0f} fixes/s, {envelopes / elapsed:.0f} envelopes/s")
+    forwarded = location_forwarder.stats()
+    print(f"[TestDevice]   forwarded in {forwarded['flushes']} bulk requests so far "
+          f"(mean {forwarded['mean_flush_size']:.0f} fixes, oldest fix waited up to {forwarded['max_lag'] * 1000:.0f} ms)")
 
 @test_agent.on_interval(period=3.0)  # Send every 3 seconds
 async def send_location_update(ctx: Context):
     global step_index, all_steps_sent
 
+    if THROUGHPUT_FIXES > 0:
+        return
+
     if step_index < len(steps):
         location = steps[step_index]
         print(f"Step {step_index+1}: Sending location {location['latitude']}, {location['longitude']}")
@@ -39,7 +104,8 @@ async def send_location_update(ctx: Context):
         message = LocationUpdateMessage(
             latitude=location["latitude"],
             longitude=location["longitude"],
-            patient_id=location["patient_id"]
+            patient_id=location["patient_id"],
+            timestamp=time.time()
         )
 
         await ctx.send(
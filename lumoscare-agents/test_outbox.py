@@ -0,0 +1,151 @@
+# test_outbox.py
+# Behaviour tests for the durable outbox (agents/outbox.py), against a stand-in HTTP client.
+# Run with: python -m pytest test_outbox.py
+import os
+import asyncio
+import tempfile
+
+from agents.http_client import HttpResponse
+from agents.outbox import Outbox
+
+CALL = {"patientId": "Robin", "phoneNumber": "+10000000000", "message": "Left home", "priority": "high"}
+
+
+class ScriptedClient:
+    # Answers each POST with the next scripted status (or raises it, if it is an exception)
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    async def post(self, url, json=None, headers=None):
+        self.requests.append((url, json, headers))
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return HttpResponse(outcome, "")
+
+
+def make_outbox(client, **kwargs):
+    path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    return Outbox(path=path, client=client, base_delay=0, **kwargs)
+
+
+def drain(outbox):
+    # Deliver every due request, retries included, without the worker tasks
+    async def run():
+        while True:
+            row = outbox._claim()
+            if row is None:
+                return
+            await outbox._deliver(*row)
+    asyncio.run(run())
+
+
+def test_failed_requests_are_retried_with_the_same_idempotency_key():
+    client = ScriptedClient(503, ConnectionError("refused"), 200)
+    outbox = make_outbox(client)
+    key = outbox.enqueue("alert", "http://alerts", {"id": 1})
+
+    drain(outbox)
+
+    assert [headers["Idempotency-Key"] for _, _, headers in client.requests] == [key] * 3
+    stats = outbox.stats()
+    assert stats["delivered"] == 1
+    assert stats["retries"] == 2
+    assert stats["pending"] == 0
+
+
+def test_rejected_requests_are_dead_lettered_at_once():
+    client = ScriptedClient(400)
+    outbox = make_outbox(client)
+    outbox.enqueue("alert", "http://alerts", {"id": 1})
+
+    drain(outbox)
+
+    assert len(client.requests) == 1
+    [dead] = outbox.dead_letters()
+    assert dead["payload"] == {"id": 1}
+    assert dead["last_error"].startswith("HTTP 400")
+
+
+def test_requests_are_dead_lettered_after_max_attempts_and_can_be_requeued():
+    client = ScriptedClient(*([500] * 3))
+    outbox = make_outbox(client, max_attempts=3)
+    outbox.enqueue("alert", "http://alerts", {"id": 1})
+
+    drain(outbox)
+    assert len(client.requests) == 3
+    assert outbox.stats()["dead_letters"] == 1
+
+    assert outbox.requeue_dead() == 1
+    drain(outbox)
+    assert outbox.stats()["dead_letters"] == 0
+    assert outbox.stats()["delivered"] == 1
+
+
+def test_enqueueing_a_queued_key_again_is_a_no_op():
+    outbox = make_outbox(ScriptedClient())
+    outbox.enqueue("alert", "http://alerts", {"id": 1}, idempotency_key="alert-1")
+    outbox.enqueue("alert", "http://alerts", {"id": 1}, idempotency_key="alert-1")
+
+    assert outbox.stats()["pending"] == 1
+    assert outbox.stats()["duplicates"] == 1
+
+
+def test_calls_about_the_same_alert_are_coalesced():
+    outbox = make_outbox(ScriptedClient())
+    first = outbox.enqueue_call("http://calls", CALL, alert_type="location", alert_message="Left home")
+    second = outbox.enqueue_call("http://calls", CALL, alert_type="location", alert_message="Left home")
+    other = outbox.enqueue_call("http://calls", CALL, alert_type="location", alert_message="Left the park")
+
+    assert first == second
+    assert other != first
+    assert outbox.stats()["pending"] == 2
+
+
+def test_explicit_calls_are_never_coalesced():
+    outbox = make_outbox(ScriptedClient())
+    outbox.enqueue_call("http://calls", CALL)
+    outbox.enqueue_call("http://calls", CALL)
+
+    assert outbox.stats()["pending"] == 2
+
+
+def test_a_dead_lettered_call_releases_its_alert():
+    outbox = make_outbox(ScriptedClient(400))
+    first = outbox.enqueue_call("http://calls", CALL, alert_type="location", alert_message="Left home")
+    drain(outbox)
+
+    again = outbox.enqueue_call("http://calls", CALL, alert_type="location", alert_message="Left home")
+    assert again != first
+    assert outbox.stats()["pending"] == 1
+
+
+def test_a_new_outbox_leaves_other_processes_deliveries_alone():
+    path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    first = Outbox(path=path, client=ScriptedClient(), lease_seconds=60)
+    first.enqueue("alert", "http://alerts", {"id": 1})
+    assert first._claim() is not None
+
+    second = Outbox(path=path, client=ScriptedClient(), lease_seconds=60)
+    assert second.stats()["in_flight"] == 1
+    assert second._claim() is None
+
+
+def test_an_expired_lease_is_taken_over():
+    path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    crashed = Outbox(path=path, client=ScriptedClient(), lease_seconds=0)
+    crashed.enqueue("alert", "http://alerts", {"id": 1})
+    assert crashed._claim() is not None
+
+    survivor = Outbox(path=path, client=ScriptedClient(), lease_seconds=60)
+    assert survivor._claim() is not None
+
+
+def test_the_database_is_created_on_first_use():
+    path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    outbox = Outbox(path=path, client=ScriptedClient())
+    assert not os.path.exists(path)
+
+    outbox.stats()
+    assert os.path.exists(path)
@@ -0,0 +1,112 @@
+# test_zone_store.py
+# Behaviour tests for per-patient safe zones (agents/zone_store.py), against a stand-in backend.
+# Run with: python -m pytest test_zone_store.py
+import os
+import json
+import time
+import asyncio
+import tempfile
+
+from agents.http_client import HttpResponse
+from agents.zone_store import ZoneStore
+
+HOME = {"name": "Home", "center": {"latitude": 34.0522, "longitude": -118.2437}, "radius": 100}
+
+# A backend SafeZone document: a GeoJSON point around a park north of Home
+PARK = {"_id": "park-1", "name": "Park", "coordinates": {"type": "Point", "coordinates": [-118.2437, 34.0700]},
+        "radius": 200, "isActive": True}
+PARK_CENTER = (34.0700, -118.2437)
+
+
+class StandInBackend:
+    # Answers GET /api/safe-zones/patient/:id from a dict, with ETags and 304s like the backend
+    def __init__(self, zones):
+        self.zones = zones
+        self.requests = []
+        self.fail = False
+
+    async def get(self, url, headers=None):
+        self.requests.append((url, dict(headers or {})))
+        if self.fail:
+            raise ConnectionError("backend down")
+        patient_id = url.rsplit("/", 1)[1]
+        body = json.dumps({"success": True, "data": self.zones.get(patient_id, [])})
+        etag = f'"{hash(body)}"'
+        if (headers or {}).get("If-None-Match") == etag:
+            return HttpResponse(304, "")
+        return HttpResponse(200, body, {"ETag": etag})
+
+
+def make_store(backend, **kwargs):
+    return ZoneStore(default_zones=[HOME], margin_m=25, url="http://backend/api/safe-zones/patient",
+                     path=None, client=backend, **kwargs)
+
+
+def test_new_patients_use_the_default_zones_until_theirs_load():
+    backend = StandInBackend({"Robin": [PARK]})
+    store = make_store(backend)
+
+    assert store.is_within(*PARK_CENTER, patient_id="Robin") == (False, None)
+    assert asyncio.run(store.refresh("Robin"))
+
+    assert store.is_within(*PARK_CENTER, patient_id="Robin") == (True, "Park")
+    assert store.zone_name("Robin", "park-1") == "Park"
+    assert store.stats()["loaded"] == 1
+
+
+def test_unchanged_zones_cost_a_304_and_no_rebuild():
+    backend = StandInBackend({"Robin": [PARK]})
+    store = make_store(backend)
+    asyncio.run(store.refresh("Robin"))
+    version = store.version
+
+    assert not asyncio.run(store.refresh("Robin"))
+    assert backend.requests[-1][1]["If-None-Match"]
+    assert store.version == version
+    assert store.stats()["not_modified"] == 1
+    assert store.stats()["rebuilds"] == 1
+
+
+def test_changed_zones_replace_the_index():
+    backend = StandInBackend({"Robin": [PARK]})
+    store = make_store(backend)
+    asyncio.run(store.refresh("Robin"))
+
+    backend.zones["Robin"] = [{**PARK, "isActive": False}, {**PARK, "_id": "park-2", "name": "Big park",
+                                                            "radius": 300}]
+    assert asyncio.run(store.refresh("Robin"))
+    assert store.zone_name("Robin", "park-2") == "Big park"
+    assert "park-1" not in store.index_for("Robin").zones
+
+
+def test_a_patient_without_zones_keeps_the_default_zones():
+    backend = StandInBackend({})
+    store = make_store(backend)
+    asyncio.run(store.refresh("Robin"))
+
+    assert store.has_zones("Robin")
+    assert store.is_within(34.0522, -118.2437, patient_id="Robin") == (True, "Home")
+
+
+def test_a_failed_load_keeps_the_default_zones_and_retries_sooner():
+    backend = StandInBackend({"Robin": [PARK]})
+    backend.fail = True
+    store = make_store(backend, refresh_interval=60, retry_interval=10)
+
+    assert not asyncio.run(store.refresh("Robin"))
+    assert store.stats()["errors"] == 1
+    assert store.stats()["loaded"] == 0
+    assert store.is_within(34.0522, -118.2437, patient_id="Robin") == (True, "Home")
+    assert store.patients["Robin"].next_refresh - time.time() <= 10
+
+
+def test_zones_can_come_from_a_local_file():
+    path = os.path.join(tempfile.mkdtemp(), "zones.json")
+    with open(path, "w") as f:
+        json.dump({"Robin": [PARK]}, f)
+    store = ZoneStore(default_zones=[HOME], margin_m=25, path=path)
+
+    assert asyncio.run(store.refresh("Robin"))
+    assert store.is_within(*PARK_CENTER, patient_id="Robin") == (True, "Park")
+    # Reading the same file again changes nothing
+    assert not asyncio.run(store.refresh("Robin"))
@@ -69,23 +69,15 @@ const safeZones = [
   }
 ];
 
-// Add this before starting the DAIN service
-app.post('/api/location-update', (req, res) => {
-  const { patientId, latitude, longitude } = req.body;
-  
-  // Store the latest location
+// Store a patient's latest fix and check it against the safe zones
+const recordLocationUpdate = (patientId: string, latitude: number, longitude: number, timestamp?: number) => {
+  // Store the latest location (device time if the agent sent one)
   patientLocations.set(patientId, {
     latitude,
     longitude,
-    timestamp: new Date().toISOString()
+    timestamp: (timestamp !== undefined ? new Date(timestamp * 1000) : new Date()).toISOString()
   });
-  
-  console.log(`\n📱 Received location update from location agent:`);
-  console.log(`   Patient ID: ${patientId}`);
-  console.log(`   Location: (${latitude}, ${longitude})`);
-  console.log(`   Raw request body:`, req.body);
-  console.log(`   Safe zones:`, safeZones);
-  
+
   // Process the location data using your existing handler
   checkLocationStatusConfig.handler(
     { patientId, latitude, longitude, safeZones },
@@ -121,13 +113,52 @@ app.post('/api/location-update', (req, res) => {
   }).catch(error => {
     console.error(`\n❌ Error processing location update:`, error);
   });
+};
+
+// Add this before starting the DAIN service
+app.post('/api/location-update', (req, res) => {
+  const { patientId, latitude, longitude } = req.body;
+  
+  console.log(`\n📱 Received location update from location agent:`);
+  console.log(`   Patient ID: ${patientId}`);
+  console.log(`   Location: (${latitude}, ${longitude})`);
+  console.log(`   Raw request body:`, req.body);
+  console.log(`   Safe zones:`, safeZones);
+  
+  recordLocationUpdate(patientId, latitude, longitude);
   
   res.status(200).json({ status: "received" });
 });
 
+// Buffered fixes from the location agent's forwarder:
+// { updates: [{ patientId, locations: [{ latitude, longitude, timestamp }] }] }
+app.post('/api/location-update/bulk', (req, res) => {
+  const updates = req.body?.updates;
+  if (!Array.isArray(updates)) {
+    res.status(400).json({ error: "Expected an updates array" });
+    return;
+  }
+
+  let received = 0;
+  for (const update of updates) {
+    const locations = Array.isArray(update?.locations) ? update.locations : [];
+    if (!update?.patientId || !locations.length) {
+      continue;
+    }
+    received += locations.length;
+    // Fixes arrive oldest first; only the newest one is current
+    const latest = locations[locations.length - 1];
+    recordLocationUpdate(update.patientId, latest.latitude, latest.longitude, latest.timestamp);
+  }
+
+  console.log(`\n📱 Received ${received} location updates for ${updates.length} patients from location agent`);
+  res.status(200).json({ status: "received", received });
+});
+
 // Start Express server alongside DAIN service
 const expressServer = app.listen(expressPort, () => {
   console.log(`Location update API endpoint available at http://localhost:${expressPort}/api/location-update`);
+  console.log(`Bulk location update API endpoint available at http://localhost:${expressPort}/api/location-update/bulk`);
 });
 
 // Helper function to get health status emoji